@@ -15,6 +15,7 @@ import os
 import signal
 import sys
 import time
+from datetime import datetime
 
 from flask import Flask
 
@@ -43,9 +44,7 @@ logger.addHandler(ch)
 TABLE_ROW_TEMPLATE = "%-33s%-30s%s"
 NEVER_CONNECTED_ACTION  = "Never Connected"
 
-# The dict where the device connection state is stored deviceId -> status payload message
-# No locking necessary 
-deviceConnStateMap = {}
+# The connection state of every device is maintained by the client's ConnectionStateTracker
 
 def usage():
     print(
@@ -71,25 +70,6 @@ def statusCallback(status):
         summaryText = "%s %s" % (status.action, status.clientAddr)
     
     logger.debug(TABLE_ROW_TEMPLATE % (status.time.isoformat(), status.device, summaryText))
-    if status.closeCode == 288 and not status.retained:
-        # "Action":"Disconnect", "CloseCode":288,"Reason":"The client ID was reused."
-        # These status messages are ignored because it is possible this application
-        # will receive the disconnect status message after the connect status message,
-        # which would led to the wrong status in the map.
-        # (Both a connect and disconnect happen when a client ID is reused)
-        # BUT if the message is retained, it reflects the true client state (edge case),
-        # and we don't ignore the message.
-        logger.debug("Ignoring client ID reused")
-        return
-    
-    if status.clientId in deviceConnStateMap:
-        if deviceConnStateMap[status.clientId].time > status.time:
-            # With scalable applications (A;...) it is possible that an older status message
-            # arrives after a newer one.
-            logger.debug("Ignoring older status message; %s <= %s" % (deviceConnStateMap[status.clientId].time, status.time))
-            return
-
-    deviceConnStateMap[status.clientId] = status
             
 
 def interruptHandler(signal, frame):
@@ -101,12 +81,23 @@ def interruptHandler(signal, frame):
 #####################################################################################
 app = Flask(__name__)
 
+@app.route('/', methods=['GET'])
+def getSummary():
+    tracker = client.connectionState
+    return json.dumps({"Devices": len(tracker), "Connected": tracker.onlineCount, "Disconnected": tracker.offlineCount})
+
 @app.route('/<type>/<id>', methods=['GET'])
 def getDeviceStatus(type, id):
     clientId = "d:%s:%s:%s" % (client.organization, type, id)
-    if clientId in deviceConnStateMap:
-        status = deviceConnStateMap[clientId]
-        return json.dumps(status.payload)
+    state = client.connectionState.get(type, id)
+    if state is not None:
+        return json.dumps({
+            "ClientID": clientId, 
+            "Action": "Connect" if state.connected else "Disconnect", 
+            "Time": datetime.utcfromtimestamp(state.lastChange).isoformat() + "Z",
+            "ClientAddr": state.clientAddr,
+            "CloseCode": state.closeCode
+        })
     else:
         neverConnectedStatus = {"ClientID": clientId, "Action": NEVER_CONNECTED_ACTION}
         return json.dumps(neverConnectedStatus)
@@ -163,7 +154,7 @@ if __name__ == "__main__":
         signal.signal(signal.SIGINT, interruptHandler)
         client.connect()
         client.deviceStatusCallback = statusCallback
-        client.subscribeToDeviceStatus()
+        client.trackConnectionState()
     except ibmiotf.ConfigurationException as e:
         print(str(e))
         sys.exit()
@@ -19,6 +19,8 @@ import logging
 try:
 	import ibmiotf
 	import ibmiotf.application
+	from ibmiotf.api.registry.export import Exporter
+	from ibmiotf.api.registry.importer import Importer
 except ImportError:
 	# This part is only required to run the sample from within the samples
 	# directory when the module itself is not installed.
@@ -30,101 +32,33 @@ except ImportError:
 	if cmd_subfolder not in sys.path:
 		sys.path.insert(0, cmd_subfolder)
 	import ibmiotf.application
+	from ibmiotf.api.registry.export import Exporter
+	from ibmiotf.api.registry.importer import Importer
 
 
-def exportTypes(destination):
-	print("Exporting Device Types ...")
-	_exportPageOfTypes(None, destination)
-
-def _exportPageOfTypes(bookmark, destination):
-	global client, cliArgs
-	
-	# Only export 10 devices types at a time (to better demonstrate paging, there is no real need for such a low limit)
-	limit = 10
+def export(directory, compress):
+	global client
 	
-	typeList = client.api.getDeviceTypes(parameters = {"_limit": limit, "_bookmark": bookmark})
-	resultArray = typeList['results']
-	with open(destination, "a") as out_file:
-		for deviceType in resultArray:
-			if "metadata" not in deviceType:
-				deviceType["metadata"] = {}
-			if "description" not in deviceType:
-				deviceType["description"] = None
-			if "classId" not in deviceType:
-				deviceType["classId"] = "Device"
-			
-			export = {
-				"id": deviceType["id"], 
-				"classId": deviceType["classId"], 
-				"description": deviceType["description"], 
-				"deviceInfo": deviceType["deviceInfo"], 
-				"metadata": deviceType["metadata"]
-			}
-			out_file.write(json.dumps(export) + "\n")
-		
-	# Next page
-	if "bookmark" in typeList and len(resultArray) > 0:
-		bookmark = typeList["bookmark"]
-		_exportPageOfTypes(bookmark, destination)
+	print("Exporting Device Types and Devices ...")
+	# Device types are exported concurrently and progress is checkpointed, so if the export 
+	# is interrupted running it again continues where it stopped
+	exporter = Exporter(client.api.newApiClient, directory, compress=compress)
+	summary = exporter.run()
+	print("Exported %s device types and %s devices" % (summary["types"], summary["devices"]))
 
 
-def exportDevices(destination):
-	print("Exporting Devices ...")
-	_exportPageOfDevices(None, destination)
-
-def _exportPageOfDevices(bookmark, destination):
-	global client, cliArgs
-	
-	# Only export 10 devices at a time (to better demonstrate paging, there is no real need for such a low limit)
-	limit = 10
+def importAll(directory):
+	global client
 	
-	deviceList = client.api.getDevices(parameters = {"_limit": limit, "_bookmark": bookmark, "_sort": "typeId,deviceId"})
-	resultArray = deviceList['results']
-	with open(destination, "a") as out_file:
-		for device in resultArray:
-			if "metadata" not in device:
-				device["metadata"] = {}
-			
-			export = {
-				"typeId": device["typeId"], 
-				"deviceId": device["deviceId"], 
-				"deviceInfo": device["deviceInfo"], 
-				"metadata": device["metadata"]
-			}
-			out_file.write(json.dumps(export) + "\n")
-		
-	# Next page
-	if "bookmark" in deviceList:
-		bookmark = deviceList["bookmark"]
-		_exportPageOfDevices(bookmark, destination)
+	print("Importing Device Types and Devices ...")
+	# The files are streamed and devices are registered in parallel bulk requests.  The outcome 
+	# for each device, including its generated auth token, is recorded in import-results.txt
+	importer = Importer(client.api.newApiClient, directory)
+	summary = importer.run()
+	print("Device types: %s created, %s already existed, %s failed" % (summary["types"]["created"], summary["types"]["existing"], summary["types"]["failed"]))
+	print("Devices: %s registered, %s failed, %s already processed" % (summary["devices"]["registered"], summary["devices"]["failed"], summary["devices"]["skipped"]))
 
 
-def importTypes(source):
-	# There is no bulk type registration in the API (yet)
-	with open(source, "r") as in_file:
-		for line in in_file:
-			data = json.loads(line)
-			try:
-				result = client.api.addDeviceType(typeId=data["id"], description = data["description"], deviceInfo = data["deviceInfo"], metadata = data["metadata"], classId=data["classId"])
-			except ibmiotf.APIException as e:
-				print(e)
-				print(e.response)
-				sys.exit(1)
-	
-def importDevices(source):
-	deviceArray = []
-	with open(source, "r") as in_file:
-		for line in in_file:
-			data = json.loads(line)
-			deviceArray.append(data)
-	print(deviceArray)
-	try:
-		result = client.api.registerDevices(deviceArray)
-	except ibmiotf.APIException as e:
-		print(e)
-		print(e.response)
-		sys.exit(1)
-	
 if __name__ == "__main__":
 
 	# Initialize the properties we need
@@ -132,6 +66,7 @@ if __name__ == "__main__":
 	parser.add_argument('-c', '--config', required=True)
 	parser.add_argument('-m', '--mode', required=True)
 	parser.add_argument('-d', '--directory', required=True)
+	parser.add_argument('-z', '--gzip', action='store_true', help='Compress the exported files')
 
 	args, unknown = parser.parse_known_args()
 
@@ -142,21 +77,11 @@ if __name__ == "__main__":
 		client.logger.setLevel(logging.DEBUG)
 		# Note that we do not need to call connect to make API calls
 		
-		devicesFilePath = args.directory + "/devices.txt"
-		typesFilePath = args.directory + "/types.txt"
-		
 		if args.mode == "import":
-			importTypes(typesFilePath)
-			importDevices(devicesFilePath)
+			importAll(args.directory)
 			
 		elif args.mode == "export":
-			if os.path.isfile(typesFilePath):
-				os.remove(typesFilePath)
-			exportTypes(typesFilePath)
-			
-			if os.path.isfile(devicesFilePath):
-				os.remove(devicesFilePath)
-			exportDevices(devicesFilePath)
+			export(args.directory, args.gzip)
 			
 	except ibmiotf.ConfigurationException as e:
 		print(str(e))
@@ -21,8 +21,6 @@ import signal
 import subprocess
 import os
 import threading
-import urllib2
-import hashlib
 
 from uuid import getnode as get_mac
 from ibmiotf.device import ManagedClient
@@ -102,56 +100,6 @@ def deviceActionCallback(reqId,action):
         client.respondDeviceAction(reqId,ManagedClient.RESPONSECODE_ACCEPTED,"Factory Reset Sucess")
         print("do you factory reset work here")
 
-def md5(fname):
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
-
-def verifiyImage(client,info,filename):
-    if info.verifier != None :
-        hashVal = md5(filename)
-        if hashVal != info.verifier :
-            client.setUpdateStatus(ManagedClient.UPDATESTATE_VERIFICATION_FAILED)
-                   
-def downloadHandler(client,info):
-    try:         
-        client.setState(ManagedClient.UPDATESTATE_DOWNLOADING)
-        url = info.url
-        file_name = url.split('/')[-1]
-        u = urllib2.urlopen(url)
-        f = open(file_name, 'wb')
-        meta = u.info()
-        file_size = int(meta.getheaders("Content-Length")[0])
-        print("Downloading: %s Bytes: %s" % (file_name, file_size))
-        
-        file_size_dl = 0
-        block_sz = 8192
-        while True:
-            buffer = u.read(block_sz)
-            if not buffer:
-                break
-        
-            file_size_dl += len(buffer)
-            f.write(buffer)
-            status = r"%10d  [%3.2f%%]" % (file_size_dl, file_size_dl * 100. / file_size)
-            status = status + chr(8)*(len(status)+1)
-            print(status, end=' ')
-        
-        f.close()
-        client.setState(ManagedClient.UPDATESTATE_DOWNLOADED)
-        #Optional verification
-        #verifiyImage(client, info, file_name)
-    except urllib2.HTTPError:
-        client.setUpdateStatus(ManagedClient.UPDATESTATE_CONNECTION_LOST)
-    except urllib2.URLError:
-        client.setUpdateStatus(ManagedClient.UPDATESTATE_INVALID_URI)
-    except MemoryError:
-        client.setUpdateStatus(ManagedClient.UPDATESTATE_OUT_OF_MEMORY)
-    except Exception :
-        print("exception in downloading")
-    
 def updateHandler(client,info):
     try:
         client.setUpdateStatus(ManagedClient.UPDATESTATE_IN_PROGRESS)
@@ -162,8 +110,7 @@ def updateHandler(client,info):
         client.setUpdateStatus(ManagedClient.UPDATESTATE_UNSUPPORTED_IMAGE)
         
 def firmwereCallback(action,info):
-    if action is 'download' :
-        threading.Thread(target= downloadHandler,args=(client,info)).start();
+    # Downloads are handled by the client, see enableFirmwareDownload(), info.path is the downloaded image
     if action is 'update' :
         threading.Thread(target= updateHandler,args=(client,info)).start();
     
@@ -252,6 +199,8 @@ if __name__ == "__main__":
         client.commandCallback = commandProcessor
         client.deviceActionCallback = deviceActionCallback
         client.firmwereActionCallback = firmwereCallback
+        # Stream firmware images to the current directory, resuming interrupted downloads and verifying them
+        client.enableFirmwareDownload(".")
         client.connect()
         client.manage(3600, True, True)
     except ibmiotf.ConfigurationException as e:
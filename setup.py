@@ -61,7 +61,8 @@ setup(
         "pytz >= 2017.3",
         "paho-mqtt >= 1.3.1",
         "requests >= 2.18.4",
-        "requests_toolbelt >= 0.8.0"
+        "requests_toolbelt >= 0.8.0",
+        "futures >= 3.2.0; python_version < '3.0'"
     ],
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -1,6 +1,9 @@
 import requests
 import logging
 import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
 from ibmiotf import ConfigurationException
@@ -40,19 +43,25 @@ class ApiClient():
         if not self.verify:
             from requests.packages.urllib3.exceptions import InsecureRequestWarning
             requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+        
+        # Share a pool of keep-alive connections between all requests (and threads) 
+        # made by this client, rather than paying for a new TLS handshake on every call
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.__options.get("http-pool-size", 20))
+        self.session.mount("https://", adapter)
     
-    def get(self, url, parameters=None):
-        resp = requests.get("https://%s/%s" % (self.host, url), auth = self.credentials, params = parameters, verify=self.verify)
+    def get(self, url, parameters=None, headers=None, timeout=None):
+        resp = self.session.get("https://%s/%s" % (self.host, url), auth = self.credentials, params = parameters, headers = headers, verify=self.verify, timeout=timeout)
         resp.encoding="utf-8"
         return resp
 
     def delete(self, url):
-        resp = requests.delete("https://%s/%s" % (self.host, url), auth = self.credentials, verify=self.verify)
+        resp = self.session.delete("https://%s/%s" % (self.host, url), auth = self.credentials, verify=self.verify)
         resp.encoding="utf-8"
         return resp
 
     def post(self, url, data):
-        resp = requests.post(
+        resp = self.session.post(
             "https://%s/%s" % (self.host, url), 
             auth = self.credentials, 
             data = json.dumps(data, cls=DateTimeEncoder), 
@@ -63,7 +72,7 @@ class ApiClient():
         return resp
 
     def put(self, url, data):
-        resp = requests.put(
+        resp = self.session.put(
             "https://%s/%s" % (self.host, url), 
             auth = self.credentials, 
             data = json.dumps(data, cls=DateTimeEncoder), 
@@ -130,42 +139,226 @@ class ApiException(Exception):
     def __repr__(self):
         return self.response.__repr__()
 
+# Status codes that indicate a transient failure worth retrying
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def callWithRetry(call, retries=3, backoff=0.5):
+    """
+    Make an API call, retrying with exponential backoff when the connection fails or the 
+    response has one of the `RETRYABLE_STATUS_CODES`
+    
+    # Parameters
+    call (function): Makes the request and returns a `requests.Response`
+    retries (int): Number of times to retry
+    backoff (float): Seconds to wait before the first retry, doubled for each further attempt
+    
+    # Returns
+    requests.Response: The response to the last attempt
+    """
+    attempt = 0
+    while True:
+        try:
+            r = call()
+            if r.status_code not in RETRYABLE_STATUS_CODES or attempt >= retries:
+                return r
+        except requests.exceptions.ConnectionError:
+            if attempt >= retries:
+                raise
+        time.sleep(backoff * (2 ** attempt))
+        attempt += 1
+
+
+def chunkBySize(items, maxBytes, maxItems=None, payload=None):
+    """
+    Group items into lists whose JSON encoding (as sent by #ApiClient.post) fits within `maxBytes`.
+    The input is consumed lazily, so it can be a generator of any length.  An item that is 
+    larger than `maxBytes` on its own is returned in a chunk by itself.
+    
+    # Parameters
+    items (iterable): Objects to group
+    maxBytes (int): Maximum size of the JSON encoded list
+    maxItems (int): Maximum number of items per chunk, optional
+    payload (function): Returns the part of an item that will be sent, when items carry 
+        additional data such as a line number.  Optional, by default the whole item is measured
+    """
+    chunk = []
+    # Size of "[]"
+    chunkBytes = 2
+    for item in items:
+        itemBytes = len(json.dumps(item if payload is None else payload(item), cls=DateTimeEncoder).encode("utf-8"))
+        # Size of the ", " separator between items
+        separatorBytes = 2 if len(chunk) > 0 else 0
+        if len(chunk) > 0 and (chunkBytes + separatorBytes + itemBytes > maxBytes or (maxItems is not None and len(chunk) >= maxItems)):
+            yield chunk
+            chunk = []
+            chunkBytes = 2
+            separatorBytes = 0
+        chunk.append(item)
+        chunkBytes += separatorBytes + itemBytes
+    if len(chunk) > 0:
+        yield chunk
+
+
+def concurrentMap(function, items, concurrency=8, ordered=True):
+    """
+    Apply a function to each item on a pool of threads, yielding the results as a stream.  
+    The input is consumed lazily and no more than `2 * concurrency` items are in flight at 
+    once, so memory use does not depend on the number of items.  An exception raised by 
+    the function is raised to the caller when its result is reached.
+    
+    # Parameters
+    function (function): Called as `function(item)`
+    items (iterable): Input items
+    concurrency (int): Number of threads
+    ordered (boolean): Yield results in input order, rather than as they complete
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    maxInFlight = 2 * max(1, concurrency)
+    pending = deque()
+    iterator = iter(items)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < maxInFlight:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append(executor.submit(function, item))
+            
+            if len(pending) == 0:
+                return
+            
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, notDone = wait(pending, return_when=FIRST_COMPLETED)
+                pending = deque(future for future in pending if future not in done)
+                for future in done:
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+# Background page requests for all IterableList instances are made from this shared pool
+_prefetchExecutor = ThreadPoolExecutor(max_workers=8)
+
+
 class IterableList(object):
-    def __init__(self, apiClient, castToClass, url, sort=None):
+    """
+    Iterates through a paged API collection, following the bookmark returned 
+    with each page.  While the caller consumes page N the request for page N+1 is 
+    already in flight, so a large listing is limited by bandwidth rather than by 
+    round trips.
+    
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to make the requests
+    castToClass (class): Each result is wrapped in this class as `castToClass(apiClient, data)`
+    url (string): The collection to page through
+    sort (string): Value for the `_sort` parameter, optional
+    pageSize (int): Number of results requested per page, up to `MAX_PAGE_SIZE`.  Defaults to `50`
+    prefetch (boolean): Request the next page in the background.  Defaults to `True`
+    
+    # Iteration modes
+    Iterating the object itself returns wrapped objects, `pages()` yields each page 
+    as a list of raw dictionaries and `raw()` yields the raw dictionaries one at a 
+    time.  All three share the same cursor.
+    
+    ```python
+    for page in iter(registry.devices).pages():
+        print(len(page))
+    ```
+    """
+    
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 100
+    
+    def __init__(self, apiClient, castToClass, url, sort=None, pageSize=None, prefetch=True):
         self._apiClient = apiClient
         self._castToClass = castToClass
         self._url = url
         self._sort = sort
         
         # For paging through the API
-        self._limit = 50
+        if pageSize is None:
+            self._limit = self.DEFAULT_PAGE_SIZE
+        else:
+            self._limit = max(1, min(int(pageSize), self.MAX_PAGE_SIZE))
+        self._prefetch = prefetch
         self._bookmark = None
-        self._listBuffer = []
+        self._listBuffer = deque()
         self._noMoreResults = False
+        self._pendingPage = None
         
     def __iter__(self):
         return self
     
     # Python 2.x
     def next(self):
-        if len(self._listBuffer) == 0 and not self._noMoreResults:
-            # We need to make an api call
-            apiResponse = self._makeApiCall(parameters = {"_limit": self._limit, "_bookmark": self._bookmark, "_sort": self._sort})
-            self._listBuffer = apiResponse["results"]
-            
-            if "bookmark" in apiResponse:
-                self._bookmark = apiResponse["bookmark"]
-            else:
-                self._noMoreResults = True
+        while len(self._listBuffer) == 0:
+            page = self._nextPage()
+            if page is None:
+                raise StopIteration
+            self._listBuffer.extend(page)
         
-        if len(self._listBuffer) > 0:
-            return self._castToClass(self._apiClient, self._listBuffer.pop(0))
-        else:
-            raise StopIteration
+        return self._castToClass(self._apiClient, self._listBuffer.popleft())
     
     # Python 3.x
     def __next__(self):
         return self.next()
+    
+    def pages(self):
+        """
+        Yield each page of results as a list of raw dictionaries
+        """
+        if len(self._listBuffer) > 0:
+            page = list(self._listBuffer)
+            self._listBuffer.clear()
+            yield page
+        
+        while True:
+            page = self._nextPage()
+            if page is None:
+                return
+            if len(page) > 0:
+                yield page
+    
+    def raw(self):
+        """
+        Yield each result as a raw dictionary, without wrapping it in `castToClass`
+        """
+        for page in self.pages():
+            for item in page:
+                yield item
+    
+    def _nextPage(self):
+        """
+        Returns the next page of raw results, or `None` once there are no more results
+        """
+        if self._pendingPage is not None:
+            apiResponse = self._pendingPage.result()
+            self._pendingPage = None
+        elif self._noMoreResults:
+            return None
+        else:
+            apiResponse = self._makeApiCall(parameters = self._pageParameters())
+        
+        page = apiResponse["results"]
+        if "bookmark" in apiResponse and len(page) > 0:
+            self._bookmark = apiResponse["bookmark"]
+            if self._prefetch:
+                self._pendingPage = _prefetchExecutor.submit(self._makeApiCall, self._pageParameters())
+        else:
+            self._noMoreResults = True
+        
+        return page
+    
+    def _pageParameters(self):
+        return {"_limit": self._limit, "_bookmark": self._bookmark, "_sort": self._sort}
         
     def _makeApiCall(self, parameters = None):
         """
@@ -7,16 +7,21 @@
 # http://www.eclipse.org/legal/epl-v10.html
 # *****************************************************************************
 
+import base64
 import iso8601
 from collections import defaultdict
-from ibmiotf.api.common import ApiClient, ApiException
-from ibmiotf.api.registry.devices import DeviceUid
+from ibmiotf.api.common import ApiClient, ApiException, callWithRetry, concurrentMap
+from ibmiotf.api.registry.devices import DeviceUid, toDeviceUid
 
 class LastEvent(defaultdict):
     def __init__(self, **kwargs):
         if not set(['deviceId', 'typeId', 'eventId', 'format', 'timestamp', 'payload']).issubset(kwargs):
             raise Exception("Missing required attributes to construct a LastEvent object")
         dict.__init__(self, **kwargs)
+        
+        # Parsed on first access
+        self._timestamp = None
+        self._decodedPayload = None
     
     @property
     def typeId(self):
@@ -36,12 +41,26 @@ class LastEvent(defaultdict):
     
     @property
     def timestamp(self):
-        return iso8601.parse_date(self["timestamp"])
+        if self._timestamp is None:
+            self._timestamp = iso8601.parse_date(self["timestamp"])
+        return self._timestamp
     
     @property
     def payload(self):
+        """
+        The base64 encoded payload of the event
+        """
         return self["payload"]
     
+    @property
+    def decodedPayload(self):
+        """
+        The payload of the event as bytes
+        """
+        if self._decodedPayload is None:
+            self._decodedPayload = base64.b64decode(self["payload"])
+        return self._decodedPayload
+    
 class LEC():
 
     def __init__(self, apiClient):
@@ -82,3 +101,40 @@ class LEC():
             return events
         else:
             raise ApiException(r)
+
+    def getAllMany(self, deviceUids, eventIds=None, concurrency=16, ordered=False):
+        """
+        Retrieves the last cached message for the events of many devices concurrently, one request 
+        per device.  Devices with no cached events return an empty list.
+        
+        ```python
+        for (deviceUid, events) in lec.getAllMany(deviceUids, eventIds=["status"]):
+            for event in events:
+                print(deviceUid, event.timestamp, event.decodedPayload)
+        ```
+        
+        # Parameters
+        deviceUids (iterable): Devices, as #DeviceUid, #Device or `clientId`
+        eventIds (list<string>): Only return these events, optional
+        concurrency (int): Number of requests made at the same time
+        ordered (boolean): Return results in input order, rather than as they arrive
+        
+        # Returns
+        generator<(DeviceUid, list<LastEvent>)>: Each device and its last events
+        """
+        eventIds = None if eventIds is None else set(eventIds)
+        
+        def getDeviceEvents(device):
+            deviceUid = toDeviceUid(device)
+            url = 'api/v0002/device/types/%s/devices/%s/events' % (deviceUid.typeId, deviceUid.deviceId)
+            r = callWithRetry(lambda: self._apiClient.get(url))
+            
+            if r.status_code == 200:
+                events = [LastEvent(**event) for event in r.json() if eventIds is None or event["eventId"] in eventIds]
+                return (deviceUid, events)
+            elif r.status_code == 404:
+                return (deviceUid, [])
+            else:
+                raise ApiException(r)
+        
+        return concurrentMap(getDeviceEvents, deviceUids, concurrency, ordered)
@@ -10,12 +10,41 @@
 from ibmiotf.api.common import ApiClient 
 from ibmiotf.api.registry.devices import Devices 
 from ibmiotf.api.registry.types import DeviceTypes 
+from ibmiotf.api.registry.cache import RegistryCache
+from ibmiotf.api.registry.mirror import RegistryMirror
 
 class Registry():
 
-    def __init__(self, apiClient):
+    def __init__(self, apiClient, cache=None):
         self._apiClient = apiClient
+        self.cache = cache
         
-        self.devices = Devices(self._apiClient)
-        self.devicetypes = DeviceTypes(self._apiClient)
+        self.devices = Devices(self._apiClient, cache=self.cache)
+        self.devicetypes = DeviceTypes(self._apiClient, cache=self.cache)
     
+    def enableCache(self, maxSize=10000, ttl=60, negativeTtl=10):
+        """
+        Serve device and device type lookups from a #RegistryCache
+        
+        ```python
+        registry.enableCache(maxSize=100000, ttl=300)
+        if "d:orgId:typeId:deviceId" in registry.devices:
+            device = registry.devices["d:orgId:typeId:deviceId"]
+        ```
+        """
+        self.cache = RegistryCache(maxSize, ttl, negativeTtl)
+        self.devices = Devices(self._apiClient, cache=self.cache)
+        self.devicetypes = DeviceTypes(self._apiClient, cache=self.cache)
+        return self.cache
+
+    def mirror(self, path=":memory:", metadataKeys=None, concurrency=8, syncMargin=300):
+        """
+        Create a #RegistryMirror, a local SQLite copy of the registry that can be queried offline
+
+        ```python
+        mirror = registry.mirror("registry.db", metadataKeys=["region"])
+        mirror.sync()
+        outdated = mirror.findDevices(fwVersionBelow="2.1.0")
+        ```
+        """
+        return RegistryMirror(self._apiClient, path, metadataKeys, concurrency, syncMargin)
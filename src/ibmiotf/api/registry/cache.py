@@ -0,0 +1,129 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import time
+import threading
+from collections import OrderedDict
+
+from ibmiotf.api.common import ApiException
+
+
+class CacheEntry(object):
+    __slots__ = ["data", "etag", "expires"]
+    
+    def __init__(self, data, etag, expires):
+        self.data = data
+        self.etag = etag
+        self.expires = expires
+
+
+class RegistryCache(object):
+    """
+    Bounded LRU cache for registry lookups, keyed by resource URL.
+    
+    - Entries expire after `ttl` seconds, after which they are revalidated using 
+      `If-None-Match` if the API returned an `ETag`, or requested again otherwise
+    - Resources that do not exist (`404`) are remembered for `negativeTtl` seconds
+    - Creating, updating or deleting a resource through the same #Registry removes 
+      it from the cache
+    
+    The raw JSON held in the cache is shared between lookups, treat the objects 
+    returned from a cached registry as read-only.
+    
+    # Parameters
+    maxSize (int): Maximum number of resources held in the cache.  Defaults to `10000`
+    ttl (int): Seconds a cached resource is used without contacting the API.  Defaults to `60`
+    negativeTtl (int): Seconds a missing resource is remembered.  Defaults to `10`
+    
+    # Attributes
+    hits (int): Lookups answered from the cache
+    misses (int): Lookups that required a full request
+    revalidations (int): Expired entries confirmed unchanged by a `304` response
+    """
+    
+    def __init__(self, maxSize=10000, ttl=60, negativeTtl=10):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def fetch(self, apiClient, url):
+        """
+        Get the raw JSON for a resource, using the cache where possible
+        
+        # Returns
+        dict: The resource, or `None` if the resource does not exist
+        
+        # Raises
+        ApiException: If the API returns anything other than `200`, `304` or `404`
+        """
+        now = time.time()
+        headers = None
+        
+        with self._lock:
+            entry = self._entries.get(url, None)
+            if entry is not None:
+                if entry.expires > now:
+                    # Mark as most recently used
+                    del self._entries[url]
+                    self._entries[url] = entry
+                    self.hits += 1
+                    return entry.data
+                if entry.etag is not None:
+                    headers = {"If-None-Match": entry.etag}
+        
+        r = apiClient.get(url, headers=headers)
+        if r.status_code == 304 and entry is not None:
+            with self._lock:
+                self.revalidations += 1
+            self._store(url, CacheEntry(entry.data, entry.etag, now + self.ttl))
+            return entry.data
+        
+        with self._lock:
+            self.misses += 1
+        
+        if r.status_code == 200:
+            data = r.json()
+            self._store(url, CacheEntry(data, r.headers.get("ETag", None), now + self.ttl))
+            return data
+        elif r.status_code == 404:
+            self._store(url, CacheEntry(None, None, now + self.negativeTtl))
+            return None
+        else:
+            raise ApiException(r)
+    
+    def invalidate(self, url):
+        """
+        Remove a resource from the cache
+        """
+        with self._lock:
+            self._entries.pop(url, None)
+    
+    def clear(self):
+        """
+        Remove all resources from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+    
+    def _store(self, url, entry):
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = entry
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
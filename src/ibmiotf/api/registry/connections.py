@@ -0,0 +1,327 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import re
+import time
+import calendar
+import iso8601
+from datetime import datetime
+from collections import namedtuple, deque
+
+from ibmiotf.api.common import ApiException, callWithRetry, concurrentMap
+from ibmiotf.api.registry.devices import IterableDeviceScan, toDeviceUid
+
+CLOSE_CODE_CLIENT_ID_REUSED = 288
+CLIENT_IP_RE = re.compile("(?:ClientIP=|from )([0-9A-Fa-f.:]+)")
+
+# One connection log entry: `timestamp` is in seconds since the epoch and `connected` is True
+# for a successful connection, False for a closed connection and None for any other message
+ConnectionLogEvent = namedtuple("ConnectionLogEvent", ["typeId", "deviceId", "timestamp", "connected", "clientAddr", "message"])
+
+
+def toEpoch(timestamp):
+    """
+    Convert a timezone aware datetime, or an ISO8601 string, to seconds since the epoch
+    """
+    if not isinstance(timestamp, datetime):
+        timestamp = iso8601.parse_date(timestamp)
+    return calendar.timegm(timestamp.utctimetuple()) + timestamp.microsecond / 1000000.0
+
+
+def parseConnectionLogEntry(typeId, deviceId, entry):
+    """
+    Interpret an entry returned by `api/v0002/logs/connection`, for example
+    `Token auth succeeded: ClientID='d:org:type:id', ClientIP=32.97.110.54` or
+    `Closed connection from 32.97.110.54. The connection has completed normally.`
+
+    # Returns
+    ConnectionLogEvent: The entry, or `None` if it has no timestamp or message
+    """
+    if "timestamp" not in entry or "message" not in entry:
+        return None
+
+    message = entry["message"]
+    if message.startswith("Closed connection"):
+        connected = False
+    elif "succeeded" in message:
+        connected = True
+    else:
+        connected = None
+
+    match = CLIENT_IP_RE.search(message)
+    clientAddr = match.group(1).rstrip(".") if match else None
+    return ConnectionLogEvent(typeId, deviceId, toEpoch(entry["timestamp"]), connected, clientAddr, message)
+
+
+class ConnectionLogFetcher(object):
+    """
+    Retrieves the connection logs of many devices concurrently.  Results are streamed as each
+    device's logs arrive, and each entry is reduced to a #ConnectionLogEvent, so the memory
+    used is bounded by the number of devices in flight rather than the size of the fleet.
+
+    ```python
+    fetcher = ConnectionLogFetcher(apiClient, concurrency=32, since=time.time() - 86400)
+    for event in fetcher.events(registry.devicetypes["sensor"].devices.scan()):
+        print(event)
+    ```
+
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to make the requests
+    concurrency (int): Number of devices fetched at the same time.  Defaults to `16`
+    since (float): Drop entries older than this, in seconds since the epoch, optional
+    retries (int): Number of times to retry a request that fails with a retryable status code
+    """
+    def __init__(self, apiClient, concurrency=16, since=None, retries=3):
+        self._apiClient = apiClient
+        self.concurrency = max(1, concurrency)
+        self.since = since
+        self.retries = retries
+
+    def fetchDevice(self, deviceUid):
+        """
+        # Returns
+        list<ConnectionLogEvent>: The connection log of one device, oldest first
+
+        # Raises
+        ApiException: If the connection log can not be retrieved
+        """
+        parameters = {"typeId": deviceUid.typeId, "deviceId": deviceUid.deviceId}
+        r = callWithRetry(lambda: self._apiClient.get('api/v0002/logs/connection', parameters=parameters), self.retries)
+        if r.status_code != 200:
+            raise ApiException(r)
+
+        events = []
+        for entry in r.json():
+            event = parseConnectionLogEntry(deviceUid.typeId, deviceUid.deviceId, entry)
+            if event is not None and (self.since is None or event.timestamp >= self.since):
+                events.append(event)
+        events.sort(key=lambda event: event.timestamp)
+        return events
+
+    def fetch(self, devices=None, ordered=False):
+        """
+        Fetch the connection logs of a set of devices
+
+        # Parameters
+        devices (iterable): Devices to fetch, as #Device, #DeviceRecord, #DeviceUid or `clientId`.
+            Defaults to every device in the organization
+        ordered (boolean): Return results in input order, rather than as they complete
+
+        # Returns
+        generator<(DeviceUid, list<ConnectionLogEvent>)>: Each device and its connection log, oldest first
+        """
+        if devices is None:
+            devices = IterableDeviceScan(self._apiClient, self.concurrency, pageSize=100).raw()
+
+        def fetchDevice(device):
+            deviceUid = toDeviceUid(device)
+            return (deviceUid, self.fetchDevice(deviceUid))
+
+        return concurrentMap(fetchDevice, devices, self.concurrency, ordered)
+
+    def events(self, devices=None):
+        """
+        Fetch the connection logs of a set of devices as a single stream of events.  The events
+        of each device are in time order, but the events of different devices are interleaved
+        in the order the devices complete.
+
+        # Returns
+        generator<ConnectionLogEvent>
+        """
+        for (deviceUid, events) in self.fetch(devices):
+            for event in events:
+                yield event
+
+
+class ConnectionLogAnalyzer(object):
+    """
+    Incrementally summarizes connection activity over a sliding window ending at the most recent
+    event seen: connect and disconnect rates, the duration of sessions that ended in the window,
+    and the devices that are flapping, those that connected or disconnected `flapThreshold` times
+    or more within `flapWindow` seconds.
+
+    Events can be added in any order across devices, but must be in time order for each device,
+    as produced by #ConnectionLogFetcher.  Live status messages can be added with `addStatus()`,
+    for example from the `deviceStatusCallback` of an application client.  Counts are kept in
+    `bucketSize` second buckets, and state older than the window is discarded as the window
+    moves, so memory is bounded by the activity in the window.  This includes sessions that 
+    started before the window and are still open, so the duration of a session longer than the 
+    window is not measured.
+
+    ```python
+    analyzer = ConnectionLogAnalyzer(window=3600)
+    analyzer.addAll(ConnectionLogFetcher(apiClient, since=time.time() - 3600).events())
+    for device in analyzer.summary()["flapping"]:
+        print("%(typeId)s:%(deviceId)s %(transitions)s" % device)
+    ```
+
+    # Parameters
+    window (int): Length of the sliding window in seconds.  Defaults to `3600`
+    bucketSize (int): Resolution of the window in seconds.  Defaults to `60`
+    flapWindow (int): Period in seconds over which transitions are counted for flap detection.  Defaults to `300`
+    flapThreshold (int): Transitions within `flapWindow` for a device to be considered flapping.  Defaults to `6`
+    """
+    def __init__(self, window=3600, bucketSize=60, flapWindow=300, flapThreshold=6):
+        self.window = window
+        self.bucketSize = bucketSize
+        self.flapWindow = flapWindow
+        self.flapThreshold = flapThreshold
+
+        self.latest = None
+        self.expired = 0
+
+        # bucket -> [connects, disconnects, sessions, total session seconds, longest session]
+        self._buckets = {}
+        self._currentBucket = None
+        # (typeId, deviceId) -> timestamp of the connect that started the session
+        self._openSessions = {}
+        # (typeId, deviceId) -> timestamps of the transitions within flapWindow
+        self._transitions = {}
+        # (typeId, deviceId) -> (most transitions within flapWindow, time of the last transition)
+        self._flapping = {}
+
+    def add(self, event):
+        """
+        Add a #ConnectionLogEvent
+
+        # Returns
+        boolean: `False` if the event was ignored, because it is not a connect or disconnect
+            or it is older than the window
+        """
+        if event.connected is None:
+            return False
+        return self._add(event.typeId, event.deviceId, event.timestamp, event.connected)
+
+    def addStatus(self, status):
+        """
+        Add a device status message, see #ibmiotf.application.Status
+        """
+        if status.closeCode == CLOSE_CODE_CLIENT_ID_REUSED and not status.retained:
+            return False
+        timestamp = toEpoch(status.time) if status.time is not None else time.time()
+        return self._add(status.deviceType, status.deviceId, timestamp, status.action == "Connect")
+
+    def addAll(self, events):
+        """
+        Add every #ConnectionLogEvent from an iterable
+
+        # Returns
+        int: The number of events that were not ignored
+        """
+        added = 0
+        for event in events:
+            if self.add(event):
+                added += 1
+        return added
+
+    def _add(self, typeId, deviceId, timestamp, connected):
+        if self.latest is None or timestamp > self.latest:
+            self.latest = timestamp
+            self._advance()
+
+        if timestamp < self.latest - self.window:
+            self.expired += 1
+            return False
+
+        key = (typeId, deviceId)
+        bucket = self._bucket(int(timestamp // self.bucketSize))
+        if connected:
+            bucket[0] += 1
+            self._openSessions[key] = timestamp
+        else:
+            bucket[1] += 1
+            start = self._openSessions.pop(key, None)
+            if start is not None and timestamp >= start:
+                duration = timestamp - start
+                bucket[2] += 1
+                bucket[3] += duration
+                bucket[4] = max(bucket[4], duration)
+
+        transitions = self._transitions.get(key, None)
+        if transitions is None:
+            transitions = deque()
+            self._transitions[key] = transitions
+        transitions.append(timestamp)
+        while transitions[0] < timestamp - self.flapWindow:
+            transitions.popleft()
+        if len(transitions) >= self.flapThreshold:
+            (mostTransitions, lastTransition) = self._flapping.get(key, (0, 0))
+            self._flapping[key] = (max(mostTransitions, len(transitions)), max(lastTransition, timestamp))
+        return True
+
+    def _bucket(self, index):
+        bucket = self._buckets.get(index, None)
+        if bucket is None:
+            bucket = [0, 0, 0, 0.0, 0.0]
+            self._buckets[index] = bucket
+        return bucket
+
+    def _advance(self):
+        """
+        Discard state that has left the window, once per bucket as the window moves
+        """
+        index = int(self.latest // self.bucketSize)
+        if index == self._currentBucket:
+            return
+        self._currentBucket = index
+
+        windowStart = self.latest - self.window
+        for oldIndex in [i for i in self._buckets if (i + 1) * self.bucketSize <= windowStart]:
+            del self._buckets[oldIndex]
+
+        for key in [key for (key, start) in self._openSessions.items() if start < windowStart]:
+            del self._openSessions[key]
+
+        flapStart = self.latest - self.flapWindow
+        for key in [key for (key, transitions) in self._transitions.items() if transitions[-1] < flapStart]:
+            del self._transitions[key]
+        for key in [key for (key, flap) in self._flapping.items() if flap[1] < windowStart]:
+            del self._flapping[key]
+
+    def summary(self):
+        """
+        # Returns
+        dict: The `start` and `end` of the window (seconds since the epoch), the number of
+            `connects` and `disconnects` and their `connectRate` and `disconnectRate` per minute,
+            the `sessions` that ended in the window with their `meanDuration` and `maxDuration` in
+            seconds, the number of `openSessions`, and the `flapping` devices, most transitions first
+        """
+        if self.latest is None:
+            return {"start": None, "end": None, "connects": 0, "disconnects": 0, "connectRate": 0.0, "disconnectRate": 0.0,
+                    "sessions": 0, "meanDuration": None, "maxDuration": None, "openSessions": 0, "flapping": []}
+
+        windowStart = self.latest - self.window
+        totals = [0, 0, 0, 0.0, 0.0]
+        for (index, bucket) in self._buckets.items():
+            if (index + 1) * self.bucketSize <= windowStart:
+                continue
+            for i in range(4):
+                totals[i] += bucket[i]
+            totals[4] = max(totals[4], bucket[4])
+
+        minutes = self.window / 60.0
+        flapping = [
+            {"typeId": key[0], "deviceId": key[1], "transitions": flap[0], "lastTransition": flap[1]}
+            for (key, flap) in self._flapping.items() if flap[1] >= windowStart
+        ]
+        flapping.sort(key=lambda device: (-device["transitions"], device["typeId"], device["deviceId"]))
+
+        return {
+            "start": windowStart,
+            "end": self.latest,
+            "connects": totals[0],
+            "disconnects": totals[1],
+            "connectRate": totals[0] / minutes,
+            "disconnectRate": totals[1] / minutes,
+            "sessions": totals[2],
+            "meanDuration": totals[3] / totals[2] if totals[2] else None,
+            "maxDuration": totals[4] if totals[2] else None,
+            "openSessions": len(self._openSessions),
+            "flapping": flapping
+        }
@@ -9,10 +9,31 @@
 
 import iso8601
 from datetime import datetime
+import binascii
 import json
+import keyword
+import os
+import re
+import sys
+import time
+import threading
+import requests
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-from ibmiotf.api.common import IterableList, ApiException
+# Support Python 2.7 and 3.x versions of queue
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Support Python 2.7 and 3.x versions of intern
+try:
+    _intern = sys.intern
+except AttributeError:
+    _intern = intern
+
+from ibmiotf.api.common import IterableList, ApiException, RETRYABLE_STATUS_CODES, callWithRetry, chunkBySize, concurrentMap
 from ibmiotf.api.registry.diag import DeviceLogs, DeviceErrorCodes
 
 
@@ -120,6 +141,48 @@ class DeviceCreateResponse(defaultdict):
     @property
     def authToken(self):
         return self["authToken"]
+    @property
+    def error(self):
+        return self.get("error", None)
+
+class DeviceUpdateResult(defaultdict):
+    """
+    The outcome of updating one device with #Devices.updateMany()
+    
+    # Attributes
+    typeId (string): The device type
+    deviceId (string): The device
+    status (string): One of `updated`, `unchanged`, `notFound` or `failed`
+    device (Device): The device after the update, or the current device if it was unchanged
+    error (Exception): The reason the update failed
+    """
+    UPDATED = "updated"
+    UNCHANGED = "unchanged"
+    NOT_FOUND = "notFound"
+    FAILED = "failed"
+    
+    def __init__(self, **kwargs):
+        dict.__init__(self, **kwargs)
+    
+    @property
+    def typeId(self):
+        return self["typeId"]
+    @property
+    def deviceId(self):
+        return self["deviceId"]
+    @property
+    def status(self):
+        return self["status"]
+    @property
+    def device(self):
+        return self.get("device", None)
+    @property
+    def error(self):
+        return self.get("error", None)
+    @property
+    def success(self):
+        return self["status"] in [DeviceUpdateResult.UPDATED, DeviceUpdateResult.UNCHANGED]
+
 
 class DeviceInfo(defaultdict):
     def __init__(self, description=None, deviceClass=None, fwVersion=None, hwVersion=None, manufacturer=None, model=None, serialNumber=None, descriptiveLocation=None):
@@ -162,6 +225,8 @@ class DeviceInfo(defaultdict):
 
     
 class Device(object):
+    __slots__ = ["_apiClient", "_data", "_deviceInfo", "_diagLogs", "_diagErrorCodes"]
+    
     def __init__(self, apiClient, data):
         self._apiClient = apiClient
         self._data = data
@@ -169,8 +234,10 @@ class Device(object):
         if not set(['clientId', 'deviceId', 'typeId']).issubset(data):
             raise Exception("Data passed to Device is not correct: %s" % (json.dumps(data, sort_keys=True)))
         
-        self.diagLogs = DeviceLogs(self._apiClient, data['typeId'], data['deviceId'])
-        self.diagErrorCodes = DeviceErrorCodes(self._apiClient, data['typeId'], data['deviceId'])
+        # Built on first access, most devices returned by a listing never use them
+        self._deviceInfo = None
+        self._diagLogs = None
+        self._diagErrorCodes = None
         
         #{u'clientId': u'xxxxxxxxx',
         # u'deviceId': u'xxxxxxx',
@@ -209,7 +276,21 @@ class Device(object):
     def deviceInfo(self):
         # Unpack the deviceInfo dictionary into keyword arguments so that we 
         # can return a DeviceIngo object instead of a plain dictionary
-        return DeviceInfo(**self._data["deviceInfo"])
+        if self._deviceInfo is None:
+            self._deviceInfo = DeviceInfo(**self._data["deviceInfo"])
+        return self._deviceInfo
+    
+    @property
+    def diagLogs(self):
+        if self._diagLogs is None:
+            self._diagLogs = DeviceLogs(self._apiClient, self.typeId, self.deviceId)
+        return self._diagLogs
+    
+    @property
+    def diagErrorCodes(self):
+        if self._diagErrorCodes is None:
+            self._diagErrorCodes = DeviceErrorCodes(self._apiClient, self.typeId, self.deviceId)
+        return self._diagErrorCodes
     
     @property
     def typeId(self):
@@ -270,12 +351,322 @@ class Device(object):
             raise ApiException(r)
     
     
+class DeviceRecord(object):
+    """
+    Base class for compact, read-only device records that hold only a projection of the 
+    device's fields, see #deviceRecordClass.  Records do not keep the raw JSON of the device.
+    """
+    __slots__ = []
+    _fields = ()
+    
+    def __init__(self, apiClient, data):
+        for (name, path) in self._fields:
+            value = data
+            for key in path:
+                value = value.get(key, None) if isinstance(value, dict) else None
+            if name in _INTERNED_FIELDS and value is not None:
+                value = _internString(value)
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("Device records are read-only")
+    
+    def json(self):
+        return dict((path[-1], getattr(self, name)) for (name, path) in self._fields)
+    
+    def __eq__(self, other):
+        return type(self) is type(other) and self.json() == other.json()
+    
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    
+    def __hash__(self):
+        return hash((type(self), tuple(_hashable(getattr(self, name)) for (name, path) in self._fields)))
+    
+    def __str__(self):
+        return json.dumps(self.json(), sort_keys=True)
+    
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, json.dumps(self.json(), sort_keys=True))
+
+
+def _hashable(value):
+    # Fields such as metadata can hold JSON objects and arrays
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item)) for (key, item) in value.items()))
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+# Values that repeat across many devices, a single copy of each is shared between records
+_INTERNED_FIELDS = set(["typeId", "deviceClass", "manufacturer", "model", "fwVersion", "hwVersion", "descriptiveLocation"])
+
+_DEVICE_INFO_FIELDS = set(["description", "deviceClass", "fwVersion", "hwVersion", "manufacturer", "model", "serialNumber", "descriptiveLocation"])
+
+DEFAULT_RECORD_FIELDS = ["typeId", "deviceId"]
+
+_recordClasses = {}
+_recordClassesLock = threading.Lock()
+
+
+def _internString(value):
+    try:
+        return _intern(value)
+    except TypeError:
+        # Python 2.x can not intern unicode strings
+        try:
+            return _intern(str(value))
+        except (TypeError, UnicodeError):
+            return value
+
+
+def _attributeName(key):
+    """
+    A valid attribute (and slot) name for a device field key
+    """
+    name = str(re.sub("[^A-Za-z0-9_]", "_", key))
+    if name == "" or name[0].isdigit():
+        name = "_" + name
+    if keyword.iskeyword(name):
+        name = name + "_"
+    return name
+
+
+def deviceRecordClass(fields):
+    """
+    Get the #DeviceRecord class holding the given projection of a device.  Each field is 
+    a top level property of the device (`typeId`, `deviceId`, `clientId`, ...), a `deviceInfo` 
+    property (`fwVersion`, `serialNumber`, ...), or a dotted path such as `metadata.region` or 
+    `status.alert.enabled`.  A dotted field is available as an attribute named after its last 
+    component, with any characters that are not valid in a Python identifier replaced by `_` 
+    (`metadata.some-key` becomes `some_key`).  `json()` returns the original key.
+    
+    # Parameters
+    fields (list<string>): The fields to keep
+    
+    # Returns
+    class: A subclass of #DeviceRecord, usable as the `castToClass` of an #IterableList
+    
+    # Raises
+    ValueError: If two fields map to the same attribute name
+    """
+    fields = tuple(fields)
+    with _recordClassesLock:
+        if fields in _recordClasses:
+            return _recordClasses[fields]
+        
+        projection = []
+        for field in fields:
+            path = field.split(".")
+            if len(path) == 1 and field in _DEVICE_INFO_FIELDS:
+                path = ["deviceInfo", field]
+            projection.append((_attributeName(path[-1]), tuple(path)))
+        
+        names = [name for (name, path) in projection]
+        if len(set(names)) != len(names):
+            raise ValueError("Device record fields must have unique names: %s" % (", ".join(fields)))
+        
+        recordClass = type("DeviceRecord_" + "_".join(names), (DeviceRecord, ), {"__slots__": names, "_fields": tuple(projection)})
+        _recordClasses[fields] = recordClass
+        return recordClass
+    
+
 class IterableDeviceList(IterableList):
-    def __init__(self, apiClient, typeId=None):
+    """
+    Iterates through the devices of the organization, or of a single device type.  By 
+    default each result is a #Device, when `fields` is supplied each result is instead a 
+    compact #DeviceRecord holding only those fields.
+    """
+    def __init__(self, apiClient, typeId=None, pageSize=None, prefetch=True, fields=None):
+        castToClass = Device if fields is None else deviceRecordClass(fields)
         if typeId is None:
-            super(IterableDeviceList, self).__init__(apiClient, Device, 'api/v0002/bulk/devices', 'typeId,deviceId')
+            super(IterableDeviceList, self).__init__(apiClient, castToClass, 'api/v0002/bulk/devices', 'typeId,deviceId', pageSize, prefetch)
         else:
-            super(IterableDeviceList, self).__init__(apiClient, Device, 'api/v0002/device/types/%s/devices/' % (typeId), 'deviceId')
+            super(IterableDeviceList, self).__init__(apiClient, castToClass, 'api/v0002/device/types/%s/devices/' % (typeId), 'deviceId', pageSize, prefetch)
+
+
+class IterableDeviceScan(object):
+    """
+    Scans all devices in the organization by walking the device list of every 
+    device type concurrently, instead of following the single bookmark chain of 
+    `api/v0002/bulk/devices`.  The per-type results are merged into one stream.
+    
+    Devices of the same type are always returned in `deviceId` order.  With `ordered=True` 
+    every device of one type is returned before the next type starts, which reproduces the 
+    `typeId,deviceId` order of #IterableDeviceList while later types are fetched ahead into 
+    a buffer of at most `bufferPages` pages per type.
+    
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to make the requests
+    concurrency (int): Number of device types walked at the same time.  Defaults to `8`
+    ordered (boolean): Return the types one after another in `typeId` order.  Defaults to `False`
+    pageSize (int): Page size used for each per-type listing
+    bufferPages (int): Pages buffered per type before its walker waits for the consumer.  Defaults to `4`
+    fields (list<string>): Return a compact #DeviceRecord holding only these fields instead of a #Device
+    
+    ```python
+    for device in registry.devices.scan(concurrency=16):
+        print(device.clientId)
+    ```
+    """
+    
+    _END = object()
+    
+    def __init__(self, apiClient, concurrency=8, ordered=False, pageSize=None, bufferPages=4, fields=None):
+        self._apiClient = apiClient
+        self._castToClass = Device if fields is None else deviceRecordClass(fields)
+        self._concurrency = max(1, concurrency)
+        self._ordered = ordered
+        self._pageSize = pageSize
+        self._bufferPages = max(1, bufferPages)
+        self._closed = None
+    
+    def __iter__(self):
+        for device in self.raw():
+            yield self._castToClass(self._apiClient, device)
+    
+    def raw(self):
+        """
+        Yield each device as a raw dictionary
+        """
+        for page in self.pages():
+            for device in page:
+                yield device
+    
+    def pages(self):
+        """
+        Yield each page of devices, as returned by the per-type listings, as a list of raw dictionaries.  
+        Each iteration starts a new scan, with its own set of walkers.
+        """
+        # A fresh event per scan, so that closing one scan does not affect the next
+        closed = threading.Event()
+        self._closed = closed
+        
+        typeIds = [deviceType["id"] for deviceType in IterableList(self._apiClient, None, 'api/v0002/device/types', 'id', IterableList.MAX_PAGE_SIZE).raw()]
+        
+        executor = ThreadPoolExecutor(max_workers=self._concurrency)
+        try:
+            if self._ordered:
+                # Each type has its own buffer, drained in type order
+                buffers = []
+                for typeId in typeIds:
+                    buffer = queue.Queue(maxsize=self._bufferPages)
+                    buffers.append(buffer)
+                    executor.submit(self._walkType, typeId, buffer, closed)
+                for buffer in buffers:
+                    for page in self._drain(buffer, 1):
+                        yield page
+            else:
+                # All types share one buffer, pages are returned in the order they arrive
+                buffer = queue.Queue(maxsize=self._bufferPages * self._concurrency)
+                for typeId in typeIds:
+                    executor.submit(self._walkType, typeId, buffer, closed)
+                for page in self._drain(buffer, len(typeIds)):
+                    yield page
+        finally:
+            closed.set()
+            executor.shutdown(wait=False)
+    
+    def close(self):
+        """
+        Stop all outstanding per-type walkers of the current scan, called automatically when the scan completes
+        """
+        if self._closed is not None:
+            self._closed.set()
+    
+    def _drain(self, buffer, walkers):
+        finished = 0
+        while finished < walkers:
+            item = buffer.get()
+            if item is IterableDeviceScan._END:
+                finished += 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    
+    def _walkType(self, typeId, buffer, closed):
+        # Walkers still queued when the scan is closed never make a request
+        if closed.is_set():
+            return
+        try:
+            for page in IterableDeviceList(self._apiClient, typeId, self._pageSize).pages():
+                if not self._put(buffer, page, closed):
+                    return
+        except Exception as e:
+            self._put(buffer, e, closed)
+        self._put(buffer, IterableDeviceScan._END, closed)
+    
+    def _put(self, buffer, item, closed):
+        # Wait for space in the buffer, but give up if the consumer has gone away
+        while not closed.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+def toDeviceUid(device, typeId=None):
+    """
+    Identify a device given in any of the forms accepted by the bulk methods of #Devices
+    
+    # Parameters
+    device (object): A #Device, #DeviceRecord, #DeviceUid or other dictionary with `typeId` and 
+        `deviceId`, a `clientId` string, or a device ID when `typeId` is supplied
+    typeId (string): The device type of devices given by device ID alone, optional
+    
+    # Returns
+    DeviceUid: The device's type and ID
+    """
+    if isinstance(device, dict):
+        return DeviceUid(typeId=device["typeId"], deviceId=device["deviceId"])
+    elif isinstance(device, (Device, DeviceRecord)):
+        return DeviceUid(typeId=device.typeId, deviceId=device.deviceId)
+    elif typeId is not None and ":" not in device:
+        return DeviceUid(typeId=typeId, deviceId=device)
+    else:
+        (classIdentifier, orgId, typeId, deviceId) = device.split(":")
+        return DeviceUid(typeId=typeId, deviceId=deviceId)
+
+
+def patchChanges(current, patch):
+    """
+    Would applying a device update patch change the device?  `deviceInfo` and `status.alert` 
+    are merged into the existing values, `metadata` replaces the existing value.
+    
+    # Parameters
+    current (dict): The raw JSON of the device
+    patch (dict): The update, containing any of `metadata`, `deviceInfo` and `status`
+    
+    # Returns
+    boolean: `True` if the device would change
+    """
+    metadata = patch.get("metadata", None)
+    if metadata is not None and metadata != (current.get("metadata", None) or {}):
+        return True
+    
+    deviceInfo = patch.get("deviceInfo", None)
+    if deviceInfo is not None:
+        currentDeviceInfo = current.get("deviceInfo", None) or {}
+        for (key, value) in deviceInfo.items():
+            if value is not None and currentDeviceInfo.get(key, None) != value:
+                return True
+    
+    status = patch.get("status", None)
+    if status is not None:
+        currentAlert = (current.get("status", None) or {}).get("alert", None) or {}
+        for (key, value) in (status.get("alert", None) or {}).items():
+            if value is not None and currentAlert.get(key, None) != value:
+                return True
+    
+    return False
+
+
+# Bulk requests are limited to 512KB, leave some headroom for the request encoding
+BULK_REQUEST_MAX_BYTES = 500 * 1024
 
 
 class Devices(defaultdict):
@@ -310,21 +701,69 @@ class Devices(defaultdict):
         print(device)
     ```
     
+    Pages are requested in the background while you iterate.  Use `pages()` or `raw()` 
+    to skip wrapping each result in a `Device`, and pass `pageSize` to request larger pages:
+    
+    ```python
+    for page in devices.iter(pageSize=100).pages():
+        print(len(page))
+    ```
+    
+    # Register or remove any number of devices
+    
+    `createMany()` and `deleteMany()` accept any iterable, including a generator, split it 
+    into requests that fit the 512KB bulk request limit and submit them in parallel:
+    
+    ```python
+    requests = (DeviceCreateRequest(typeId="sensor", deviceId=str(i)) for i in range(1000000))
+    for response in devices.createMany(requests):
+        if response.success is not False:
+            store(response.typeId, response.deviceId, response.authToken)
+    ```
     """
     # https://docs.python.org/2/library/collections.html#defaultdict-objects
-    def __init__(self, apiClient, typeId=None):
+    def __init__(self, apiClient, typeId=None, cache=None):
         self._apiClient = apiClient
         self.typeId = typeId
+        self._cache = cache
+    
+    def _deviceUrl(self, key):
+        if isinstance(key, dict):
+            return 'api/v0002/device/types/%s/devices/%s' % (key["typeId"], key["deviceId"])
+        elif self.typeId is None:
+            (classIdentifier, orgId, typeId, deviceId) = key.split(":")
+            return 'api/v0002/device/types/%s/devices/%s' % (typeId, deviceId)
+        else:
+            return 'api/v0002/device/types/%s/devices/%s' % (self.typeId, key)
+    
+    def _invalidate(self, devices):
+        """
+        Remove devices changed through this client from the cache
+        """
+        if self._cache is not None:
+            for device in devices:
+                self._cache.invalidate('api/v0002/device/types/%s/devices/%s' % (device["typeId"], device["deviceId"]))
+    
+    def _write(self, devices, request):
+        """
+        Make a request that changes `devices`.  They are removed from the cache both before 
+        the request is sent and after it completes, successfully or not, so that a lookup 
+        made while the request is in flight can not leave the old copy in the cache.
+        """
+        self._invalidate(devices)
+        try:
+            return request()
+        finally:
+            self._invalidate(devices)
     
     def __contains__(self, key):
         """
         Does a device exist?
         """
-        if self.typeId is None:
-            (classIdentifier, orgId, typeId, deviceId) = key.split(":")
-            deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (typeId, deviceId)
-        else:
-            deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (self.typeId, key)
+        deviceUrl = self._deviceUrl(key)
+        
+        if self._cache is not None:
+            return self._cache.fetch(self._apiClient, deviceUrl) is not None
         
         r = self._apiClient.get(deviceUrl)
         if r.status_code == 200:
@@ -338,11 +777,13 @@ class Devices(defaultdict):
         """
         Get a device from the registry
         """
-        if self.typeId is None:
-            (classIdentifier, orgId, typeId, deviceId) = key.split(":")
-            deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (typeId, deviceId)
-        else:
-            deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (self.typeId, key)
+        deviceUrl = self._deviceUrl(key)
+        
+        if self._cache is not None:
+            data = self._cache.fetch(self._apiClient, deviceUrl)
+            if data is None:
+                self.__missing__(key)
+            return Device(self._apiClient, data)
 
         r = self._apiClient.get(deviceUrl)
         if r.status_code == 200:
@@ -362,13 +803,8 @@ class Devices(defaultdict):
         """
         Delete a device
         """
-        if self.typeId is None:
-            (classIdentifier, orgId, typeId, deviceId) = key.split(":")
-            deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (typeId, deviceId)
-        else:
-            deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (self.typeId, key)
-
-        r = self._apiClient.delete(deviceUrl)
+        deviceUrl = self._deviceUrl(key)
+        r = self._write([toDeviceUid(key, self.typeId)], lambda: self._apiClient.delete(deviceUrl))
         if r.status_code == 404:
             self.__missing__(key)
         elif r.status_code != 204:
@@ -379,14 +815,88 @@ class Devices(defaultdict):
         Device does not exist
         """
         raise KeyError("Device %s does not exist" % (key))
+    
+    def getMany(self, keys, concurrency=16, ordered=True, retries=3):
+        """
+        Get many devices concurrently.  Lookups go through the cache when one is enabled.
+        
+        ```python
+        for (clientId, device) in devices.getMany(clientIds, ordered=False):
+            if device is None:
+                print("%s is not registered" % clientId)
+        ```
+        
+        # Parameters
+        keys (iterable): `clientId` strings or #DeviceUid objects, or device IDs when this 
+            collection belongs to a device type
+        concurrency (int): Number of requests made at the same time
+        ordered (boolean): Return results in input order, rather than as they complete
+        retries (int): Number of times to retry a request that failed with a transient error
+        
+        # Returns
+        generator<(key, Device)>: Each key with its device, or `None` if the device does not exist
+        
+        # Raises
+        ApiException: If a lookup fails for a reason other than the device not existing
+        """
+        def getDevice(key):
+            deviceUrl = self._deviceUrl(key)
+            if self._cache is not None:
+                data = self._cache.fetch(self._apiClient, deviceUrl)
+                return (key, None if data is None else Device(self._apiClient, data))
+            
+            r = callWithRetry(lambda: self._apiClient.get(deviceUrl), retries)
+            if r.status_code == 200:
+                return (key, Device(self._apiClient, r.json()))
+            elif r.status_code == 404:
+                return (key, None)
+            else:
+                raise ApiException(r)
+        
+        return concurrentMap(getDevice, keys, concurrency, ordered)
 
-    def __iter__(self, *args, **kwargs):
+    def __iter__(self):
         """
         Iterate through all devices
         """
-        return IterableDeviceList(self._apiClient, self.typeId)
+        return self.iter()
+    
+    def iter(self, pageSize=None, prefetch=True):
+        """
+        Iterate through all devices, using `pageSize` results per request
+        
+        # Parameters
+        pageSize (int): Number of results requested per page, up to `IterableList.MAX_PAGE_SIZE`
+        prefetch (boolean): Request the next page in the background.  Defaults to `True`
+        
+        # Returns
+        IterableDeviceList: The devices, which also offers `pages()` and `raw()`
+        """
+        return IterableDeviceList(self._apiClient, self.typeId, pageSize, prefetch)
     
     
+    def scan(self, concurrency=8, ordered=False, pageSize=None, fields=None):
+        """
+        Iterate through all devices by walking each device type's device list concurrently, 
+        see #IterableDeviceScan.  When this collection is already restricted to a single 
+        device type this is the same as iterating over it.
+        """
+        if self.typeId is not None:
+            return IterableDeviceList(self._apiClient, self.typeId, pageSize, fields=fields)
+        return IterableDeviceScan(self._apiClient, concurrency, ordered, pageSize, fields=fields)
+    
+    def records(self, fields=DEFAULT_RECORD_FIELDS, pageSize=IterableList.MAX_PAGE_SIZE):
+        """
+        Iterate through all devices as compact, read-only #DeviceRecord objects holding only 
+        the selected fields, see #deviceRecordClass.  Use this to hold a large inventory in memory.
+        
+        ```python
+        inventory = list(devices.records(["typeId", "deviceId", "fwVersion", "metadata.region"]))
+        print(inventory[0].fwVersion, inventory[0].region)
+        ```
+        """
+        return IterableDeviceList(self._apiClient, self.typeId, pageSize, fields=fields)
+    
     def create(self, devices):
         """
         Register one or more new devices, each request can contain a maximum of 512KB.
@@ -406,7 +916,7 @@ class Devices(defaultdict):
             listOfDevices = devices
             returnAsAList = True
 
-        r = self._apiClient.post('api/v0002/bulk/devices/add', listOfDevices)
+        r = self._write(listOfDevices, lambda: self._apiClient.post('api/v0002/bulk/devices/add', listOfDevices))
 
         if r.status_code in [201, 202]:
             if returnAsAList:
@@ -420,6 +930,124 @@ class Devices(defaultdict):
             raise ApiException(r)
 
 
+    def createMany(self, devices, concurrency=4, maxRequestBytes=BULK_REQUEST_MAX_BYTES, retries=3):
+        """
+        Register any number of devices, streaming the results.  Devices are read lazily from 
+        `devices`, grouped into bulk requests of at most `maxRequestBytes` and up to 
+        `concurrency` requests are made at once.
+        
+        Each device without an `authToken` is given a random one before it is sent, so the 
+        token is known even when the response to the request is lost.  A bulk add is not 
+        retried blindly: after a transient error that may follow a request the server has 
+        already applied (a 5xx response or a dropped connection) the devices that now exist 
+        are reported with a `success` of `None` and the `authToken` that was sent, and only 
+        the rest are sent again.  A request that still fails is reported as a failed 
+        #DeviceCreateResponse, with the exception in `error`, for each of its devices 
+        rather than raised, so the results of the other requests are not lost.
+        
+        # Parameters
+        devices (iterable<DeviceCreateRequest>): The devices to register
+        concurrency (int): Number of bulk requests made at the same time
+        maxRequestBytes (int): Maximum size of each bulk request
+        retries (int): Number of times to retry a request that failed with a transient error
+        
+        # Returns
+        generator<DeviceCreateResponse>: The result for each device, as each request completes
+        """
+        addChunk = lambda chunk: self._addChunk(chunk, retries)
+        for responses in concurrentMap(addChunk, chunkBySize((self._withAuthToken(device) for device in devices), maxRequestBytes), concurrency, ordered=False):
+            for response in responses:
+                yield response
+    
+    def _withAuthToken(self, device):
+        if device.get("authToken", None):
+            return device
+        device = dict(device)
+        device["authToken"] = binascii.hexlify(os.urandom(16)).decode("ascii")
+        return device
+    
+    def _addChunk(self, chunk, retries, backoff=0.5):
+        """
+        Register one bulk request of #createMany(), returning a response for every device in it
+        """
+        responses = []
+        attempt = 0
+        while True:
+            try:
+                r = self._write(chunk, lambda: self._apiClient.post('api/v0002/bulk/devices/add', chunk))
+                if r.status_code in [201, 202]:
+                    return responses + [DeviceCreateResponse(**entry) for entry in r.json()]
+                error = ApiException(r)
+                if r.status_code not in RETRYABLE_STATUS_CODES:
+                    break
+                # A request rejected by rate limiting was not applied and can be sent again as is
+                mayBeApplied = r.status_code != 429
+            except requests.exceptions.ConnectionError as e:
+                error = e
+                mayBeApplied = True
+            
+            if attempt >= retries:
+                break
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
+            
+            if mayBeApplied:
+                try:
+                    exists = [self._exists(device, retries) for device in chunk]
+                except Exception as e:
+                    error = e
+                    break
+                for (device, existing) in zip(chunk, exists):
+                    if existing:
+                        responses.append(DeviceCreateResponse(typeId=device["typeId"], deviceId=device["deviceId"], authToken=device["authToken"], success=None))
+                chunk = [device for (device, existing) in zip(chunk, exists) if not existing]
+                if len(chunk) == 0:
+                    return responses
+        
+        for device in chunk:
+            responses.append(DeviceCreateResponse(typeId=device["typeId"], deviceId=device["deviceId"], authToken=device["authToken"], success=False, error=error))
+        return responses
+    
+    def _exists(self, device, retries):
+        deviceUrl = self._deviceUrl(device)
+        r = callWithRetry(lambda: self._apiClient.get(deviceUrl), retries)
+        if r.status_code == 200:
+            return True
+        elif r.status_code == 404:
+            return False
+        else:
+            raise ApiException(r)
+    
+    def deleteMany(self, devices, concurrency=4, maxRequestBytes=BULK_REQUEST_MAX_BYTES, retries=3):
+        """
+        Remove any number of devices, streaming the results.  Works in the same way as `createMany()`, 
+        removing a device twice is harmless so failed requests are retried as they are.
+        
+        # Parameters
+        devices (iterable): The devices to remove, as #DeviceUid, #Device or `clientId` strings
+        concurrency (int): Number of bulk requests made at the same time
+        maxRequestBytes (int): Maximum size of each bulk request
+        retries (int): Number of times to retry a request that failed with a transient error
+        
+        # Returns
+        generator<dict>: The result for each device, as each request completes.  The devices of a 
+            request that failed are reported with a `success` of `False` and the exception in `error`
+        """
+        def removeChunk(chunk):
+            try:
+                r = self._write(chunk, lambda: callWithRetry(lambda: self._apiClient.post('api/v0002/bulk/devices/remove', chunk), retries))
+                if r.status_code in [200, 202]:
+                    return r.json()
+                error = ApiException(r)
+            except Exception as e:
+                error = e
+            return [{"typeId": device["typeId"], "deviceId": device["deviceId"], "success": False, "error": error} for device in chunk]
+        
+        deviceUids = (toDeviceUid(device, self.typeId) for device in devices)
+        for responses in concurrentMap(removeChunk, chunkBySize(deviceUids, maxRequestBytes), concurrency, ordered=False):
+            for response in responses:
+                yield response
+    
     def update(self, deviceUid, metadata = None, deviceInfo = None, status = None):
         """
         Update an existing device
@@ -430,14 +1058,92 @@ class Devices(defaultdict):
         
         deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (deviceUid.typeId, deviceUid.deviceId)
 
-        data = {'status' : status, 'deviceInfo' : deviceInfo, 'metadata': metadata}
+        # Only send the parts of the device that are being changed
+        data = {}
+        for (key, value) in [('status', status), ('deviceInfo', deviceInfo), ('metadata', metadata)]:
+            if value is not None:
+                data[key] = value
         
-        r = self._apiClient.put(deviceUrl, data)
+        r = self._write([deviceUid], lambda: self._apiClient.put(deviceUrl, data))
         if r.status_code == 200:
             return Device(self._apiClient, r.json())
         else:
             raise ApiException(r)
 
+    def updateMany(self, updates, concurrency=8, skipUnchanged=True, retries=3):
+        """
+        Update many devices concurrently, streaming the outcome for each device.  A failed 
+        update is reported in its #DeviceUpdateResult rather than raised, so one bad device 
+        does not stop the rest.
+        
+        With `skipUnchanged` the patch is compared against the current device and no request 
+        is made when nothing would change.  The current device is only fetched when the input 
+        is not already a #Device (from a listing or #Devices.getMany()), and through the cache 
+        when one is enabled.
+        
+        ```python
+        patches = ((device, {"metadata": migrate(device.metadata)}) for device in devices)
+        for result in devices.updateMany(patches, concurrency=16):
+            if not result.success:
+                print(result.deviceId, result.error)
+        ```
+        
+        # Parameters
+        updates (iterable<(key, dict)>): Pairs of a device, as a #Device, #DeviceUid or `clientId`, 
+            and a patch containing any of `metadata`, `deviceInfo` and `status`
+        concurrency (int): Number of updates made at the same time
+        skipUnchanged (boolean): Do not update devices whose content would not change
+        retries (int): Number of times to retry a request that failed with a transient error
+        
+        # Returns
+        generator<DeviceUpdateResult>: The outcome for each device, as each update completes
+        """
+        def updateDevice(update):
+            (device, patch) = update
+            deviceUid = toDeviceUid(device, self.typeId)
+            result = DeviceUpdateResult(typeId=deviceUid.typeId, deviceId=deviceUid.deviceId)
+            deviceUrl = self._deviceUrl(deviceUid)
+            try:
+                if skipUnchanged:
+                    if not isinstance(device, Device):
+                        device = self._fetchForUpdate(deviceUrl, retries)
+                        if device is None:
+                            result["status"] = DeviceUpdateResult.NOT_FOUND
+                            return result
+                    if not patchChanges(device.json(), patch):
+                        result["status"] = DeviceUpdateResult.UNCHANGED
+                        result["device"] = device
+                        return result
+                
+                data = dict((key, patch[key]) for key in ['status', 'deviceInfo', 'metadata'] if patch.get(key, None) is not None)
+                r = self._write([deviceUid], lambda: callWithRetry(lambda: self._apiClient.put(deviceUrl, data), retries))
+                if r.status_code == 200:
+                    result["status"] = DeviceUpdateResult.UPDATED
+                    result["device"] = Device(self._apiClient, r.json())
+                elif r.status_code == 404:
+                    result["status"] = DeviceUpdateResult.NOT_FOUND
+                else:
+                    raise ApiException(r)
+            except Exception as e:
+                result["status"] = DeviceUpdateResult.FAILED
+                result["error"] = e
+            return result
+        
+        return concurrentMap(updateDevice, updates, concurrency, ordered=False)
+    
+    def _fetchForUpdate(self, deviceUrl, retries):
+        if self._cache is not None:
+            data = self._cache.fetch(self._apiClient, deviceUrl)
+            return None if data is None else Device(self._apiClient, data)
+        
+        r = callWithRetry(lambda: self._apiClient.get(deviceUrl), retries)
+        if r.status_code == 200:
+            return Device(self._apiClient, r.json())
+        elif r.status_code == 404:
+            return None
+        else:
+            raise ApiException(r)
+
     
     def delete(self, devices):
         """
@@ -450,7 +1156,7 @@ class Devices(defaultdict):
         else:
             listOfDevices = devices
             
-        r = self._apiClient.post('api/v0002/bulk/devices/remove', listOfDevices)
+        r = self._write(listOfDevices, lambda: self._apiClient.post('api/v0002/bulk/devices/remove', listOfDevices))
 
         if r.status_code in [200, 202]:
             return r.json()
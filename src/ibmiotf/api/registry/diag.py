@@ -1,8 +1,64 @@
 import iso8601
 import json
+import time
+import threading
 from datetime import datetime
-from collections import defaultdict, MutableSequence
-from ibmiotf.api.common import ApiException
+from collections import defaultdict
+from ibmiotf.api.common import ApiException, concurrentMap
+
+# Support Python 2.7 and 3.x locations of MutableSequence
+try:
+    from collections.abc import MutableSequence
+except ImportError:
+    from collections import MutableSequence
+
+
+class DiagSnapshot(object):
+    """
+    Shared by #DeviceLogs and #DeviceErrorCodes.  By default every read downloads the full 
+    list from the API.  In snapshot mode, see `snapshot()`, the list is downloaded once and 
+    length, indexing and iteration are served from the copy until it is older than `ttl` 
+    seconds or `refresh()` is called.  Changes made through the same object discard the copy.
+    """
+    
+    def _initSnapshot(self, url, ttl, snapshotMode):
+        self._listUrl = url
+        self._snapshotMode = snapshotMode
+        self._ttl = ttl
+        self._snapshot = None
+        self._snapshotTime = 0
+        self._snapshotLock = threading.Lock()
+    
+    def _download(self):
+        r = self._apiClient.get(self._listUrl)
+        if r.status_code == 200:
+            return r.json()
+        else:
+            raise ApiException(r)
+    
+    def _entries(self):
+        """
+        The raw entries, from the snapshot if there is a current one
+        """
+        if not self._snapshotMode:
+            return self._download()
+        
+        with self._snapshotLock:
+            if self._snapshot is None or (self._ttl is not None and time.time() - self._snapshotTime > self._ttl):
+                self._snapshot = self._download()
+                self._snapshotTime = time.time()
+            return self._snapshot
+    
+    def refresh(self):
+        """
+        Discard the snapshot, the next read downloads the list again
+        """
+        with self._snapshotLock:
+            self._snapshot = None
+    
+    @property
+    def isSnapshot(self):
+        return self._snapshotMode
 
 
 class DeviceErrorCode(defaultdict):
@@ -26,22 +82,36 @@ class DeviceErrorCode(defaultdict):
         return self["timestamp"]
     
     
-class DeviceErrorCodes(MutableSequence):
-    def __init__(self, apiClient, typeId, deviceId):
+class DeviceErrorCodes(MutableSequence, DiagSnapshot):
+    """
+    The error codes reported by a device.  Use `snapshot()` to read the error codes several 
+    times without downloading them again each time:
+    
+    ```python
+    errorCodes = device.diagErrorCodes.snapshot(ttl=60)
+    for i in range(len(errorCodes)):
+        print(errorCodes[i])
+    ```
+    """
+    def __init__(self, apiClient, typeId, deviceId, ttl=None, snapshotMode=False):
         self._apiClient = apiClient
         self.typeId = typeId
         self.deviceId = deviceId
+        self._initSnapshot('api/v0002/device/types/%s/devices/%s/diag/errorCodes' % (typeId, deviceId), ttl, snapshotMode)
     
+    def snapshot(self, ttl=None):
+        """
+        Get a view of the error codes that downloads them once, and again after `ttl` seconds 
+        or when `refresh()` is called
+        """
+        return DeviceErrorCodes(self._apiClient, self.typeId, self.deviceId, ttl, snapshotMode=True)
     
     def __len__(self):
-        # Get all, convert list to iterator
-        logsUrl = 'api/v0002/device/types/%s/devices/%s/diag/errorCodes' % (self.typeId, self.deviceId)
-
-        r = self._apiClient.get(logsUrl)
-        if r.status_code == 200:
-            return len(r.json())
-        else:
-            raise ApiException(r)
+        return len(self._entries())
+    
+    def __iter__(self):
+        for errorCode in self._entries():
+            yield DeviceErrorCode(**errorCode)
 
     def __delitem__(self, index):
         raise Exception("Individual error codes can not be deleted use clear() method instead")
@@ -56,15 +126,10 @@ class DeviceErrorCodes(MutableSequence):
         """
         Get a log entry
         """
-        ecUrl = 'api/v0002/device/types/%s/devices/%s/diag/errorCodes' % (self.typeId, self.deviceId)
-
-        r = self._apiClient.get(ecUrl)
-        if r.status_code == 200:
-            if index > len(r.json()):
-                self.__missing__(index)
-            return DeviceErrorCode(**r.json()[index])
-        else:
-            raise ApiException(r)
+        entries = self._entries()
+        if index > len(entries):
+            self.__missing__(index)
+        return DeviceErrorCode(**entries[index])
 
     def append(self, item = None, **kwargs):
         # Get all, convert list to iterator
@@ -73,6 +138,7 @@ class DeviceErrorCodes(MutableSequence):
         if item is None:
             item = DeviceErrorCode(**kwargs)
         
+        self.refresh()
         r = self._apiClient.post(ecUrl, item)
         if r.status_code == 201:
             return True
@@ -90,6 +156,7 @@ class DeviceErrorCodes(MutableSequence):
         # Get all, convert list to iterator
         ecUrl = 'api/v0002/device/types/%s/devices/%s/diag/errorCodes' % (self.typeId, self.deviceId)
 
+        self.refresh()
         r = self._apiClient.delete(ecUrl)
         if r.status_code == 204:
             return True
@@ -135,11 +202,29 @@ class DeviceLog(defaultdict):
         return self.get("deviceId", None)
 
     
-class DeviceLogs(defaultdict):
-    def __init__(self, apiClient, typeId, deviceId):
+class DeviceLogs(defaultdict, DiagSnapshot):
+    """
+    The diagnostic logs of a device, addressed by log id or by index.  Use `snapshot()` to 
+    read the logs several times without downloading them again each time:
+    
+    ```python
+    logs = device.diagLogs.snapshot(ttl=60)
+    for i in range(len(logs)):
+        print(logs[i])
+    ```
+    """
+    def __init__(self, apiClient, typeId, deviceId, ttl=None, snapshotMode=False):
         self._apiClient = apiClient
         self.typeId = typeId
         self.deviceId = deviceId
+        self._initSnapshot('api/v0002/device/types/%s/devices/%s/diag/logs' % (typeId, deviceId), ttl, snapshotMode)
+    
+    def snapshot(self, ttl=None):
+        """
+        Get a view of the logs that downloads them once, and again after `ttl` seconds or 
+        when `refresh()` is called
+        """
+        return DeviceLogs(self._apiClient, self.typeId, self.deviceId, ttl, snapshotMode=True)
     
     def __contains__(self, key):
         """
@@ -161,16 +246,10 @@ class DeviceLogs(defaultdict):
         """
         if isinstance(key, int):
             # Special case -- allow this to be used as a dict or a list
-            # Get all, convert list to iterator
-            logsUrl = 'api/v0002/device/types/%s/devices/%s/diag/logs' % (self.typeId, self.deviceId)
-    
-            r = self._apiClient.get(logsUrl)
-            if r.status_code == 200:
-                if key > len(r.json()):
-                    self.__missing__(key)
-                return DeviceLog(**r.json()[key])
-            else:
-                raise ApiException(r)
+            entries = self._entries()
+            if key > len(entries):
+                self.__missing__(key)
+            return DeviceLog(**entries[key])
         else:
             logUrl = 'api/v0002/device/types/%s/devices/%s/diag/logs/%s' % (self.typeId, self.deviceId, key)
 
@@ -194,18 +273,14 @@ class DeviceLogs(defaultdict):
         """
         if isinstance(key, int):
             # Special case -- allow this to be used as a dict or a list
-            logsUrl = 'api/v0002/device/types/%s/devices/%s/diag/logs' % (self.typeId, self.deviceId)
-    
-            r = self._apiClient.get(logsUrl)
-            if r.status_code == 200:
-                if key > len(r.json()):
-                    self.__missing__(key)
-                key = r.json()[key]["id"]
-            else:
-                raise ApiException(r)
+            entries = self._entries()
+            if key > len(entries):
+                self.__missing__(key)
+            key = entries[key]["id"]
         
         logUrl = 'api/v0002/device/types/%s/devices/%s/diag/logs/%s' % (self.typeId, self.deviceId, key)
     
+        self.refresh()
         r = self._apiClient.delete(logUrl)
         if r.status_code == 404:
             self.__missing__(key)
@@ -220,30 +295,48 @@ class DeviceLogs(defaultdict):
 
     def __iter__(self, *args, **kwargs):
         """
-        Iterate through all devices
+        Iterate through all logs, each entry is parsed as it is reached
         """
-        
-        # Get all, convert list to iterator
-        logsUrl = 'api/v0002/device/types/%s/devices/%s/diag/logs' % (self.typeId, self.deviceId)
-
-        r = self._apiClient.get(logsUrl)
-        if r.status_code == 200:
-            logArray = []
-            for logEntry in r.json():
-                logArray.append(DeviceLog(**logEntry))
-            return iter(logArray)
-        else:
-            raise ApiException(r)
+        for logEntry in self._entries():
+            yield DeviceLog(**logEntry)
     
     def __len__(self):
-        # Get all, convert list to iterator
-        logsUrl = 'api/v0002/device/types/%s/devices/%s/diag/logs' % (self.typeId, self.deviceId)
-
-        r = self._apiClient.get(logsUrl)
-        if r.status_code == 200:
-            return len(r.json())
-        else:
-            raise ApiException(r)
+        return len(self._entries())
+    
+    def deleteMany(self, keys, concurrency=8):
+        """
+        Delete many logs concurrently.  The deletes are made as the results are consumed.
+        
+        ```python
+        oldLogs = [log.id for log in logs if log.timestamp < cutoff]
+        deleted = dict(logs.deleteMany(oldLogs))
+        ```
+        
+        # Parameters
+        keys (iterable): Log ids, or #DeviceLog objects
+        concurrency (int): Number of requests made at the same time
+        
+        # Returns
+        generator<(string, boolean)>: Each log id, and whether it was deleted (`False` if it did not exist)
+        
+        # Raises
+        ApiException: If a delete fails for a reason other than the log not existing
+        """
+        def deleteLog(key):
+            if isinstance(key, dict):
+                key = key["id"]
+            r = self._apiClient.delete('api/v0002/device/types/%s/devices/%s/diag/logs/%s' % (self.typeId, self.deviceId, key))
+            if r.status_code == 204:
+                return (key, True)
+            elif r.status_code == 404:
+                return (key, False)
+            else:
+                raise ApiException(r)
+        
+        self.refresh()
+        for result in concurrentMap(deleteLog, keys, concurrency):
+            yield result
+        self.refresh()
         
     def append(self, item = None, **kwargs):
         # Get all, convert list to iterator
@@ -251,6 +344,7 @@ class DeviceLogs(defaultdict):
         
         if item is None:
             item = DeviceLog(**kwargs)
+        self.refresh()
         r = self._apiClient.post(logsUrl, item)
         if r.status_code == 201:
             return True
@@ -261,6 +355,7 @@ class DeviceLogs(defaultdict):
         # Get all, convert list to iterator
         logsUrl = 'api/v0002/device/types/%s/devices/%s/diag/logs' % (self.typeId, self.deviceId)
 
+        self.refresh()
         r = self._apiClient.delete(logsUrl)
         if r.status_code == 204:
             return True
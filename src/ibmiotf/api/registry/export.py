@@ -0,0 +1,194 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Support Python 2.7 and 3.x versions of queue
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from ibmiotf.api.common import IterableList, ApiException, callWithRetry
+from ibmiotf.api.registry.ndjson import NdjsonWriter, writeJsonFile
+
+
+class Exporter(object):
+    """
+    Exports all device types and devices to NDJSON files, in the format used by 
+    `samples/exportTool` and read by #Reconciler and #Importer.
+    
+    Device types are written to `types.txt` and devices to `devices.txt` (with a `.gz` suffix 
+    when compressed).  The devices of each type are read concurrently and written by a single 
+    writer.  Progress is recorded in `export-checkpoint.json`: the position in the devices file 
+    and the bookmark reached for each type, so an interrupted export resumes where it stopped 
+    instead of starting over.
+    
+    ```python
+    exporter = Exporter(apiClient, "/tmp/export", compress=True)
+    print(exporter.run())
+    ```
+    
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to read the registry
+    directory (string): Directory to write the export to
+    compress (boolean): Gzip the output files.  Defaults to `False`
+    concurrency (int): Number of device types exported at the same time.  Defaults to `8`
+    pageSize (int): Number of devices requested per page.  Defaults to `100`
+    checkpointEvery (int): Number of pages written between checkpoints.  Defaults to `20`
+    """
+    
+    CHECKPOINT_FILE = "export-checkpoint.json"
+    
+    _END = object()
+    
+    def __init__(self, apiClient, directory, compress=False, concurrency=8, pageSize=IterableList.MAX_PAGE_SIZE, checkpointEvery=20):
+        self._apiClient = apiClient
+        self.directory = directory
+        self.compress = compress
+        self.concurrency = max(1, concurrency)
+        self.pageSize = pageSize
+        self.checkpointEvery = max(1, checkpointEvery)
+        
+        suffix = ".gz" if compress else ""
+        self.typesFile = os.path.join(directory, "types.txt" + suffix)
+        self.devicesFile = os.path.join(directory, "devices.txt" + suffix)
+        self.checkpointFile = os.path.join(directory, self.CHECKPOINT_FILE)
+        
+        self._closed = threading.Event()
+    
+    def run(self, resume=True):
+        """
+        Run the export
+        
+        # Parameters
+        resume (boolean): Continue from the checkpoint left by an interrupted export, if there is one
+        
+        # Returns
+        dict: The number of `types` and `devices` exported
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        
+        state = self._loadCheckpoint() if resume else None
+        if state is None:
+            for path in [self.typesFile, self.devicesFile, self.checkpointFile]:
+                if os.path.exists(path):
+                    os.remove(path)
+            state = {"typesExported": None, "devicesOffset": 0, "devicesExported": 0, "types": {}}
+        
+        if state["typesExported"] is None:
+            typeIds = self._exportTypes()
+            state["typesExported"] = len(typeIds)
+            state["types"] = dict((typeId, {"bookmark": None, "complete": False}) for typeId in typeIds)
+            self._saveCheckpoint(state)
+        
+        self._exportDevices(state)
+        return {"types": state["typesExported"], "devices": state["devicesExported"]}
+    
+    def _exportTypes(self):
+        typeIds = []
+        with NdjsonWriter(self.typesFile, compress=self.compress) as writer:
+            for deviceType in IterableList(self._apiClient, None, 'api/v0002/device/types', 'id', IterableList.MAX_PAGE_SIZE).raw():
+                writer.write({
+                    "id": deviceType["id"], 
+                    "classId": deviceType.get("classId", None) or "Device", 
+                    "description": deviceType.get("description", None), 
+                    "deviceInfo": deviceType.get("deviceInfo", None) or {}, 
+                    "metadata": deviceType.get("metadata", None) or {}
+                })
+                typeIds.append(deviceType["id"])
+        return typeIds
+    
+    def _exportDevices(self, state):
+        pending = [typeId for typeId in sorted(state["types"]) if not state["types"][typeId]["complete"]]
+        if len(pending) == 0:
+            return
+        
+        # Anything written after the last checkpoint is written again
+        writer = NdjsonWriter(self.devicesFile, compress=self.compress, offset=state["devicesOffset"])
+        buffer = queue.Queue(maxsize=4 * self.concurrency)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._closed.clear()
+        try:
+            for typeId in pending:
+                executor.submit(self._walkType, typeId, state["types"][typeId]["bookmark"], buffer)
+            
+            finished = 0
+            pagesSinceCheckpoint = 0
+            while finished < len(pending):
+                item = buffer.get()
+                if isinstance(item, Exception):
+                    raise item
+                
+                (typeId, devices, bookmark) = item
+                for device in devices:
+                    writer.write({
+                        "typeId": device["typeId"], 
+                        "deviceId": device["deviceId"], 
+                        "deviceInfo": device.get("deviceInfo", None) or {}, 
+                        "metadata": device.get("metadata", None) or {}
+                    })
+                state["devicesExported"] += len(devices)
+                if bookmark is Exporter._END:
+                    state["types"][typeId] = {"bookmark": None, "complete": True}
+                    finished += 1
+                else:
+                    state["types"][typeId]["bookmark"] = bookmark
+                
+                pagesSinceCheckpoint += 1
+                if pagesSinceCheckpoint >= self.checkpointEvery or finished == len(pending):
+                    state["devicesOffset"] = writer.checkpoint()
+                    self._saveCheckpoint(state)
+                    pagesSinceCheckpoint = 0
+        finally:
+            self._closed.set()
+            executor.shutdown(wait=False)
+            writer.close()
+    
+    def _walkType(self, typeId, bookmark, buffer):
+        url = 'api/v0002/device/types/%s/devices' % (typeId)
+        try:
+            while not self._closed.is_set():
+                parameters = {"_limit": self.pageSize, "_bookmark": bookmark, "_sort": "deviceId"}
+                r = callWithRetry(lambda: self._apiClient.get(url, parameters))
+                if r.status_code != 200:
+                    raise ApiException(r)
+                
+                page = r.json()
+                results = page["results"]
+                if "bookmark" in page and len(results) > 0:
+                    bookmark = page["bookmark"]
+                    self._put(buffer, (typeId, results, bookmark))
+                else:
+                    self._put(buffer, (typeId, results, Exporter._END))
+                    return
+        except Exception as e:
+            self._put(buffer, e)
+    
+    def _put(self, buffer, item):
+        # Wait for the writer, but give up if the export has stopped
+        while not self._closed.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+    
+    def _loadCheckpoint(self):
+        if not os.path.exists(self.checkpointFile):
+            return None
+        with open(self.checkpointFile, "r") as checkpointFile:
+            return json.load(checkpointFile)
+    
+    def _saveCheckpoint(self, state):
+        writeJsonFile(self.checkpointFile, state)
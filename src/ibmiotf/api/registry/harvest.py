@@ -0,0 +1,192 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import io
+import sys
+import csv
+import json
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from ibmiotf.api.common import ApiException, concurrentMap
+from ibmiotf.api.registry.devices import IterableDeviceScan, toDeviceUid
+from ibmiotf.api.registry.ndjson import NdjsonWriter
+
+
+class DiagnosticsHarvester(object):
+    """
+    Collects the diagnostic state of many devices at once: the diag logs, diag error codes, 
+    device management information and location of each device, the same data returned by 
+    `Device.diagLogs`, `Device.diagErrorCodes`, `Device.getMgmt()` and `Device.getLocation()`.
+    
+    Devices are processed concurrently, and the four requests for each device are made at the 
+    same time.  A request that fails or times out is recorded in the `errors` of that device's 
+    result rather than stopping the harvest.  The sections of a device that are not complete 
+    `deviceTimeout` seconds after its requests started are recorded as timed out, and their 
+    requests are abandoned.
+    
+    ```python
+    harvester = DiagnosticsHarvester(apiClient, concurrency=32, timeout=20, deviceTimeout=60)
+    summary = harvester.harvestToFile("health.csv", format="csv")
+    ```
+    
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to make the requests
+    concurrency (int): Number of devices harvested at the same time.  Defaults to `16`
+    timeout (float): Seconds to wait for each request to connect, and then for each read of its 
+        response, as the `timeout` of `requests`.  This is not a limit on the total time of a 
+        request, see `deviceTimeout`.  Defaults to `30`
+    deviceTimeout (float): Seconds allowed for all the requests of a device.  Defaults to `60`
+    """
+    
+    SECTIONS = ["logs", "errorCodes", "mgmt", "location"]
+    
+    CSV_COLUMNS = [
+        "typeId", "deviceId", "logCount", "latestLogTimestamp", "latestLogSeverity", "latestLogMessage", 
+        "errorCodeCount", "latestErrorCode", "latestErrorCodeTimestamp", "managed", "dormant", 
+        "firmwareState", "firmwareUpdateStatus", "latitude", "longitude", "locationTimestamp", "errors"
+    ]
+    
+    def __init__(self, apiClient, concurrency=16, timeout=30, deviceTimeout=60):
+        self._apiClient = apiClient
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.deviceTimeout = deviceTimeout
+    
+    def harvest(self, devices=None, ordered=False):
+        """
+        Harvest the diagnostics of a set of devices
+        
+        # Parameters
+        devices (iterable): Devices to harvest, as #Device, #DeviceRecord, #DeviceUid or `clientId`.  
+            Defaults to every device in the organization
+        ordered (boolean): Return results in input order, rather than as they complete
+        
+        # Returns
+        generator<dict>: For each device the `typeId`, `deviceId`, `logs`, `errorCodes`, `mgmt` and 
+            `location` (`None` when not available) and the `errors` that occurred, by section
+        """
+        if devices is None:
+            devices = IterableDeviceScan(self._apiClient, self.concurrency, pageSize=100).raw()
+        
+        # The sections of every device in flight are requested from one shared pool
+        sectionExecutor = ThreadPoolExecutor(max_workers=self.concurrency * len(self.SECTIONS))
+        try:
+            for result in concurrentMap(lambda device: self._harvestDevice(toDeviceUid(device), sectionExecutor), devices, self.concurrency, ordered):
+                yield result
+        finally:
+            sectionExecutor.shutdown(wait=False)
+    
+    def harvestToFile(self, path, devices=None, format="ndjson"):
+        """
+        Harvest the diagnostics of a set of devices into a single file.  `ndjson` writes every 
+        result in full, one per line, optionally gzip compressed when `path` ends `.gz`.  `csv` 
+        writes one row per device with the columns in `CSV_COLUMNS`, summarizing the latest log 
+        and error code.
+        
+        # Returns
+        dict: The number of `devices` harvested and the number with `errors`
+        """
+        summary = {"devices": 0, "errors": 0}
+        
+        if format == "ndjson":
+            with NdjsonWriter(path, compress=path.endswith(".gz")) as writer:
+                for result in self.harvest(devices):
+                    writer.write(result)
+                    self._count(summary, result)
+        elif format == "csv":
+            with self._openCsv(path) as outFile:
+                writer = csv.writer(outFile)
+                writer.writerow(self.CSV_COLUMNS)
+                for result in self.harvest(devices):
+                    writer.writerow(self.csvRow(result))
+                    self._count(summary, result)
+        else:
+            raise ValueError("Unsupported format: %s" % (format))
+        
+        return summary
+    
+    def csvRow(self, result):
+        """
+        Summarize a harvested device as a list of values in `CSV_COLUMNS` order
+        """
+        logs = result["logs"] or []
+        errorCodes = result["errorCodes"] or []
+        mgmt = result["mgmt"] or {}
+        location = result["location"] or {}
+        firmware = (mgmt.get("deviceInfo", None) or {}).get("fw", None) or {}
+        
+        latestLog = max(logs, key=lambda log: log.get("timestamp", "")) if logs else {}
+        latestErrorCode = max(errorCodes, key=lambda errorCode: errorCode.get("timestamp", "")) if errorCodes else {}
+        
+        row = [
+            result["typeId"], result["deviceId"], 
+            len(logs), latestLog.get("timestamp", None), latestLog.get("severity", None), latestLog.get("message", None),
+            len(errorCodes), latestErrorCode.get("errorCode", None), latestErrorCode.get("timestamp", None),
+            result["mgmt"] is not None, mgmt.get("dormant", None), firmware.get("state", None), firmware.get("updateStatus", None),
+            location.get("latitude", None), location.get("longitude", None), location.get("measuredDateTime", None),
+            json.dumps(result["errors"], sort_keys=True) if result["errors"] else None
+        ]
+        return ["" if value is None else value for value in row]
+    
+    def _harvestDevice(self, deviceUid, sectionExecutor):
+        deviceUrl = 'api/v0002/device/types/%s/devices/%s' % (deviceUid.typeId, deviceUid.deviceId)
+        urls = {
+            "logs": deviceUrl + "/diag/logs", 
+            "errorCodes": deviceUrl + "/diag/errorCodes", 
+            "mgmt": deviceUrl + "/mgmt", 
+            "location": deviceUrl + "/location"
+        }
+        
+        result = {"typeId": deviceUid.typeId, "deviceId": deviceUid.deviceId, "errors": {}}
+        deadline = time.time() + self.deviceTimeout
+        futures = [(section, sectionExecutor.submit(self._harvestSection, section, urls[section])) for section in self.SECTIONS]
+        for (section, future) in futures:
+            try:
+                (result[section], error) = future.result(timeout=max(0, deadline - time.time()))
+            except FutureTimeoutError:
+                # A server that keeps sending data slowly is not stopped by the read timeout
+                future.cancel()
+                (result[section], error) = (None, "Timed out")
+            if error is not None:
+                result["errors"][section] = error
+        return result
+    
+    def _harvestSection(self, section, url):
+        """
+        # Returns
+        (object, string): The section, or `None`, and the error that occurred, or `None`
+        """
+        try:
+            r = self._apiClient.get(url, timeout=self.timeout)
+            if r.status_code == 200:
+                return (r.json(), None)
+            elif r.status_code == 404 and section in ["mgmt", "location"]:
+                # It's perfectly valid for a device to not be managed or not have a location
+                return (None, None)
+            else:
+                return (None, str(ApiException(r)))
+        except requests.exceptions.Timeout:
+            return (None, "Timed out")
+        except requests.exceptions.RequestException as e:
+            return (None, str(e))
+        except ValueError as e:
+            # The response was not JSON
+            return (None, "Invalid response: %s" % (str(e)))
+    
+    def _count(self, summary, result):
+        summary["devices"] += 1
+        if result["errors"]:
+            summary["errors"] += 1
+    
+    def _openCsv(self, path):
+        if sys.version_info[0] < 3:
+            return open(path, "wb")
+        return io.open(path, "w", encoding="utf-8", newline="")
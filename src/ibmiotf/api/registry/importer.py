@@ -0,0 +1,217 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import io
+import os
+import json
+
+from ibmiotf.api.common import ApiException, callWithRetry, chunkBySize, concurrentMap
+from ibmiotf.api.registry.devices import BULK_REQUEST_MAX_BYTES, Devices
+from ibmiotf.api.registry.ndjson import readNdjson, writeJsonFile
+
+
+class Importer(object):
+    """
+    Imports device types and devices from the NDJSON files written by #Exporter or `samples/exportTool`.
+    
+    Both files are read lazily.  Device types are created concurrently, types that already exist 
+    are left as they are.  Devices are registered in bulk requests of at most `maxRequestBytes`, 
+    several at a time, so memory use does not depend on the size of the import.  Bulk requests 
+    are made and retried in the same way as #ibmiotf.api.registry.devices.Devices.createMany(), 
+    so the authentication token of a device is known even when the response to its request is 
+    lost.
+    
+    The outcome for every device, including its authentication token, is appended to 
+    `import-results.txt`, a `success` of `null` marks a device that exists after a request that 
+    failed part way, registered with the token given unless it already existed.  `import-checkpoint.json` records the line of the devices file up to 
+    which every device has been processed, so an interrupted import resumes from there.  Failed 
+    devices are reported in the results rather than stopping the import.
+    
+    ```python
+    importer = Importer(apiClient, "/tmp/export")
+    print(importer.run())
+    ```
+    
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to update the registry
+    directory (string): Directory containing `types.txt` and `devices.txt`, or their `.gz` equivalents
+    concurrency (int): Number of requests made at the same time.  Defaults to `4`
+    maxRequestBytes (int): Maximum size of each bulk registration request
+    retries (int): Number of times to retry a request that failed with a transient error.  Defaults to `3`
+    """
+    
+    CHECKPOINT_FILE = "import-checkpoint.json"
+    RESULTS_FILE = "import-results.txt"
+    
+    def __init__(self, apiClient, directory, concurrency=4, maxRequestBytes=BULK_REQUEST_MAX_BYTES, retries=3):
+        self._apiClient = apiClient
+        self._devices = Devices(apiClient)
+        self.retries = retries
+        self.directory = directory
+        self.concurrency = max(1, concurrency)
+        self.maxRequestBytes = maxRequestBytes
+        
+        self.typesFile = self._findFile("types.txt")
+        self.devicesFile = self._findFile("devices.txt")
+        self.checkpointFile = os.path.join(directory, self.CHECKPOINT_FILE)
+        self.resultsFile = os.path.join(directory, self.RESULTS_FILE)
+    
+    def _findFile(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path) and os.path.exists(path + ".gz"):
+            return path + ".gz"
+        return path
+    
+    def run(self, resume=True):
+        """
+        Run the import
+        
+        # Parameters
+        resume (boolean): Continue from the checkpoint left by an interrupted import, if there is one
+        
+        # Returns
+        dict: Counts of the `types` created, already `existing` and `failed`, and of the `devices` 
+            `registered`, `failed` and `skipped` because an earlier run already processed them
+        """
+        state = self._loadCheckpoint() if resume else None
+        if state is None:
+            for path in [self.checkpointFile, self.resultsFile]:
+                if os.path.exists(path):
+                    os.remove(path)
+            state = {"typesImported": False, "watermark": 0}
+        
+        summary = {"types": {"created": 0, "existing": 0, "failed": 0}, "devices": {"registered": 0, "failed": 0, "skipped": 0}}
+        
+        with io.open(self.resultsFile, "a", encoding="utf-8") as results:
+            if not state["typesImported"] and os.path.exists(self.typesFile):
+                self._importTypes(summary, results)
+                state["typesImported"] = True
+                self._saveCheckpoint(state)
+            
+            self._importDevices(state, summary, results)
+        
+        return summary
+    
+    def _importTypes(self, summary, results):
+        def createType(item):
+            (lineNumber, deviceType) = item
+            try:
+                r = callWithRetry(lambda: self._apiClient.post('api/v0002/device/types', deviceType), self.retries)
+            except Exception as e:
+                return (lineNumber, deviceType["id"], "failed", str(e))
+            if r.status_code == 201:
+                return (lineNumber, deviceType["id"], "created", None)
+            elif r.status_code == 409:
+                return (lineNumber, deviceType["id"], "existing", None)
+            else:
+                return (lineNumber, deviceType["id"], "failed", str(ApiException(r)))
+        
+        for (lineNumber, typeId, outcome, error) in concurrentMap(createType, readNdjson(self.typesFile), self.concurrency):
+            summary["types"][outcome] += 1
+            self._writeResult(results, {"file": "types", "line": lineNumber, "id": typeId, "success": outcome != "failed", "error": error})
+        results.flush()
+    
+    def _importDevices(self, state, summary, results):
+        # Devices after the watermark that completed before the interruption
+        done = self._processedAfter(state["watermark"])
+        
+        def pending():
+            for (lineNumber, device) in readNdjson(self.devicesFile):
+                if lineNumber <= state["watermark"] or lineNumber in done:
+                    summary["devices"]["skipped"] += 1
+                else:
+                    yield (lineNumber, device)
+        
+        def registerChunk(item):
+            (sequence, chunk) = item
+            devices = [self._devices._withAuthToken(device) for (lineNumber, device) in chunk]
+            try:
+                responses = self._devices._addChunk(devices, self.retries)
+            except Exception as e:
+                return (sequence, chunk, None, str(e))
+            return (sequence, chunk, responses, None)
+        
+        chunks = enumerate(chunkBySize(pending(), self.maxRequestBytes, payload=lambda item: item[1]))
+        
+        # Chunks complete out of order, the watermark only moves past a chunk once every 
+        # earlier chunk has completed
+        completed = {}
+        nextSequence = 0
+        for (sequence, chunk, responses, error) in concurrentMap(registerChunk, chunks, self.concurrency, ordered=False):
+            responsesByDevice = {}
+            for response in responses or []:
+                responsesByDevice[(response.get("typeId", None), response.get("deviceId", None))] = response
+            
+            for (lineNumber, device) in chunk:
+                result = {"file": "devices", "line": lineNumber, "typeId": device["typeId"], "deviceId": device["deviceId"]}
+                if error is not None:
+                    result.update({"success": False, "error": error})
+                else:
+                    response = responsesByDevice.get((device["typeId"], device["deviceId"]), {})
+                    error = response.get("error", None)
+                    result.update({"success": response.get("success", False), "authToken": response.get("authToken", None),
+                                   "error": str(error) if error is not None else response.get("message", None)})
+                summary["devices"]["failed" if result["success"] is False else "registered"] += 1
+                self._writeResult(results, result)
+            results.flush()
+            
+            completed[sequence] = chunk[-1][0]
+            while nextSequence in completed:
+                state["watermark"] = completed.pop(nextSequence)
+                nextSequence += 1
+            self._saveCheckpoint(state)
+    
+    def _processedAfter(self, watermark):
+        """
+        The lines of the devices file after `watermark` that already have a result.  The last 
+        result may have been cut short by the interruption, an incomplete or unreadable last 
+        line is truncated from the results file so that the device is imported again and new 
+        results start on a line of their own.
+        """
+        done = set()
+        if not os.path.exists(self.resultsFile):
+            return done
+        
+        with io.open(self.resultsFile, "r+b") as resultsFile:
+            offset = 0
+            tornAt = None
+            lastLine = b""
+            for line in resultsFile:
+                tornAt = None
+                lastLine = line
+                try:
+                    result = json.loads(line.decode("utf-8")) if line.strip() else None
+                except ValueError:
+                    # Only the last line can be torn, anything else that can't be read is skipped
+                    tornAt = offset
+                    result = None
+                offset += len(line)
+                if result is not None and result.get("file", None) == "devices" and result["line"] > watermark:
+                    done.add(result["line"])
+            
+            if tornAt is not None:
+                resultsFile.seek(tornAt)
+                resultsFile.truncate()
+            elif lastLine and not lastLine.endswith(b"\n"):
+                # A complete result that lost its line ending
+                resultsFile.seek(offset)
+                resultsFile.write(b"\n")
+        return done
+    
+    def _writeResult(self, results, result):
+        results.write(json.dumps(result) + u"\n")
+    
+    def _loadCheckpoint(self):
+        if not os.path.exists(self.checkpointFile):
+            return None
+        with open(self.checkpointFile, "r") as checkpointFile:
+            return json.load(checkpointFile)
+    
+    def _saveCheckpoint(self, state):
+        writeJsonFile(self.checkpointFile, state)
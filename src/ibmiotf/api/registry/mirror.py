@@ -0,0 +1,381 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import re
+import json
+import time
+import sqlite3
+import threading
+
+from ibmiotf.api.common import IterableList
+from ibmiotf.api.registry.devices import IterableDeviceScan
+
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS device_types (
+        id TEXT PRIMARY KEY,
+        classId TEXT,
+        description TEXT,
+        createdDateTime TEXT,
+        updatedDateTime TEXT,
+        json TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS devices (
+        typeId TEXT NOT NULL,
+        deviceId TEXT NOT NULL,
+        clientId TEXT,
+        description TEXT,
+        deviceClass TEXT,
+        fwVersion TEXT,
+        fwVersionSort TEXT,
+        hwVersion TEXT,
+        manufacturer TEXT,
+        model TEXT,
+        serialNumber TEXT,
+        descriptiveLocation TEXT,
+        registrationDate TEXT,
+        registrationAuthId TEXT,
+        alertEnabled INTEGER,
+        alertTimestamp TEXT,
+        updatedDateTime TEXT,
+        generation INTEGER NOT NULL,
+        json TEXT NOT NULL,
+        PRIMARY KEY (typeId, deviceId)
+    )""",
+    "CREATE INDEX IF NOT EXISTS devices_deviceId ON devices (deviceId)",
+    "CREATE INDEX IF NOT EXISTS devices_serialNumber ON devices (serialNumber)",
+    "CREATE INDEX IF NOT EXISTS devices_fwVersionSort ON devices (fwVersionSort)",
+    "CREATE INDEX IF NOT EXISTS devices_updatedDateTime ON devices (updatedDateTime)",
+    """CREATE TABLE IF NOT EXISTS device_metadata (
+        typeId TEXT NOT NULL,
+        deviceId TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value,
+        PRIMARY KEY (typeId, deviceId, key)
+    )""",
+    "CREATE INDEX IF NOT EXISTS device_metadata_key_value ON device_metadata (key, value)",
+    """CREATE TABLE IF NOT EXISTS sync_state (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )"""
+]
+
+_DEVICE_COLUMNS = [
+    "typeId", "deviceId", "clientId", "description", "deviceClass", "fwVersion", "fwVersionSort",
+    "hwVersion", "manufacturer", "model", "serialNumber", "descriptiveLocation", "registrationDate",
+    "registrationAuthId", "alertEnabled", "alertTimestamp", "updatedDateTime", "generation", "json"
+]
+
+_DEVICE_INFO_COLUMNS = ["description", "deviceClass", "fwVersion", "hwVersion", "manufacturer", "model", "serialNumber", "descriptiveLocation"]
+
+_VERSION_PART_RE = re.compile(r"\d+|[^\d.]+")
+
+
+def sortableVersion(version):
+    """
+    Convert a version string into a form that sorts correctly as text, so that
+    `"1.10"` sorts after `"1.9"`.  Numeric components are zero padded.
+    """
+    if version is None:
+        return None
+    parts = []
+    for part in _VERSION_PART_RE.findall(str(version)):
+        if part.isdigit():
+            parts.append(part.zfill(10))
+        else:
+            parts.append(part)
+    return ".".join(parts)
+
+
+class RegistryMirror(object):
+    """
+    A local SQLite copy of the device registry, so that inventory queries are answered
+    in milliseconds instead of by paging through `registry.devices`.
+
+    The mirror stores every device type and device, including `deviceInfo`, `metadata`,
+    registration and status fields.  Devices are indexed by `typeId`, `deviceId`,
+    `serialNumber` and firmware version, and the `metadata` keys listed in `metadataKeys`
+    are indexed in the `device_metadata` table.
+
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to read the registry
+    path (string): SQLite database file, use `:memory:` for a mirror that is not persisted
+    metadataKeys (list<string>): Device metadata keys to index
+    concurrency (int): Number of device types read at the same time during a full sync.  Defaults to `8`
+    syncMargin (float): Seconds before the start of a sync from which the next sync fetches
+        changes, to allow for changes made while the sync runs and for clock differences.
+        Defaults to `300`
+
+    # Synchronization
+    The first `sync()` copies the whole registry.  Later calls read devices newest first by
+    `updatedDateTime` and stop at the first device that was last changed before the previous
+    sync started, less `syncMargin`, so only changed devices are fetched.  Devices changed in the
+    margin are fetched again, which is harmless.  Deletions are only detected by a full sync,
+    `sync(full=True)`, which removes devices that no longer exist.
+
+    ```python
+    mirror = RegistryMirror(client.api.newApiClient, "registry.db", metadataKeys=["region"])
+    mirror.sync()
+    for device in mirror.findDevices(typeId="sensor", fwVersionBelow="2.1.0"):
+        print(device["clientId"])
+    ```
+    """
+
+    def __init__(self, apiClient, path=":memory:", metadataKeys=None, concurrency=8, syncMargin=300):
+        self._apiClient = apiClient
+        self.metadataKeys = set(metadataKeys or [])
+        self.concurrency = concurrency
+        self.syncMargin = syncMargin
+
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    # =========================================================================
+    # Synchronization
+    # =========================================================================
+
+    def sync(self, full=False):
+        """
+        Bring the mirror up to date with the registry
+
+        # Parameters
+        full (boolean): Copy every device and remove devices that no longer exist,
+            instead of only fetching devices changed since the last sync
+
+        # Returns
+        int: The number of devices written to the mirror
+        """
+        self.syncTypes()
+
+        highWaterMark = self._getState("devices.updatedDateTime")
+        if full or highWaterMark is None:
+            return self._fullDeviceSync()
+        else:
+            return self._incrementalDeviceSync(highWaterMark)
+
+    def syncTypes(self):
+        """
+        Replace all device types in the mirror
+        """
+        rows = []
+        for deviceType in IterableList(self._apiClient, None, 'api/v0002/device/types', 'id', IterableList.MAX_PAGE_SIZE).raw():
+            rows.append((
+                deviceType["id"], deviceType.get("classId", None), deviceType.get("description", None),
+                deviceType.get("createdDateTime", None), deviceType.get("updatedDateTime", None), json.dumps(deviceType)
+            ))
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM device_types")
+            self._connection.executemany("INSERT INTO device_types VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def _highWaterMark(self):
+        # Devices changed while a sync runs may be missed by it, so the next sync fetches
+        # everything changed since it started, in the format of updatedDateTime
+        return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() - self.syncMargin))
+
+    def _fullDeviceSync(self):
+        generation = int(self._getState("devices.generation") or 0) + 1
+        highWaterMark = self._highWaterMark()
+        count = 0
+
+        for page in IterableDeviceScan(self._apiClient, self.concurrency, pageSize=IterableList.MAX_PAGE_SIZE).pages():
+            self._writeDevices(page, generation)
+            count += len(page)
+
+        with self._lock, self._connection:
+            # Anything not seen in this pass has been removed from the registry
+            self._connection.execute(
+                "DELETE FROM device_metadata WHERE EXISTS (SELECT 1 FROM devices d WHERE d.typeId = device_metadata.typeId AND d.deviceId = device_metadata.deviceId AND d.generation < ?)",
+                (generation, )
+            )
+            self._connection.execute("DELETE FROM devices WHERE generation < ?", (generation, ))
+            self._setState("devices.generation", generation)
+            self._setState("devices.updatedDateTime", highWaterMark)
+        return count
+
+    def _incrementalDeviceSync(self, highWaterMark):
+        generation = int(self._getState("devices.generation") or 0)
+        newHighWaterMark = self._highWaterMark()
+        count = 0
+
+        changedDevices = IterableList(self._apiClient, None, 'api/v0002/bulk/devices', '-updatedDateTime', IterableList.MAX_PAGE_SIZE)
+        for page in changedDevices.pages():
+            # Devices changed at the mark itself may not have been seen by the previous sync
+            changed = [device for device in page if self._updatedDateTime(device) >= highWaterMark]
+            if len(changed) > 0:
+                self._writeDevices(changed, generation)
+                count += len(changed)
+            if len(changed) < len(page):
+                # Everything after this point is unchanged since the last sync
+                break
+
+        with self._lock, self._connection:
+            self._setState("devices.updatedDateTime", newHighWaterMark)
+        return count
+
+    def _writeDevices(self, devices, generation):
+        """
+        Upsert a page of devices
+        """
+        rows = []
+        metadataRows = []
+
+        for device in devices:
+            deviceInfo = device.get("deviceInfo", None) or {}
+            registration = device.get("registration", None) or {}
+            alert = (device.get("status", None) or {}).get("alert", None) or {}
+            updatedDateTime = self._updatedDateTime(device)
+
+            row = [device["typeId"], device["deviceId"], device.get("clientId", None)]
+            for column in _DEVICE_INFO_COLUMNS:
+                row.append(deviceInfo.get(column, None))
+                if column == "fwVersion":
+                    row.append(sortableVersion(deviceInfo.get(column, None)))
+            row.extend([
+                registration.get("date", None), (registration.get("auth", None) or {}).get("id", None),
+                None if "enabled" not in alert else int(alert["enabled"]), alert.get("timestamp", None),
+                updatedDateTime, generation, json.dumps(device)
+            ])
+            rows.append(row)
+
+            metadata = device.get("metadata", None) or {}
+            for key in self.metadataKeys:
+                if key in metadata:
+                    value = metadata[key]
+                    if isinstance(value, (dict, list)):
+                        value = json.dumps(value, sort_keys=True)
+                    metadataRows.append((device["typeId"], device["deviceId"], key, value))
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO devices (%s) VALUES (%s)" % (", ".join(_DEVICE_COLUMNS), ", ".join(["?"] * len(_DEVICE_COLUMNS))),
+                rows
+            )
+            self._connection.executemany(
+                "DELETE FROM device_metadata WHERE typeId = ? AND deviceId = ?",
+                [(device["typeId"], device["deviceId"]) for device in devices]
+            )
+            self._connection.executemany("INSERT INTO device_metadata VALUES (?, ?, ?, ?)", metadataRows)
+
+    def _updatedDateTime(self, device):
+        # Fall back to the registration date for devices that have never been updated
+        return device.get("updatedDateTime", None) or (device.get("registration", None) or {}).get("date", "")
+
+    def _getState(self, name):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM sync_state WHERE name = ?", (name, )).fetchone()
+        return None if row is None else row[0]
+
+    def _setState(self, name, value):
+        self._connection.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (name, str(value)))
+
+    # =========================================================================
+    # Queries
+    # =========================================================================
+
+    def query(self, where=None, parameters=(), orderBy="typeId, deviceId", limit=None):
+        """
+        Query the mirrored devices with an SQL `WHERE` clause over the columns of the `devices` table
+
+        ```python
+        mirror.query("manufacturer = ? AND alertEnabled = 1", ["acme"])
+        ```
+
+        # Returns
+        list<dict>: The raw JSON of each matching device
+        """
+        sql = "SELECT json FROM devices"
+        if where:
+            sql += " WHERE " + where
+        if orderBy:
+            sql += " ORDER BY " + orderBy
+        if limit is not None:
+            sql += " LIMIT %d" % int(limit)
+
+        with self._lock:
+            rows = self._connection.execute(sql, list(parameters)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iterDevices(self, batchSize=1000):
+        """
+        Iterate through all mirrored devices in `typeId, deviceId` order, reading `batchSize` 
+        rows at a time so that the whole mirror is never held in memory
+
+        # Returns
+        generator<dict>: The raw JSON of each device
+        """
+        last = None
+        while True:
+            with self._lock:
+                if last is None:
+                    rows = self._connection.execute(
+                        "SELECT typeId, deviceId, json FROM devices ORDER BY typeId, deviceId LIMIT ?", (batchSize, )
+                    ).fetchall()
+                else:
+                    rows = self._connection.execute(
+                        "SELECT typeId, deviceId, json FROM devices WHERE typeId > ? OR (typeId = ? AND deviceId > ?) ORDER BY typeId, deviceId LIMIT ?",
+                        (last[0], last[0], last[1], batchSize)
+                    ).fetchall()
+            for row in rows:
+                yield json.loads(row[2])
+            if len(rows) < batchSize:
+                return
+            last = (rows[-1][0], rows[-1][1])
+
+    def findDevices(self, typeId=None, deviceId=None, serialNumber=None, manufacturer=None, model=None,
+                    fwVersionBelow=None, fwVersionAtLeast=None, metadata=None, limit=None):
+        """
+        Find mirrored devices matching all of the supplied criteria.  `metadata` is a
+        dictionary of key/value pairs, each key must be one of the indexed `metadataKeys`.
+
+        # Returns
+        list<dict>: The raw JSON of each matching device
+        """
+        clauses = []
+        parameters = []
+        for column, value in [("typeId", typeId), ("deviceId", deviceId), ("serialNumber", serialNumber), ("manufacturer", manufacturer), ("model", model)]:
+            if value is not None:
+                clauses.append("%s = ?" % column)
+                parameters.append(value)
+        if fwVersionBelow is not None:
+            clauses.append("fwVersionSort < ?")
+            parameters.append(sortableVersion(fwVersionBelow))
+        if fwVersionAtLeast is not None:
+            clauses.append("fwVersionSort >= ?")
+            parameters.append(sortableVersion(fwVersionAtLeast))
+        for key, value in (metadata or {}).items():
+            if key not in self.metadataKeys:
+                raise KeyError("Metadata key %s is not indexed by this mirror" % (key))
+            clauses.append("EXISTS (SELECT 1 FROM device_metadata m WHERE m.typeId = devices.typeId AND m.deviceId = devices.deviceId AND m.key = ? AND m.value = ?)")
+            parameters.extend([key, value])
+
+        return self.query(" AND ".join(clauses) if clauses else None, parameters, limit=limit)
+
+    def countDevices(self, typeId=None):
+        with self._lock:
+            if typeId is None:
+                return self._connection.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+            return self._connection.execute("SELECT COUNT(*) FROM devices WHERE typeId = ?", (typeId, )).fetchone()[0]
+
+    def deviceTypes(self):
+        """
+        # Returns
+        list<dict>: The raw JSON of each mirrored device type
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT json FROM device_types ORDER BY id").fetchall()
+        return [json.loads(row[0]) for row in rows]
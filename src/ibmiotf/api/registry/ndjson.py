@@ -0,0 +1,120 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import io
+import os
+import gzip
+import json
+
+
+def openText(path, mode="r"):
+    """
+    Open a UTF-8 text file, files ending `.gz` are transparently gzip compressed
+    """
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, mode + "b"), encoding="utf-8")
+    return io.open(path, mode, encoding="utf-8")
+
+
+def readNdjson(path):
+    """
+    Lazily read a newline delimited JSON file, as written by `samples/exportTool`, one object at a time.  
+    Blank lines are skipped.
+    
+    # Returns
+    generator<(int, dict)>: The line number, counting from 1, and the object on that line
+    """
+    with openText(path, "r") as inFile:
+        lineNumber = 0
+        for line in inFile:
+            lineNumber += 1
+            if line.strip():
+                yield (lineNumber, json.loads(line))
+
+
+def writeJsonFile(path, data):
+    """
+    Replace a small JSON file, such as a checkpoint, so that it is never left half written
+    """
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath, "w") as outFile:
+        json.dump(data, outFile)
+        outFile.flush()
+        os.fsync(outFile.fileno())
+    try:
+        os.replace(temporaryPath, path)
+    except AttributeError:
+        # Python 2.x has no atomic replace on Windows
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temporaryPath, path)
+
+
+class NdjsonWriter(object):
+    """
+    Writes newline delimited JSON, optionally gzip compressed.  
+    
+    `checkpoint()` flushes everything written so far and returns the size of the file.  Opening a 
+    writer with that `offset` discards anything written after the checkpoint and continues from 
+    there, so an interrupted export can be resumed without duplicated or partial lines.  A gzip 
+    file is written as a series of gzip members, one per checkpoint, which standard gzip readers 
+    treat as a single stream.
+    
+    # Parameters
+    path (string): File to write
+    compress (boolean): Gzip the output
+    offset (int): Continue an existing file from this position.  Defaults to `0`, a new file
+    """
+    def __init__(self, path, compress=False, offset=0):
+        self.path = path
+        self.compress = compress
+        
+        self._file = io.open(path, "r+b" if offset > 0 and os.path.exists(path) else "wb")
+        self._file.seek(offset)
+        self._file.truncate()
+        self._stream = None
+        self._openStream()
+    
+    def _openStream(self):
+        if self.compress:
+            self._stream = gzip.GzipFile(fileobj=self._file, mode="wb")
+        else:
+            self._stream = self._file
+    
+    def write(self, data):
+        self._stream.write((json.dumps(data) + "\n").encode("utf-8"))
+    
+    def checkpoint(self):
+        """
+        Flush everything written so far to disk
+        
+        # Returns
+        int: The size of the file, to pass as `offset` when resuming
+        """
+        if self.compress:
+            self._stream.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        offset = self._file.tell()
+        if self.compress:
+            self._openStream()
+        return offset
+    
+    def close(self):
+        if self._file.closed:
+            return
+        if self.compress:
+            self._stream.close()
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
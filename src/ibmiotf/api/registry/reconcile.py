@@ -0,0 +1,197 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+from ibmiotf.api.common import ApiException, concurrentMap
+from ibmiotf.api.registry.devices import DeviceUid, DeviceCreateRequest, patchChanges
+from ibmiotf.api.registry.ndjson import readNdjson
+
+
+class ReconcilePlan(object):
+    """
+    The changes needed to bring the registry in line with a desired state, see #Reconciler
+    
+    # Attributes
+    typesToCreate (list<dict>): Device types to register
+    typesToUpdate (list<dict>): Device types whose description, deviceInfo or metadata differ
+    devicesToAdd (list<DeviceCreateRequest>): Devices to register
+    devicesToUpdate (list<(DeviceUid, dict)>): Devices to update, with the patch to apply
+    devicesToRemove (list<DeviceUid>): Registered devices that are not in the desired state, 
+        only populated when the #Reconciler removes unlisted devices
+    """
+    def __init__(self):
+        self.typesToCreate = []
+        self.typesToUpdate = []
+        self.devicesToAdd = []
+        self.devicesToUpdate = []
+        self.devicesToRemove = []
+    
+    def __len__(self):
+        return len(self.typesToCreate) + len(self.typesToUpdate) + len(self.devicesToAdd) + len(self.devicesToUpdate) + len(self.devicesToRemove)
+    
+    def summary(self):
+        return {
+            "typesToCreate": len(self.typesToCreate), 
+            "typesToUpdate": len(self.typesToUpdate), 
+            "devicesToAdd": len(self.devicesToAdd), 
+            "devicesToUpdate": len(self.devicesToUpdate), 
+            "devicesToRemove": len(self.devicesToRemove)
+        }
+    
+    def __str__(self):
+        return ", ".join(["%s=%s" % (key, value) for (key, value) in sorted(self.summary().items())])
+
+
+class Reconciler(object):
+    """
+    Brings the registry in line with a desired state given as the `types.txt` and `devices.txt` 
+    NDJSON files written by `samples/exportTool`.  `plan()` compares the desired state with the 
+    registry and `execute()` applies the differences, using the chunked bulk endpoints for 
+    adding and removing devices, so only devices that actually differ cost a request.
+    
+    The current state is read from a #RegistryMirror when one is supplied, otherwise from a 
+    parallel scan of the registry.  The mirror is given a full sync first, because an 
+    incremental sync does not see devices removed from the registry, and a plan made from 
+    a mirror that still holds them would update devices that no longer exist instead of 
+    adding them.
+    
+    ```python
+    reconciler = Reconciler(registry, removeUnlisted=True)
+    plan = reconciler.plan("devices.txt", "types.txt")
+    print(plan)
+    for (action, result) in reconciler.execute(plan):
+        print(action, result)
+    ```
+    
+    # Parameters
+    registry (ibmiotf.api.registry.Registry): The registry to reconcile
+    mirror (ibmiotf.api.registry.mirror.RegistryMirror): Read the current state from this mirror, optional
+    removeUnlisted (boolean): Remove registered devices that are not in the desired state.  Device types 
+        are never removed.  Defaults to `False`
+    concurrency (int): Number of requests made at the same time
+    """
+    
+    def __init__(self, registry, mirror=None, removeUnlisted=False, concurrency=8):
+        self._registry = registry
+        self._mirror = mirror
+        self.removeUnlisted = removeUnlisted
+        self.concurrency = concurrency
+    
+    def plan(self, devicesFile, typesFile=None):
+        """
+        Compare the desired state with the registry.  Only the desired devices are held in memory, 
+        the registered devices are streamed past them.
+        
+        # Parameters
+        devicesFile (string): NDJSON file of desired devices
+        typesFile (string): NDJSON file of desired device types, optional
+        
+        # Returns
+        ReconcilePlan: The changes to make
+        """
+        plan = ReconcilePlan()
+        
+        if typesFile is not None:
+            self._planTypes(plan, typesFile)
+        
+        desired = {}
+        for (lineNumber, device) in readNdjson(devicesFile):
+            desired[(device["typeId"], device["deviceId"])] = device
+        
+        for current in self._currentDevices():
+            key = (current["typeId"], current["deviceId"])
+            device = desired.pop(key, None)
+            if device is None:
+                if self.removeUnlisted:
+                    plan.devicesToRemove.append(DeviceUid(typeId=key[0], deviceId=key[1]))
+                continue
+            
+            patch = self._patch(device)
+            if patchChanges(current, patch):
+                plan.devicesToUpdate.append((DeviceUid(typeId=key[0], deviceId=key[1]), patch))
+        
+        for (typeId, deviceId) in sorted(desired.keys()):
+            device = desired[(typeId, deviceId)]
+            plan.devicesToAdd.append(DeviceCreateRequest(
+                typeId=typeId, deviceId=deviceId, authToken=device.get("authToken", None), 
+                deviceInfo=device.get("deviceInfo", None), location=device.get("location", None), metadata=device.get("metadata", None)
+            ))
+        
+        return plan
+    
+    def execute(self, plan):
+        """
+        Apply a plan: device types are created and updated first, then devices are added, 
+        updated and removed.  Failures for individual device types and devices are reported 
+        in the results rather than stopping the run.
+        
+        # Returns
+        generator<(string, object)>: Pairs of the action (`createType`, `updateType`, `add`, `update` 
+            or `remove`) and its result, a #DeviceType (or the #ApiException raised for it), 
+            #DeviceCreateResponse, #DeviceUpdateResult, or the bulk remove result for the device
+        """
+        devicetypes = self._registry.devicetypes
+        devices = self._registry.devices
+        
+        createType = lambda deviceType: devicetypes.create(deviceType)
+        for result in concurrentMap(self._catchApiException(createType), plan.typesToCreate, self.concurrency):
+            yield ("createType", result)
+        
+        updateType = lambda deviceType: devicetypes.update(deviceType["id"], deviceType.get("description", None), deviceType.get("deviceInfo", None), deviceType.get("metadata", None))
+        for result in concurrentMap(self._catchApiException(updateType), plan.typesToUpdate, self.concurrency):
+            yield ("updateType", result)
+        
+        for response in devices.createMany(plan.devicesToAdd, self.concurrency):
+            yield ("add", response)
+        
+        for result in devices.updateMany(plan.devicesToUpdate, self.concurrency, skipUnchanged=False):
+            yield ("update", result)
+        
+        for response in devices.deleteMany(plan.devicesToRemove, self.concurrency):
+            yield ("remove", response)
+    
+    def _catchApiException(self, function):
+        def call(item):
+            try:
+                return function(item)
+            except ApiException as e:
+                return e
+        return call
+    
+    def _planTypes(self, plan, typesFile):
+        currentTypes = {}
+        for deviceType in self._currentTypes():
+            currentTypes[deviceType["id"]] = deviceType
+        
+        for (lineNumber, deviceType) in readNdjson(typesFile):
+            current = currentTypes.get(deviceType["id"], None)
+            if current is None:
+                plan.typesToCreate.append(deviceType)
+            else:
+                for key in ["description", "deviceInfo", "metadata"]:
+                    if (deviceType.get(key, None) or None) != (current.get(key, None) or None):
+                        plan.typesToUpdate.append(deviceType)
+                        break
+    
+    def _currentTypes(self):
+        if self._mirror is not None:
+            self._mirror.syncTypes()
+            return self._mirror.deviceTypes()
+        return self._registry.devicetypes.iter(pageSize=100).raw()
+    
+    def _currentDevices(self):
+        if self._mirror is not None:
+            self._mirror.sync(full=True)
+            return self._mirror.iterDevices()
+        return self._registry.devices.scan(self.concurrency, pageSize=100).raw()
+    
+    def _patch(self, device):
+        patch = {"metadata": device.get("metadata", None) or {}}
+        if device.get("deviceInfo", None):
+            patch["deviceInfo"] = device["deviceInfo"]
+        return patch
@@ -1,17 +1,18 @@
 import json
 from collections import defaultdict
 
-from ibmiotf.api.common import IterableList
+from ibmiotf.api.common import IterableList, callWithRetry, concurrentMap
 from ibmiotf.api.registry.devices import Devices
 from ibmiotf.api.common import ApiException
 
 class IterableDeviceTypeList(IterableList):
-    def __init__(self, apiClient):
-        super(IterableDeviceTypeList, self).__init__(apiClient, DeviceType, 'api/v0002/device/types')
+    def __init__(self, apiClient, pageSize=None, prefetch=True, cache=None):
+        castToDeviceType = lambda apiClient, data: DeviceType(apiClient, data, cache)
+        super(IterableDeviceTypeList, self).__init__(apiClient, castToDeviceType, 'api/v0002/device/types', None, pageSize, prefetch)
               
       
 class DeviceType(object):
-    def __init__(self, apiClient, data):
+    def __init__(self, apiClient, data, cache=None):
         self._apiClient = apiClient
         self._data = data
         
@@ -21,7 +22,7 @@ class DeviceType(object):
         #"api/v0002/device/types/LCT003/mappings", "physicalInterface": "api/v0002/device/types/LCT003/physicalinterface"}, 
         #"updatedDateTime": "2017-02-27T10:27:04.221Z"}
         
-        self.devices = Devices(apiClient, data["id"])
+        self.devices = Devices(apiClient, data["id"], cache)
         
     @property
     def id(self):
@@ -50,8 +51,9 @@ class DeviceType(object):
 
 class DeviceTypes(defaultdict):
     
-    def __init__(self, apiClient):
+    def __init__(self, apiClient, cache=None):
         self._apiClient = apiClient
+        self._cache = cache
     
     def __contains__(self, key):
         """
@@ -59,6 +61,9 @@ class DeviceTypes(defaultdict):
         """
         
         url = 'api/v0002/device/types/%s' % (key)
+        
+        if self._cache is not None:
+            return self._cache.fetch(self._apiClient, url) is not None
 
         r = self._apiClient.get(url)
         if r.status_code == 200:
@@ -73,10 +78,16 @@ class DeviceTypes(defaultdict):
         get a device type from the registry
         """
         url = 'api/v0002/device/types/%s' % (key)
+        
+        if self._cache is not None:
+            data = self._cache.fetch(self._apiClient, url)
+            if data is None:
+                self.__missing__(key)
+            return DeviceType(self._apiClient, data, self._cache)
 
         r = self._apiClient.get(url)
         if r.status_code == 200:
-            return DeviceType(self._apiClient, r.json())
+            return DeviceType(self._apiClient, r.json(), self._cache)
         elif r.status_code == 404:
             self.__missing__(key)
         else:
@@ -93,32 +104,76 @@ class DeviceTypes(defaultdict):
         delete a device type
         """
         url = 'api/v0002/device/types/%s' % (key)
-
-        r = self._apiClient.delete(url)
+        r = self._write(url, lambda: self._apiClient.delete(url))
         if r.status_code != 204:
             raise ApiException(r)
     
+    def _write(self, url, request):
+        """
+        Make a request that changes the device type at `url`, removing it from the cache 
+        before and after the request, see #Devices._write()
+        """
+        if self._cache is not None:
+            self._cache.invalidate(url)
+        try:
+            return request()
+        finally:
+            if self._cache is not None:
+                self._cache.invalidate(url)
+    
     def __missing__(self, key):
         """
         device type does not exist
         """
         raise KeyError("Device type %s does not exist" % (key))
     
-    def __iter__(self, *args, **kwargs):
+    def getMany(self, keys, concurrency=16, ordered=True, retries=3):
         """
-        iterate through all devices
+        Get many device types concurrently, see #Devices.getMany()
+        
+        # Returns
+        generator<(string, DeviceType)>: Each key with its device type, or `None` if the device type does not exist
         """
-        return IterableDeviceTypeList(self._apiClient)
+        def getDeviceType(key):
+            url = 'api/v0002/device/types/%s' % (key)
+            if self._cache is not None:
+                data = self._cache.fetch(self._apiClient, url)
+                return (key, None if data is None else DeviceType(self._apiClient, data, self._cache))
+            
+            r = callWithRetry(lambda: self._apiClient.get(url), retries)
+            if r.status_code == 200:
+                return (key, DeviceType(self._apiClient, r.json(), self._cache))
+            elif r.status_code == 404:
+                return (key, None)
+            else:
+                raise ApiException(r)
+        
+        return concurrentMap(getDeviceType, keys, concurrency, ordered)
+    
+    def __iter__(self):
+        """
+        iterate through all device types
+        """
+        return self.iter()
+    
+    def iter(self, pageSize=None, prefetch=True):
+        """
+        iterate through all device types, using `pageSize` results per request, see #Devices.iter()
+        
+        # Returns
+        IterableDeviceTypeList: The device types, which also offers `pages()` and `raw()`
+        """
+        return IterableDeviceTypeList(self._apiClient, pageSize=pageSize, prefetch=prefetch, cache=self._cache)
     
     def create(self, deviceType):
         """
         Register one or more new device types, each request can contain a maximum of 512KB.
         """
-        
-        r = self._apiClient.post('api/v0002/device/types', deviceType)
+        url = 'api/v0002/device/types/%s' % (deviceType["id"])
+        r = self._write(url, lambda: self._apiClient.post('api/v0002/device/types', deviceType))
 
         if r.status_code == 201:
-            return DeviceType(self._apiClient, r.json())
+            return DeviceType(self._apiClient, r.json(), self._cache)
         else:
             raise ApiException(r)
     
@@ -127,9 +182,9 @@ class DeviceTypes(defaultdict):
 
         data = {'description' : description, 'deviceInfo' : deviceInfo, 'metadata': metadata}
         
-        r = self._apiClient.put(devicetypeUrl, data)
+        r = self._write(devicetypeUrl, lambda: self._apiClient.put(devicetypeUrl, data))
         if r.status_code == 200:
-            return DeviceType(self._apiClient, r.json())
+            return DeviceType(self._apiClient, r.json(), self._cache)
         else:
             raise ApiException(r)
         
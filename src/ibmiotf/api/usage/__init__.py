@@ -7,9 +7,27 @@
 # http://www.eclipse.org/legal/epl-v10.html
 # *****************************************************************************
 
-from datetime import datetime
+import os
+import json
+import threading
+from datetime import date, datetime, timedelta
 from collections import defaultdict
-from ibmiotf.api.common import ApiClient, ApiException
+from ibmiotf.api.common import ApiClient, ApiException, callWithRetry, concurrentMap
+from ibmiotf.api.registry.ndjson import writeJsonFile
+
+
+def parseDate(value):
+    """
+    Parse a `YYYY-MM-DD` date as returned by the usage API, much faster than `strptime`
+    """
+    return date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+
+
+def _toDate(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
 
 class DataTransferSummary(defaultdict):
     def __init__(self, **kwargs):
@@ -19,14 +37,20 @@ class DataTransferSummary(defaultdict):
                 daysAsObj.append(DayDataTransfer(**day))
             del kwargs["days"]
         dict.__init__(self, days=daysAsObj, **kwargs)
+        self._start = None
+        self._end = None
     
     @property
     def start(self):
-        return datetime.strptime(self["start"], "%Y-%m-%d").date()
+        if self._start is None:
+            self._start = parseDate(self["start"])
+        return self._start
         
     @property
     def end(self):
-        return datetime.strptime(self["end"], "%Y-%m-%d").date()
+        if self._end is None:
+            self._end = parseDate(self["end"])
+        return self._end
     
     @property
     def average(self):
@@ -43,20 +67,216 @@ class DataTransferSummary(defaultdict):
 class DayDataTransfer(defaultdict):
     def __init__(self, **kwargs):
         dict.__init__(self, **kwargs)
+        self._date = None
     
     @property
     def date(self):
-        return datetime.strptime(self["date"], "%Y-%m-%d").date()
+        if self._date is None:
+            self._date = parseDate(self["date"])
+        return self._date
         
     @property
     def total(self):
         return self["total"]
 
 
+class DataTransferColumns(object):
+    """
+    Daily data transfer held as two parallel lists, `dates` and `totals`, rather than an object 
+    per day.  Iterating yields `(date, total)` pairs in date order.
+    
+    ```python
+    usage = api.usage.dataTransferColumns(date(2018, 1, 1), date(2018, 12, 31))
+    print(usage.total, max(usage.totals))
+    ```
+    """
+    __slots__ = ["dates", "totals"]
+    
+    def __init__(self, dates, totals):
+        self.dates = dates
+        self.totals = totals
+    
+    @property
+    def start(self):
+        return self.dates[0] if self.dates else None
+    
+    @property
+    def end(self):
+        return self.dates[-1] if self.dates else None
+    
+    @property
+    def total(self):
+        return sum(self.totals)
+    
+    @property
+    def average(self):
+        return self.total // len(self.totals) if self.totals else 0
+    
+    def get(self, day):
+        """
+        # Returns
+        int: The data transferred on a day, or `None` if the day is not in the range
+        """
+        day = _toDate(day)
+        if not self.dates or day < self.dates[0] or day > self.dates[-1]:
+            return None
+        index = (day - self.dates[0]).days
+        if index < len(self.dates) and self.dates[index] == day:
+            return self.totals[index]
+        # The range has gaps, fall back to a search
+        for (candidate, total) in self:
+            if candidate == day:
+                return total
+        return None
+    
+    def __len__(self):
+        return len(self.dates)
+    
+    def __iter__(self):
+        return iter(zip(self.dates, self.totals))
+
+
+class UsageCache(object):
+    """
+    A file backed cache of the daily data transfer of one organization.  Only days that are 
+    complete are stored: a day is treated as complete `settleDays` days after it ends (UTC), 
+    to allow for late reported usage, and from then on it is never requested again.
+    
+    # Parameters
+    directory (string): Directory the cache file is kept in, it is created if necessary
+    host (string): API host of the organization, used to name the cache file
+    settleDays (int): Days to wait after a day ends before treating it as complete.  Defaults to `2`
+    """
+    def __init__(self, directory, host, settleDays=2):
+        self.directory = directory
+        self.path = os.path.join(directory, "data-traffic-%s.json" % (host))
+        self.settleDays = settleDays
+        self._days = None
+        self._lock = threading.Lock()
+    
+    def _load(self):
+        if self._days is None:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as inFile:
+                    self._days = json.load(inFile)
+            else:
+                self._days = {}
+        return self._days
+    
+    def isComplete(self, day):
+        return day <= datetime.utcnow().date() - timedelta(days=self.settleDays)
+    
+    def get(self, day):
+        """
+        # Returns
+        int: The cached total for the day, or `None` if it is not cached
+        """
+        with self._lock:
+            return self._load().get(day.isoformat(), None)
+    
+    def putMany(self, days):
+        """
+        Store `(date, total)` pairs, ignoring days that are not complete yet
+        """
+        with self._lock:
+            cached = self._load()
+            changed = False
+            for (day, total) in days:
+                if self.isComplete(day) and cached.get(day.isoformat(), None) != total:
+                    cached[day.isoformat()] = total
+                    changed = True
+            if changed:
+                if not os.path.exists(self.directory):
+                    os.makedirs(self.directory)
+                writeJsonFile(self.path, cached)
+    
+    def clear(self):
+        with self._lock:
+            self._days = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
 class Usage():
 
+    # Longest range requested at once when a range is split into sub-requests
+    MAX_RANGE_DAYS = 31
+
     def __init__(self, apiClient):
         self._apiClient = apiClient
+        self.cache = None
+    
+    def enableCache(self, directory, settleDays=2):
+        """
+        Keep complete days in a #UsageCache so that `dataTransferColumns()` only requests days 
+        that are not cached or may still change
+        
+        ```python
+        api.usage.enableCache(os.path.expanduser("~/.wiotp/usage"))
+        usage = api.usage.dataTransferColumns(date.today() - timedelta(days=395), date.today())
+        ```
+        """
+        self.cache = UsageCache(directory, self._apiClient.host, settleDays)
+        return self.cache
+    
+    def dataTransferColumns(self, start, end, concurrency=4):
+        """
+        Retrieve the daily data transfer between two dates (inclusive) as #DataTransferColumns.  
+        The range is split into sub-requests of at most `MAX_RANGE_DAYS` days that are made 
+        concurrently.  When a cache is enabled, see `enableCache()`, only the days that are not 
+        cached are requested and the complete days received are added to the cache.
+        
+        # Parameters
+        start (date): First day
+        end (date): Last day
+        concurrency (int): Number of sub-requests made at the same time
+        
+        # Returns
+        DataTransferColumns: The total for each day
+        
+        # Raises
+        ApiException: If a sub-request fails
+        """
+        start = _toDate(start)
+        end = _toDate(end)
+        
+        days = {}
+        ranges = []
+        rangeStart = None
+        day = start
+        while day <= end:
+            cached = self.cache.get(day) if self.cache is not None and self.cache.isComplete(day) else None
+            if cached is not None:
+                days[day] = cached
+                if rangeStart is not None:
+                    ranges.append((rangeStart, day - timedelta(days=1)))
+                    rangeStart = None
+            elif rangeStart is None:
+                rangeStart = day
+            elif (day - rangeStart).days >= self.MAX_RANGE_DAYS:
+                ranges.append((rangeStart, day - timedelta(days=1)))
+                rangeStart = day
+            day += timedelta(days=1)
+        if rangeStart is not None:
+            ranges.append((rangeStart, end))
+        
+        fetched = []
+        for rangeDays in concurrentMap(lambda dateRange: self._fetchDays(dateRange[0], dateRange[1]), ranges, concurrency, ordered=False):
+            fetched.extend(rangeDays)
+        days.update(fetched)
+        if self.cache is not None and fetched:
+            self.cache.putMany(fetched)
+        
+        dates = sorted(days)
+        return DataTransferColumns(dates, [days[day] for day in dates])
+    
+    def _fetchDays(self, start, end):
+        url = 'api/v0002/usage/data-traffic?start=%s&end=%s&detail=true' % (start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+        r = callWithRetry(lambda: self._apiClient.get(url))
+        if r.status_code == 200:
+            return [(parseDate(day["date"]), day["total"]) for day in r.json().get("days", [])]
+        else:
+            raise ApiException(r)
         
     
     def dataTransfer(self, start, end, detail=False):
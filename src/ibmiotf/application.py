@@ -11,12 +11,19 @@ import os
 import re
 import json
 import iso8601
+import logging
+import time
 import uuid
+import threading
 from datetime import datetime
+from collections import namedtuple, OrderedDict
 
 from ibmiotf import HttpAbstractClient, ConnectionException, MissingMessageEncoderException
 from ibmiotf.codecs import jsonCodec
 import ibmiotf.api
+from ibmiotf.api.common import concurrentMap
+from ibmiotf.api.registry.devices import IterableDeviceList, toDeviceUid
+from ibmiotf.api.registry.connections import CLOSE_CODE_CLIENT_ID_REUSED, ConnectionLogFetcher, toEpoch
 import paho.mqtt.client as paho
 
 import requests
@@ -33,58 +40,110 @@ DEVICE_COMMAND_RE = re.compile("iot-2/type/(.+)/id/(.+)/cmd/(.+)/fmt/(.+)")
 DEVICE_STATUS_RE = re.compile("iot-2/type/(.+)/id/(.+)/mon")
 APP_STATUS_RE = re.compile("iot-2/app/(.+)/mon")
 
-class Status:
+class Status(object):
+    """
+    A device status message.  Only the topic is parsed when the message is received, the 
+    payload is decoded the first time a field is read and the timestamps are parsed the first 
+    time they are read, so consumers that only look at a couple of fields pay only for those.
+    
+    Properties from the "Connect" status are common in "Disconnect" status too
+    ```
+    {
+    u'ClientAddr': u'195.212.29.68',
+    u'Protocol': u'mqtt-tcp',
+    u'ClientID': u'd:bcaxk:psutil:001',
+    u'User': u'use-token-auth',
+    u'Time': u'2014-07-07T06:37:56.494-04:00',
+    u'Action': u'Connect',
+    u'ConnectTime': u'2014-07-07T06:37:56.493-04:00',
+    u'Port': 1883
+    }
+    ```
+    
+    Additional "Disconnect" status properties
+    ```
+    {
+    u'WriteMsg': 0,
+    u'ReadMsg': 872,
+    u'Reason': u'The connection has completed normally.',
+    u'ReadBytes': 136507,
+    u'WriteBytes': 32,
+    u'CloseCode': 0
+    }
+    ```
+    """
     def __init__(self, message):
         result = DEVICE_STATUS_RE.match(message.topic)
         if result:
-            self.payload = json.loads(message.payload.decode("utf-8"))
+            self._rawPayload = message.payload
+            self._payload = None
+            self._time = None
+            self._connectTime = None
             self.deviceType = result.group(1)
             self.deviceId = result.group(2)
-            self.device = self.deviceType + ":" + self.deviceId
-
-            '''
-            Properties from the "Connect" status are common in "Disconnect" status too
-            {
-            u'ClientAddr': u'195.212.29.68',
-            u'Protocol': u'mqtt-tcp',
-            u'ClientID': u'd:bcaxk:psutil:001',
-            u'User': u'use-token-auth',
-            u'Time': u'2014-07-07T06:37:56.494-04:00',
-            u'Action': u'Connect',
-            u'ConnectTime': u'2014-07-07T06:37:56.493-04:00',
-            u'Port': 1883
-            }
-            '''
-
-            self.clientAddr = self.payload['ClientAddr'] if ('ClientAddr' in self.payload) else None
-            self.protocol = self.payload['Protocol'] if ('Protocol' in self.payload) else None
-            self.clientId = self.payload['ClientID'] if ('ClientID' in self.payload) else None
-            self.user = self.payload['User'] if ('User' in self.payload) else None
-            self.time = iso8601.parse_date(self.payload['Time']) if ('Time' in self.payload) else None
-            self.action = self.payload['Action'] if ('Action' in self.payload) else None
-            self.connectTime = iso8601.parse_date(self.payload['ConnectTime']) if ('ConnectTime' in self.payload) else None
-            self.port = self.payload['Port'] if ('Port' in self.payload) else None
-
-            '''
-            Additional "Disconnect" status properties
-            {
-            u'WriteMsg': 0,
-            u'ReadMsg': 872,
-            u'Reason': u'The connection has completed normally.',
-            u'ReadBytes': 136507,
-            u'WriteBytes': 32,
-            }
-            '''
-            self.writeMsg = self.payload['WriteMsg'] if ('WriteMsg' in self.payload) else None
-            self.readMsg = self.payload['ReadMsg'] if ('ReadMsg' in self.payload) else None
-            self.reason = self.payload['Reason'] if ('Reason' in self.payload) else None
-            self.readBytes = self.payload['ReadBytes'] if ('ReadBytes' in self.payload) else None
-            self.writeBytes = self.payload['WriteBytes'] if ('WriteBytes' in self.payload) else None
-            self.closeCode = self.payload['CloseCode'] if ('CloseCode' in self.payload) else None
             self.retained = message.retain
-
         else:
             raise ibmiotf.InvalidEventException("Received device status on invalid topic: %s" % (message.topic))
+    
+    @property
+    def payload(self):
+        if self._payload is None:
+            self._payload = json.loads(self._rawPayload.decode("utf-8"))
+        return self._payload
+    
+    @property
+    def device(self):
+        return self.deviceType + ":" + self.deviceId
+    
+    @property
+    def clientAddr(self):
+        return self.payload.get('ClientAddr', None)
+    @property
+    def protocol(self):
+        return self.payload.get('Protocol', None)
+    @property
+    def clientId(self):
+        return self.payload.get('ClientID', None)
+    @property
+    def user(self):
+        return self.payload.get('User', None)
+    @property
+    def action(self):
+        return self.payload.get('Action', None)
+    @property
+    def port(self):
+        return self.payload.get('Port', None)
+    
+    @property
+    def time(self):
+        if self._time is None and 'Time' in self.payload:
+            self._time = iso8601.parse_date(self.payload['Time'])
+        return self._time
+    
+    @property
+    def connectTime(self):
+        if self._connectTime is None and 'ConnectTime' in self.payload:
+            self._connectTime = iso8601.parse_date(self.payload['ConnectTime'])
+        return self._connectTime
+    
+    @property
+    def writeMsg(self):
+        return self.payload.get('WriteMsg', None)
+    @property
+    def readMsg(self):
+        return self.payload.get('ReadMsg', None)
+    @property
+    def reason(self):
+        return self.payload.get('Reason', None)
+    @property
+    def readBytes(self):
+        return self.payload.get('ReadBytes', None)
+    @property
+    def writeBytes(self):
+        return self.payload.get('WriteBytes', None)
+    @property
+    def closeCode(self):
+        return self.payload.get('CloseCode', None)
 
 
 class Event:
@@ -99,6 +158,9 @@ class Event:
             self.format = result.group(4)
 
             self.payload = pahoMessage.payload
+            
+            # Set for events loaded from the last event cache, see Client.enableWarmStart()
+            self.cached = False
 
             if self.format in messageEncoderModules:
                 message = messageEncoderModules[self.format].decode(pahoMessage)
@@ -133,6 +195,275 @@ class Command:
             raise ibmiotf.InvalidEventException("Received device event on invalid topic: %s" % (pahoMessage.topic))
 
 
+class CachedEventMessage(object):
+    """
+    Presents a #ibmiotf.api.lec.LastEvent from the last event cache in the shape of a received 
+    MQTT message, so that it can be decoded by the registered message codecs
+    """
+    def __init__(self, lastEvent):
+        self.topic = 'iot-2/type/%s/id/%s/evt/%s/fmt/%s' % (lastEvent.typeId, lastEvent.deviceId, lastEvent.eventId, lastEvent.format)
+        self.payload = lastEvent.decodedPayload
+        self.qos = 0
+        self.retain = False
+
+
+class DeviceState(object):
+    """
+    The latest event of each type from each device, maintained by #Client when warm start is 
+    enabled.  An event only replaces the stored event when it is at least as recent, so older 
+    events that arrive late are discarded.
+    
+    The timestamps of the two kinds of event come from different clocks: a live event carries 
+    the time it was received by this client, a cached event the time the platform received it.  
+    They are only compared when there is no better way to order the events:
+    
+    - Live events are stored in the order they are received.
+    - A cached event never replaces a live event received on the current connection, because 
+      every event published after the subscription was made is received live.
+    - Cached events are ordered by their platform timestamps.  A cached event is compared with a 
+      live event from an earlier connection by timestamp, which is only as accurate as the 
+      agreement between the local clock and the platform's.
+    """
+    def __init__(self):
+        self._events = {}
+        # The connection each stored live event was received on, see newConnection()
+        self._liveConnections = {}
+        self._connection = 0
+        self._lock = threading.Lock()
+    
+    def newConnection(self):
+        """
+        Start a new connection, live events stored from now on take precedence over cached events
+        """
+        with self._lock:
+            self._connection += 1
+    
+    def update(self, event):
+        """
+        Store an event if it is not older than the stored event for the same device and eventId
+        
+        # Returns
+        boolean: `True` if the event was stored, `False` if it was discarded as out of date
+        """
+        key = (event.deviceType, event.deviceId, event.event)
+        with self._lock:
+            current = self._events.get(key, None)
+            if current is not None and self._isOlder(event, current, self._liveConnections.get(key, None)):
+                return False
+            self._events[key] = event
+            if event.cached:
+                self._liveConnections.pop(key, None)
+            else:
+                self._liveConnections[key] = self._connection
+            return True
+    
+    def _isOlder(self, event, current, liveConnection):
+        if not event.cached:
+            # Live events are delivered in the order they are received
+            return False
+        if liveConnection == self._connection:
+            return True
+        if event.timestamp is None or current.timestamp is None:
+            return False
+        try:
+            return event.timestamp < current.timestamp
+        except TypeError:
+            # Can't compare timezone aware and naive timestamps, prefer the new event
+            return False
+    
+    def get(self, deviceType, deviceId, event):
+        """
+        # Returns
+        Event: The latest event, or `None`
+        """
+        with self._lock:
+            return self._events.get((deviceType, deviceId, event), None)
+    
+    def getDevice(self, deviceType, deviceId):
+        """
+        # Returns
+        dict: The latest event of each eventId from the device
+        """
+        with self._lock:
+            return dict((key[2], event) for (key, event) in self._events.items() if key[0] == deviceType and key[1] == deviceId)
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._events)
+    
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._events.values()))
+
+
+# Support Python 2.7 and 3.x locations of intern
+try:
+    from sys import intern as _intern
+except ImportError:
+    _intern = intern
+
+# The connection state of one device held by ConnectionStateTracker: whether it is connected, 
+# the time of the last change (seconds since the epoch), the address it last connected from 
+# and the close code of its last disconnect
+ConnectionState = namedtuple("ConnectionState", ["connected", "lastChange", "clientAddr", "closeCode"])
+
+
+class ConnectionStateTracker(object):
+    """
+    Tracks which devices are connected from the device status stream, see 
+    `Client.trackConnectionState()`.  One small record is kept per device, keyed by interned 
+    `(typeId, deviceId)`, and the number of connected devices is maintained as states change, 
+    so `onlineCount`, `isConnected()` and `get()` are constant time regardless of fleet size.  
+    A fleet of 1M devices needs roughly 350MB; set `maxDevices` to put a hard limit on the 
+    number of devices tracked, status for further devices is then counted in `overflow` and 
+    otherwise ignored.
+    
+    Status messages older than the state already held for a device are ignored, as are the 
+    disconnect messages sent when a client ID is reused (close code 288) unless retained, 
+    because they can arrive after the connect status of the new connection.
+    
+    ```python
+    tracker = client.trackConnectionState()
+    tracker.seed(client.api.registry.devices.scan())
+    print("%s of %s devices online" % (tracker.onlineCount, len(tracker)))
+    ```
+    
+    # Parameters
+    apiClient (ibmiotf.api.common.ApiClient): Client used to seed the state from the connection 
+        logs, optional
+    maxDevices (int): Maximum number of devices to track, optional.  Defaults to no limit
+    """
+    def __init__(self, apiClient=None, maxDevices=None):
+        self._apiClient = apiClient
+        self.maxDevices = maxDevices
+        self._states = {}
+        self._online = 0
+        self.overflow = 0
+        self._lock = threading.Lock()
+    
+    def _key(self, typeId, deviceId):
+        return (_intern(str(typeId)), _intern(str(deviceId)))
+    
+    def update(self, status):
+        """
+        Apply a device status message
+        
+        # Parameters
+        status (Status): The status message
+        
+        # Returns
+        boolean: `True` if the state of the device was updated, `False` if the message was ignored
+        """
+        closeCode = status.closeCode
+        if closeCode == CLOSE_CODE_CLIENT_ID_REUSED and not status.retained:
+            return False
+        
+        payload = status.payload
+        timestamp = toEpoch(status.time) if 'Time' in payload else time.time()
+        clientAddr = status.clientAddr
+        return self._set(status.deviceType, status.deviceId, status.action == "Connect", timestamp, clientAddr, closeCode)
+    
+    def _set(self, typeId, deviceId, connected, timestamp, clientAddr, closeCode):
+        key = self._key(typeId, deviceId)
+        if clientAddr is not None:
+            clientAddr = _intern(str(clientAddr))
+        
+        with self._lock:
+            current = self._states.get(key, None)
+            if current is None:
+                if self.maxDevices is not None and len(self._states) >= self.maxDevices:
+                    self.overflow += 1
+                    return False
+            elif current.lastChange > timestamp:
+                return False
+            elif current.connected:
+                self._online -= 1
+            
+            if connected:
+                self._online += 1
+            elif clientAddr is None and current is not None:
+                clientAddr = current.clientAddr
+            self._states[key] = ConnectionState(connected, timestamp, clientAddr, closeCode)
+            return True
+    
+    def get(self, typeId, deviceId):
+        """
+        # Returns
+        ConnectionState: The state of the device, or `None` if no status has been seen for it
+        """
+        return self._states.get(self._key(typeId, deviceId), None)
+    
+    def isConnected(self, typeId, deviceId):
+        """
+        # Returns
+        boolean: Whether the device is connected, `False` when its state is unknown
+        """
+        state = self._states.get(self._key(typeId, deviceId), None)
+        return state is not None and state.connected
+    
+    @property
+    def onlineCount(self):
+        return self._online
+    
+    @property
+    def offlineCount(self):
+        return len(self._states) - self._online
+    
+    def online(self):
+        """
+        # Returns
+        list<(string, string)>: The `(typeId, deviceId)` of every connected device
+        """
+        with self._lock:
+            return [key for (key, state) in self._states.items() if state.connected]
+    
+    def __contains__(self, key):
+        return (key[0], key[1]) in self._states
+    
+    def __len__(self):
+        return len(self._states)
+    
+    def __iter__(self):
+        """
+        Iterate through a copy of the table as `((typeId, deviceId), ConnectionState)`
+        """
+        with self._lock:
+            return iter(list(self._states.items()))
+    
+    def seed(self, devices, concurrency=16):
+        """
+        Fill in the state of devices from their connection logs, typically once at startup so 
+        that devices which connected before the application subscribed are known.  Only the 
+        latest log entry of each device is used, and it never replaces state that is newer.
+        
+        # Parameters
+        devices (iterable): Devices to seed, as #Device, #DeviceRecord, #DeviceUid or `clientId`
+        concurrency (int): Number of devices fetched at the same time
+        
+        # Returns
+        int: The number of devices whose state was updated
+        
+        # Raises
+        ApiException: If the connection logs of a device can not be retrieved
+        """
+        if self._apiClient is None:
+            raise ibmiotf.ConfigurationException("Seeding connection state requires an API client")
+        
+        fetcher = ConnectionLogFetcher(self._apiClient, concurrency)
+        seeded = 0
+        for updated in concurrentMap(lambda device: self._seedDevice(fetcher, toDeviceUid(device)), devices, concurrency, ordered=False):
+            if updated:
+                seeded += 1
+        return seeded
+    
+    def _seedDevice(self, fetcher, deviceUid):
+        events = [event for event in fetcher.fetchDevice(deviceUid) if event.connected is not None]
+        if not events:
+            return False
+        latest = events[-1]
+        return self._set(deviceUid.typeId, deviceUid.deviceId, latest.connected, latest.timestamp, latest.clientAddr, None)
+
+
 class Client(ibmiotf.AbstractClient):
     """
     Extends #ibmiotf.AbstractClient to implement an application client supporting 
@@ -234,6 +565,125 @@ class Client(ibmiotf.AbstractClient):
 
         self.orgId = self._options['org']
         self.appId = self._options['id']
+        
+        # Warm start from the last event cache, see enableWarmStart()
+        self.deviceState = None
+        self.warmStartEvent = threading.Event()
+        self._warmStart = None
+        self._warmStartLock = threading.Lock()
+        self._warmStartBuffer = None
+        
+        # Connection state of devices from their status messages, see trackConnectionState()
+        self.connectionState = None
+
+
+    def enableWarmStart(self, deviceTypes, eventIds=None, concurrency=16):
+        """
+        Load the latest events of a set of device types from the last event cache each time 
+        the client connects, so that the application has a complete picture immediately, even 
+        for devices that report infrequently.  Must be called before `connect()`.
+        
+        Once connected, the cached events are decoded and passed to the `deviceEventCallback` 
+        (with `event.cached` set to `True`) and stored in `deviceState`.  Live events received 
+        while the cache is loading are held back and delivered afterwards, only the latest of 
+        each device and eventId is kept, so the backlog is bounded by the size of the fleet.  Any 
+        event older than the state already held for that device and eventId is discarded, so 
+        consumers never go back in time, see #DeviceState for how cached and live events are 
+        ordered.  `warmStartEvent` is set when loading completes.
+        
+        ```python
+        client.enableWarmStart(["sensor"], eventIds=["status"])
+        client.connect()
+        client.subscribeToDeviceEvents(deviceType="sensor", event="status")
+        client.warmStartEvent.wait()
+        print(client.deviceState.get("sensor", "sensor01", "status").data)
+        ```
+        
+        # Parameters
+        deviceTypes (list<string>): Load the devices of these device types
+        eventIds (list<string>): Only load these events, optional.  Defaults to all events
+        concurrency (int): Number of devices loaded at the same time
+        """
+        if self._options['org'] == "quickstart":
+            raise ibmiotf.ConfigurationException("Warm start requires an API key, it is not available to QuickStart applications")
+        
+        self._warmStart = {"deviceTypes": list(deviceTypes), "eventIds": eventIds, "concurrency": concurrency}
+        if self.deviceState is None:
+            self.deviceState = DeviceState()
+
+
+    def _startWarmStart(self):
+        with self._warmStartLock:
+            if self._warmStartBuffer is not None:
+                # Already loading
+                return
+            self._warmStartBuffer = OrderedDict()
+            self.warmStartEvent.clear()
+            self.deviceState.newConnection()
+        
+        thread = threading.Thread(target=self._loadWarmStart, name="warm-start")
+        thread.daemon = True
+        thread.start()
+
+
+    def _loadWarmStart(self):
+        loaded = 0
+        try:
+            devices = (device for typeId in self._warmStart["deviceTypes"] for device in IterableDeviceList(self.api.newApiClient, typeId, 100).raw())
+            for (deviceUid, lastEvents) in self.api.lec.getAllMany(devices, self._warmStart["eventIds"], self._warmStart["concurrency"]):
+                for lastEvent in lastEvents:
+                    try:
+                        event = Event(CachedEventMessage(lastEvent), self._messageEncoderModules)
+                    except Exception as e:
+                        self.logger.warning("Unable to decode cached event '%s' from %s:%s: %s" % (lastEvent.eventId, lastEvent.typeId, lastEvent.deviceId, str(e)))
+                        continue
+                    event.timestamp = lastEvent.timestamp
+                    event.cached = True
+                    if self._deliverEvent(event):
+                        loaded += 1
+            self.logger.info("Warm start loaded %s cached events" % (loaded))
+        except Exception as e:
+            self.logger.error("Warm start from the last event cache failed: %s" % (str(e)))
+        finally:
+            # Switch to the live stream, delivering anything received while loading first
+            with self._warmStartLock:
+                buffered = self._warmStartBuffer
+                for event in buffered.values():
+                    self._deliverEvent(event)
+                self._warmStartBuffer = None
+            self.warmStartEvent.set()
+
+
+    def _deliverEvent(self, event):
+        """
+        Record the event in the device state (when warm start is enabled) and pass it to the 
+        device event callback, unless it is older than the state already held
+        """
+        if self.deviceState is not None and not self.deviceState.update(event):
+            self.logger.debug("Discarded out of date event '%s' from %s:%s" % (event.event, event.deviceType, event.deviceId))
+            return False
+        if self.deviceEventCallback: self.deviceEventCallback(event)
+        return True
+
+
+    def trackConnectionState(self, deviceType="+", deviceId="+", maxDevices=None):
+        """
+        Subscribe to device status messages and maintain the connection state of each device 
+        in `connectionState`.  The `deviceStatusCallback` is still called for every message.
+        
+        # Parameters
+        deviceType (string): typeId for the subscription, optional.  Defaults to all device types (MQTT `+` wildcard)
+        deviceId (string): deviceId for the subscription, optional.  Defaults to all devices (MQTT `+` wildcard)
+        maxDevices (int): Maximum number of devices to track, optional.  Defaults to no limit
+        
+        # Returns
+        ConnectionStateTracker: The tracker
+        """
+        if self.connectionState is None:
+            apiClient = self.api.newApiClient if self._options['org'] != "quickstart" else None
+            self.connectionState = ConnectionStateTracker(apiClient, maxDevices)
+        self.subscribeToDeviceStatus(deviceType, deviceId)
+        return self.connectionState
 
 
     def subscribeToDeviceEvents(self, deviceType="+", deviceId="+", event="+", msgFormat="+", qos=0):
@@ -464,6 +914,10 @@ class Client(ibmiotf.AbstractClient):
         """
 
         if rc == 0:
+            # Start buffering live events before any can arrive
+            if self._warmStart is not None:
+                self._startWarmStart()
+            
             self.connectEvent.set()
             self.logger.info("Connected successfully: %s" % (self.clientId))
 
@@ -504,7 +958,17 @@ class Client(ibmiotf.AbstractClient):
         try:
             event = Event(pahoMessage, self._messageEncoderModules)
             self.logger.debug("Received event '%s' from %s:%s" % (event.event, event.deviceType, event.deviceId))
-            if self.deviceEventCallback: self.deviceEventCallback(event)
+            if self._warmStart is not None:
+                with self._warmStartLock:
+                    if self._warmStartBuffer is not None:
+                        # Hold back live events until the cached state has been loaded, only the 
+                        # latest of each device and eventId, which moves to the end of the backlog
+                        key = (event.deviceType, event.deviceId, event.event)
+                        self._warmStartBuffer.pop(key, None)
+                        self._warmStartBuffer[key] = event
+                        return
+                self._deliverEvent(event)
+            elif self.deviceEventCallback: self.deviceEventCallback(event)
         except ibmiotf.InvalidEventException as e:
             self.logger.critical(str(e))
 
@@ -530,7 +994,9 @@ class Client(ibmiotf.AbstractClient):
 
         try:
             status = Status(pahoMessage)
-            self.logger.debug("Received %s action from %s:%s" % (status.action, status.deviceType, status.deviceId))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Received %s action from %s:%s" % (status.action, status.deviceType, status.deviceId))
+            if self.connectionState is not None: self.connectionState.update(status)
             if self.deviceStatusCallback: self.deviceStatusCallback(status)
         except ibmiotf.InvalidEventException as e:
             self.logger.critical(str(e))
@@ -9,7 +9,6 @@
 
 import logging
 import re
-import uuid
 import json
 import threading
 from datetime import datetime
@@ -23,6 +22,9 @@ from ibmiotf import (
     ConnectionException, MissingMessageEncoderException,
     MissingMessageDecoderException)
 from ibmiotf.codecs import jsonCodec
+from ibmiotf.dm import DeviceMgmtRequestEngine, DeviceMgmtCoalescer
+from ibmiotf.firmware import FirmwareDownloader, FirmwareDownloadException
+from ibmiotf.scheduler import sharedExecutor, sharedTimerWheel
 
 
 # Support Python 2.7 and 3.4 versions of configparser
@@ -477,6 +479,8 @@ class DeviceFirmware(object):
         self.state = state
         self.updateStatus = updateStatus
         self.updatedDateTime = updatedDateTime
+        # The downloaded image, set by FirmwareDownloader
+        self.path = None
 
     def __str__(self):
         return json.dumps(self.__dict__, sort_keys=True)
@@ -537,7 +541,7 @@ class ManagedClient(Client):
         self.dmeActionCallback = None
 
         messages_callbacks = (
-            ("iotdm-1/#", self.__onDeviceMgmtResponse),
+            (ManagedClient.DM_RESPONSE_TOPIC, self.__onDeviceMgmtResponse),
             (ManagedClient.DM_REBOOT_TOPIC, self.__onRebootRequest),
             (ManagedClient.DM_FACTORY_REESET, self.__onFactoryResetRequest),
             (ManagedClient.DM_FIRMWARE_UPDATE_TOPIC, self.__onFirmwereUpdate),
@@ -556,9 +560,19 @@ class ManagedClient(Client):
 
         self.readyForDeviceMgmt = threading.Event()
 
-        # List of DM requests that have not received a response yet
-        self._deviceMgmtRequestsPendingLock = threading.Lock()
-        self._deviceMgmtRequestsPending = {}
+        # DM requests that have not received a response yet, by the topic they are published to
+        self.deviceMgmtRequests = DeviceMgmtRequestEngine(self.client, self.logger)
+        # Any response to a manage or unmanage request changes whether the device is ready for DM
+        setReady = lambda request: self.readyForDeviceMgmt.set()
+        clearReady = lambda request: self.readyForDeviceMgmt.clear()
+        self.deviceMgmtRequests.register(ManagedClient.MANAGE_TOPIC, "Manage", onSuccess=setReady, onFailure=setReady)
+        self.deviceMgmtRequests.register(ManagedClient.UNMANAGE_TOPIC, "Unmanage", onSuccess=clearReady, onFailure=clearReady)
+        self.deviceMgmtRequests.register(ManagedClient.UPDATE_LOCATION_TOPIC, "Location update")
+        self.deviceMgmtRequests.register(ManagedClient.ADD_ERROR_CODE_TOPIC, "Add error code")
+        self.deviceMgmtRequests.register(ManagedClient.CLEAR_ERROR_CODES_TOPIC, "Clear error codes")
+        self.deviceMgmtRequests.register(ManagedClient.ADD_LOG_TOPIC, "Add log")
+        self.deviceMgmtRequests.register(ManagedClient.CLEAR_LOG_TOPIC, "Clear log")
+        self.deviceMgmtRequests.register(ManagedClient.NOTIFY_TOPIC, "Notify field change")
 
         # List of DM notify hook
         self._deviceMgmtObservationsLock = threading.Lock()
@@ -577,6 +591,66 @@ class ManagedClient(Client):
 
         self.manageTimer = None
 
+        # Background work, such as responding to DM actions, shares a bounded pool of threads
+        self._executor = sharedExecutor()
+
+        # Merges and suppresses DM notifications when enabled, see enableCoalescing()
+        self.coalescer = None
+
+        # Downloads firmware images when enabled, see enableFirmwareDownload()
+        self.firmwareDownloader = None
+
+    def enableFirmwareDownload(self, directory, **kwargs):
+        """
+        Download firmware images in the client rather than in `firmwereActionCallback`.  When a
+        download is requested the image is streamed to `directory` by a
+        #ibmiotf.firmware.FirmwareDownloader in a background thread, and the firmware state is
+        reported as it progresses.  `firmwereActionCallback` is not called for the download, and
+        is called for the update with the firmware's `path` set to the downloaded image.
+
+        ```python
+        client.enableFirmwareDownload("/var/lib/firmware", chunkSize=16384)
+        ```
+
+        # Parameters
+        directory (string): Directory images are written to
+        kwargs: Other parameters of #ibmiotf.firmware.FirmwareDownloader
+
+        # Returns
+        FirmwareDownloader: The downloader
+        """
+        self.firmwareDownloader = FirmwareDownloader(directory, **kwargs)
+        return self.firmwareDownloader
+
+    def enableCoalescing(self, minDistance=10.0, minInterval=30.0, logBatchSize=20, logInterval=10.0, fieldWindow=1.0):
+        """
+        Publish fewer location, error code, log and field change notifications, see
+        #ibmiotf.dm.DeviceMgmtCoalescer for the rules and parameters.  Calls that do not publish
+        a message straight away return a request that is already set, with `coalesced` set to `True`.
+
+        ```python
+        client.enableCoalescing(minDistance=25, minInterval=60)
+        for (longitude, latitude) in gps:
+            client.setLocation(longitude, latitude)
+        ```
+
+        # Returns
+        DeviceMgmtCoalescer: The coalescer, see `flush()` and `metrics()`
+        """
+        self.coalescer = DeviceMgmtCoalescer(
+            self.deviceMgmtRequests,
+            ManagedClient.UPDATE_LOCATION_TOPIC,
+            ManagedClient.ADD_ERROR_CODE_TOPIC,
+            ManagedClient.NOTIFY_TOPIC,
+            logTopic=ManagedClient.ADD_LOG_TOPIC,
+            minDistance=minDistance,
+            minInterval=minInterval,
+            logBatchSize=logBatchSize,
+            logInterval=logInterval,
+            fieldWindow=fieldWindow
+        )
+        return self.coalescer
+
     def setSerialNumber(self, serialNumber):
         self._deviceInfo.serialNumber = serialNumber
         return self.notifyFieldChange("deviceInfo.serialNumber", serialNumber)
@@ -618,25 +692,9 @@ class ManagedClient(Client):
                                         "for device management")
                     return threading.Event().set()
 
-                reqId = str(uuid.uuid4())
-                message = {
-                    "d": {
-                        "field": field,
-                        "value": value
-                    },
-                    "reqId": reqId
-                }
-
-                resolvedEvent = threading.Event()
-                self.client.publish(ManagedClient.NOTIFY_TOPIC, payload=json.dumps(message), qos=1, retain=False)
-                with self._deviceMgmtRequestsPendingLock:
-                    self._deviceMgmtRequestsPending[reqId] = {
-                        "topic": ManagedClient.NOTIFY_TOPIC,
-                        "message": message,
-                        "event": resolvedEvent
-                    }
-
-                return resolvedEvent
+                if self.coalescer is not None:
+                    return self.coalescer.notifyFieldChange(field, value)
+                return self.deviceMgmtRequests.send(ManagedClient.NOTIFY_TOPIC, {"field": field, "value": value})
             else:
                 return threading.Event().set()
     '''
@@ -692,47 +750,37 @@ class ManagedClient(Client):
                                 "are not in place")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            'd': {
-                "lifetime": lifetime,
-                "supports": {
-                    "deviceActions": supportDeviceActions,
-                    "firmwareActions": supportFirmwareActions,
-                },
-                "deviceInfo": self._deviceInfo.__dict__,
-                "metadata": self.metadata
+        data = {
+            "lifetime": lifetime,
+            "supports": {
+                "deviceActions": supportDeviceActions,
+                "firmwareActions": supportFirmwareActions,
             },
-            'reqId': reqId
+            "deviceInfo": self._deviceInfo.__dict__,
+            "metadata": self.metadata
         }
         if supportDeviceMgmtExtActions and len(bundleIds) > 0:
             for bundleId in bundleIds:
-                message['d']['supports'][bundleId] = supportDeviceMgmtExtActions
+                data['supports'][bundleId] = supportDeviceMgmtExtActions
 
-        resolvedEvent = threading.Event()
-        self.client.publish(ManagedClient.MANAGE_TOPIC, payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {"topic": ManagedClient.MANAGE_TOPIC, "message": message, "event": resolvedEvent}
+        request = self.deviceMgmtRequests.send(ManagedClient.MANAGE_TOPIC, data)
 
         # Register the future call back to Watson IoT Platform 2 minutes before the device lifetime expiry
         if lifetime != 0:
             if self.manageTimer is not None:
-                self._logger.debug("Cancelling existing manage timer")
+                self.logger.debug("Cancelling existing manage timer")
                 self.manageTimer.cancel()
-            self.manageTimer = threading.Timer(
+            self.manageTimer = sharedTimerWheel().schedule(
                 lifetime - 120,
                 self.manage,
-                [
-                    lifetime,
-                    supportDeviceActions,
-                    supportFirmwareActions,
-                    supportDeviceMgmtExtActions,
-                    bundleIds
-                ]
+                lifetime,
+                supportDeviceActions,
+                supportFirmwareActions,
+                supportDeviceMgmtExtActions,
+                bundleIds
             )
-            self.manageTimer.start()
 
-        return resolvedEvent
+        return request
 
     def unmanage(self):
         if not self.readyForDeviceMgmt.wait(timeout=10):
@@ -740,22 +788,9 @@ class ManagedClient(Client):
                                 "device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            'reqId': reqId
-        }
-
-        resolvedEvent = threading.Event()
-        self.client.publish(ManagedClient.UNMANAGE_TOPIC,
-                            payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {
-                "topic": ManagedClient.UNMANAGE_TOPIC,
-                "message": message,
-                "event": resolvedEvent
-            }
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            self.coalescer.flush()
+        return self.deviceMgmtRequests.send(ManagedClient.UNMANAGE_TOPIC)
 
     def setLocation(self, longitude, latitude, elevation=None, accuracy=None):
         # TODO: Add validation (e.g. ensure numeric values)
@@ -779,23 +814,9 @@ class ManagedClient(Client):
                                 "device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "d": self._location,
-            "reqId": reqId
-        }
-
-        resolvedEvent = threading.Event()
-        self.client.publish(ManagedClient.UPDATE_LOCATION_TOPIC,
-                            payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {
-                "topic": ManagedClient.UPDATE_LOCATION_TOPIC,
-                "message": message,
-                "event": resolvedEvent
-            }
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            return self.coalescer.setLocation(self._location)
+        return self.deviceMgmtRequests.send(ManagedClient.UPDATE_LOCATION_TOPIC, self._location)
 
     def setErrorCode(self, errorCode=0):
         if errorCode is None:
@@ -808,27 +829,9 @@ class ManagedClient(Client):
                                 "device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "d": {"errorCode": errorCode},
-            "reqId": reqId
-        }
-
-        resolvedEvent = threading.Event()
-        self.client.publish(
-            ManagedClient.ADD_ERROR_CODE_TOPIC,
-            payload=json.dumps(message),
-            qos=1,
-            retain=False
-        )
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {
-                "topic": ManagedClient.ADD_ERROR_CODE_TOPIC,
-                "message": message,
-                "event": resolvedEvent
-            }
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            return self.coalescer.setErrorCode(errorCode)
+        return self.deviceMgmtRequests.send(ManagedClient.ADD_ERROR_CODE_TOPIC, {"errorCode": errorCode})
 
     def clearErrorCodes(self):
         self._errorCode = None
@@ -838,22 +841,9 @@ class ManagedClient(Client):
                                 "device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "reqId": reqId
-        }
-
-        resolvedEvent = threading.Event()
-        self.client.publish(ManagedClient.CLEAR_ERROR_CODES_TOPIC,
-                            payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {
-                "topic": ManagedClient.CLEAR_ERROR_CODES_TOPIC,
-                "message": message,
-                "event": resolvedEvent
-            }
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            self.coalescer.clearErrorCodes()
+        return self.deviceMgmtRequests.send(ManagedClient.CLEAR_ERROR_CODES_TOPIC)
 
     def addLog(self, msg="", data="", sensitivity=0):
         timestamp = datetime.now().isoformat()
@@ -862,28 +852,15 @@ class ManagedClient(Client):
                                 "device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "d": {
-                "message": msg,
-                "timestamp": timestamp,
-                "data": data,
-                "severity": sensitivity
-            },
-            "reqId": reqId
+        entry = {
+            "message": msg,
+            "timestamp": timestamp,
+            "data": data,
+            "severity": sensitivity
         }
-
-        resolvedEvent = threading.Event()
-        self.client.publish(ManagedClient.ADD_LOG_TOPIC,
-                            payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {
-                "topic": ManagedClient.ADD_LOG_TOPIC,
-                "message": message,
-                "event": resolvedEvent
-            }
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            return self.coalescer.addLog(entry)
+        return self.deviceMgmtRequests.send(ManagedClient.ADD_LOG_TOPIC, entry)
 
     def clearLog(self):
 
@@ -891,108 +868,12 @@ class ManagedClient(Client):
             self.logger.warning("Unable to clear log because device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "reqId": reqId
-        }
-
-        resolvedEvent = threading.Event()
-        self.client.publish(ManagedClient.CLEAR_LOG_TOPIC,
-                            payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {
-                "topic": ManagedClient.CLEAR_LOG_TOPIC,
-                "message": message,
-                "event": resolvedEvent
-            }
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            self.coalescer.discardLogs()
+        return self.deviceMgmtRequests.send(ManagedClient.CLEAR_LOG_TOPIC)
 
     def __onDeviceMgmtResponse(self, client, userdata, pahoMessage):
-
-        try:
-            data = json.loads(pahoMessage.payload.decode("utf-8"))
-            if 'rc' not in data:
-                return True
-            rc = data['rc']
-            reqId = data['reqId']
-        except ValueError as e:
-            raise Exception(
-                "Unable to parse JSON. payload=\"%s\" error=%s" % (
-                    pahoMessage.payload,
-                    str(e)
-                )
-            )
-        else:
-            request = None
-            with self._deviceMgmtRequestsPendingLock:
-                try:
-                    request = self._deviceMgmtRequestsPending.pop(reqId)
-                except KeyError:
-                    self.logger.warning("Received unexpected response from "
-                                        "device management: %s", reqId)
-                else:
-                    self.logger.debug("Remaining unprocessed device "
-                                      "management requests: %s",
-                                      len(self._deviceMgmtRequestsPending))
-
-
-            if request is None:
-                return False
-
-            state = {
-                ManagedClient.MANAGE_TOPIC: {
-                    # rc, json.dumps(request['message'])
-                    'msg_succ': "[%s] Manage action completed: %s",
-                    'msg_fail': "[%s] Manage action failed: %s",
-                },
-                ManagedClient.UNMANAGE_TOPIC: {
-                    'msg_succ': "[%s] Unmanage action completed: %s",
-                    'msg_fail': "[%s] Unmanage action failed: %s"
-                },
-                ManagedClient.UPDATE_LOCATION_TOPIC: {
-                    'msg_succ': "[%s] Location update action completed: %s",
-                    'msg_fail': "[%s] Location update action failed: %s"
-                },
-                ManagedClient.ADD_ERROR_CODE_TOPIC: {
-                    'msg_succ': "[%s] Add error code action completed: %s",
-                    'msg_fail': "[%s] Add error code action failed: %s"
-                },
-                ManagedClient.CLEAR_ERROR_CODES_TOPIC: {
-                    'msg_succ': "[%s] Clear error codes action completed: %s",
-                    'msg_fail': "[%s] Clear error codes action failed: %s"
-                },
-                ManagedClient.ADD_LOG_TOPIC: {
-                    'msg_succ': "[%s] Add log action completed: %s",
-                    'msg_fail': "[%s] Add log action failed: %s"
-                },
-                ManagedClient.CLEAR_LOG_TOPIC: {
-                    'msg_succ': "[%s] Clear log action completed: %s",
-                    'msg_fail': "[%s] Clear log action failed: %s"
-                }
-            }
-
-            try:
-                msg_succ = state[request['topic']]['msg_succ']
-                msg_fail = state[request['topic']]['msg_fail']
-            except Exception as e:
-                self.logger.warning("[%s] Unknown action response: %s",
-                                    rc, json.dumps(request['message']))
-            else:
-                dump_str = json.dumps(request['message'])
-                if rc == 200:
-                    self.logger.info(msg_succ, rc, dump_str)
-                else:
-                    self.logger.critical(msg_fail, rc, dump_str)
-
-                if request['topic'] == ManagedClient.MANAGE_TOPIC:
-                    self.readyForDeviceMgmt.set()
-                elif request['topic'] == ManagedClient.UNMANAGE_TOPIC:
-                    self.readyForDeviceMgmt.clear()
-
-            # Now clear the event, allowing anyone that was waiting on this to proceed
-            request["event"].set()
-            return True
+        return self.deviceMgmtRequests.handleResponse(pahoMessage)
 
     # Device Action Handlers
     def __onRebootRequest(self, client, userdata, pahoMessage):
@@ -1044,16 +925,43 @@ class ManagedClient(Client):
         rc = ManagedClient.RESPONSECODE_ACCEPTED
         msg = ""
 
-        if self.__firmwareUpdate.state != ManagedClient.UPDATESTATE_IDLE:
+        if self.__firmwareUpdate is None:
+            rc = ManagedClient.RESPONSECODE_BAD_REQUEST
+            msg = "Cannot download as no firmware has been set"
+        elif self.__firmwareUpdate.state != ManagedClient.UPDATESTATE_IDLE:
             rc = ManagedClient.RESPONSECODE_BAD_REQUEST
             msg = "Cannot download as the device is not in idle state"
-        thread = threading.Thread(target=self.respondDeviceAction,
-                                  args=(reqId, rc, msg),
-                                  name='respondDeviceAction')
-        thread.start()
+
+        if self.firmwareDownloader is not None:
+            if rc == ManagedClient.RESPONSECODE_ACCEPTED:
+                # Leave the idle state before responding, so that a second request is rejected rather
+                # than starting another download, and respond before the download reports its state
+                self.__firmwareUpdate.state = ManagedClient.UPDATESTATE_DOWNLOADING
+                # A cancel that arrives once the download is accepted stops it, even before it starts
+                self.firmwareDownloader.reset()
+            self.respondDeviceAction(reqId, rc, msg)
+            if rc == ManagedClient.RESPONSECODE_ACCEPTED:
+                # Downloads can take minutes, so they get their own thread rather than a shared worker
+                thread = threading.Thread(target=self.__downloadFirmware, args=(self.__firmwareUpdate,), name="firmware-download")
+                thread.daemon = True
+                thread.start()
+            return
+
+        self._executor.submit(self.respondDeviceAction, reqId, rc, msg)
         if self.firmwereActionCallback:
             self.firmwereActionCallback("download", self.__firmwareUpdate)
 
+    def __downloadFirmware(self, firmware):
+        try:
+            path = self.firmwareDownloader.download(firmware, self)
+            self.logger.info("Firmware %s downloaded to %s" % (firmware.version, path))
+        except FirmwareDownloadException as e:
+            self.logger.error("Unable to download firmware %s: %s" % (firmware.version, str(e)))
+        except Exception as e:
+            # Return to the idle state, or every later download would be rejected
+            self.logger.exception("Unable to download firmware %s: %s" % (firmware.version, str(e)))
+            self.setUpdateStatus(ManagedClient.UPDATESTATE_CONNECTION_LOST)
+
 
     def __onFirmwereCancel(self, client, userdata, pahoMessage):
         paho_payload = pahoMessage.payload.decode("utf-8")
@@ -1062,10 +970,10 @@ class ManagedClient(Client):
                          paho_payload)
         data = json.loads(paho_payload)
         reqId = data['reqId']
-        thread = threading.Thread(target=self.respondDeviceAction,
-                                  args=(reqId, 200, ""),
-                                  name='respondDeviceAction')
-        thread.start()
+        if self.firmwareDownloader is not None:
+            # Stop a download in progress, it reports the interrupted download when it stops
+            self.firmwareDownloader.cancel()
+        self._executor.submit(self.respondDeviceAction, reqId, 200, "")
 
     def __onFirmwereObserve(self, client, userdata, pahoMessage):
         paho_payload = pahoMessage.payload.decode("utf-8")
@@ -1074,10 +982,7 @@ class ManagedClient(Client):
         data = json.loads(paho_payload)
         reqId = data['reqId']
         # TODO: Proprer validation for fields in payload
-        thread = threading.Thread(target=self.respondDeviceAction,
-                                  args=(reqId, 200, ""),
-                                  name='respondDeviceAction')
-        thread.start()
+        self._executor.submit(self.respondDeviceAction, reqId, 200, "")
 
     def __onUpdatedDevice(self, client, userdata, pahoMessage):
         paho_payload = pahoMessage.payload.decode("utf-8")
@@ -1102,10 +1007,7 @@ class ManagedClient(Client):
                     value['state'],
                     value['updateStatus'],
                     value['updatedDateTime'])
-            thread = threading.Thread(target=self.respondDeviceAction,
-                                      args=(reqId, 204, ""),
-                                      name='respondDeviceAction')
-            thread.start()
+            self._executor.submit(self.respondDeviceAction, reqId, 204, "")
         else:
             d = data['d']
             value = None
@@ -1134,11 +1036,8 @@ class ManagedClient(Client):
 
         self.logger.info("Publishing state Update with payload :%s",
                          json.dumps(notify))
-        thread = threading.Thread(
-            target=self.client.publish,
-            args=('iotdevice-1/notify', json.dumps(notify), 1, False),
-            name='client.publish')
-        thread.start()
+        # Published directly, so that the state changes reach the platform in the order they were made
+        self.client.publish('iotdevice-1/notify', json.dumps(notify), 1, False)
 
     def setUpdateStatus(self, status):
         notify = {
@@ -1160,11 +1059,7 @@ class ManagedClient(Client):
 
         self.logger.info("Publishing  Update Status  with payload :%s",
                          json.dumps(notify))
-        thread = threading.Thread(
-            target=self.client.publish,
-            args=('iotdevice-1/notify', json.dumps(notify), 1, False),
-            name='client.publish')
-        thread.start()
+        self.client.publish('iotdevice-1/notify', json.dumps(notify), 1, False)
 
     def __onFirmwereUpdate(self,client,userdata,pahoMessage):
         paho_payload = pahoMessage.payload.decode("utf-8")
@@ -1178,11 +1073,7 @@ class ManagedClient(Client):
         if self.__firmwareUpdate.state != ManagedClient.UPDATESTATE_DOWNLOADED:
             rc = ManagedClient.RESPONSECODE_BAD_REQUEST
             msg = "Firmware is still not successfully downloaded."
-        thread = threading.Thread(
-            target=self.respondDeviceAction,
-            args=(reqId, rc, msg),
-            name='respondDeviceAction')
-        thread.start()
+        self._executor.submit(self.respondDeviceAction, reqId, rc, msg)
         if self.firmwereActionCallback:
             self.firmwereActionCallback("update", self.__firmwareUpdate)
 
@@ -1195,25 +1086,13 @@ class ManagedClient(Client):
         if self.dmeActionCallback:
             if self.dmeActionCallback(pahoMessage.topic, data, reqId):
                 msg = "DME Action successfully completed from Callback"
-                thread = threading.Thread(
-                    target=self.respondDeviceAction,
-                    args=(reqId, 200, msg),
-                    name='respondDeviceAction')
-                thread.start()
+                self._executor.submit(self.respondDeviceAction, reqId, 200, msg)
             else:
                 msg = "Unexpected device error"
-                thread = threading.Thread(
-                    target=self.respondDeviceAction,
-                    args=(reqId, 500, msg),
-                    name='respondDeviceAction')
-                thread.start()
+                self._executor.submit(self.respondDeviceAction, reqId, 500, msg)
 
         else:
-            thread = threading.Thread(
-                target=self.respondDeviceAction,
-                args=(reqId, 501, "Operation not implemented"),
-                name='respondDeviceAction')
-            thread.start()
+            self._executor.submit(self.respondDeviceAction, reqId, 501, "Operation not implemented")
 
 
 def ParseConfigFile(configFilePath):
@@ -0,0 +1,488 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import json
+import math
+import time
+import uuid
+import threading
+
+from ibmiotf.scheduler import sharedTimerWheel
+
+# Support Python 2.7 and 3.x, where threading.Event is a factory function in 2.7
+try:
+    _EventBase = threading._Event
+except AttributeError:
+    _EventBase = threading.Event
+
+
+class DeviceMgmtAction(object):
+    """
+    How the response to one kind of device management request is reported, see
+    `DeviceMgmtRequestEngine.register()`
+    """
+    __slots__ = ["name", "onSuccess", "onFailure"]
+
+    def __init__(self, name, onSuccess=None, onFailure=None):
+        self.name = name
+        self.onSuccess = onSuccess
+        self.onFailure = onFailure
+
+
+class DeviceMgmtRequest(_EventBase):
+    """
+    A device management request that has been published.  It is a `threading.Event` that is set
+    when the response arrives, or when the request expires without a response, so existing code
+    that calls `wait()` continues to work.
+
+    ```python
+    request = client.setLocation(longitude=-98.49, latitude=29.42)
+    rc = request.result(timeout=30)
+    ```
+    """
+    def __init__(self, reqId, topic, message, action, context=None):
+        _EventBase.__init__(self)
+        self.reqId = reqId
+        self.topic = topic
+        self.message = message
+        self.action = action
+        self.context = context
+        self.rc = None
+        self.response = None
+        self.expired = False
+        self.coalesced = False
+        self._expiryTask = None
+
+    def result(self, timeout=None):
+        """
+        Wait for the response
+
+        # Returns
+        int: The response code (`200` on success), or `None` if the request expired or the
+            timeout was reached first
+        """
+        self.wait(timeout)
+        return self.rc
+
+    @property
+    def succeeded(self):
+        return self.rc == 200
+
+    @classmethod
+    def coalescedRequest(cls, topic, data):
+        """
+        A request that was not published by itself because a #DeviceMgmtCoalescer merged it with
+        others or suppressed it.  It is already set, `coalesced` is `True` and `rc` is `None`.
+        """
+        request = cls(None, topic, {"d": data}, None)
+        request.coalesced = True
+        request.set()
+        return request
+
+
+class DeviceMgmtRequestEngine(object):
+    """
+    Tracks the device management requests a managed client has published until their responses
+    arrive.  The kinds of request are registered once, by the topic they are published to, so a
+    response is matched to its request and reported with two dictionary lookups.  Every request
+    expires `timeout` seconds after it is published if no response has arrived, through the
+    process-wide #ibmiotf.scheduler.TimerWheel, so requests lost on an unreliable connection do
+    not accumulate.
+
+    # Parameters
+    client (paho.mqtt.client.Client): MQTT client to publish requests with
+    logger (logging.Logger): Logger to report responses to
+    timeout (float): Seconds to wait for a response before expiring a request.  Defaults to `120`
+    """
+
+    DEFAULT_TIMEOUT = 120
+
+    def __init__(self, client, logger, timeout=DEFAULT_TIMEOUT):
+        self._client = client
+        self.logger = logger
+        self.timeout = timeout
+        self._wheel = sharedTimerWheel()
+
+        self._actions = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.expiredCount = 0
+
+    def register(self, topic, name, onSuccess=None, onFailure=None):
+        """
+        Register a kind of request by the topic it is published to
+
+        # Parameters
+        topic (string): The topic requests are published to
+        name (string): Name of the action used when logging responses, e.g. `Manage`
+        onSuccess (function): Called with the request when it receives a `200` response, optional
+        onFailure (function): Called with the request when it receives any other response, optional
+        """
+        self._actions[topic] = DeviceMgmtAction(name, onSuccess, onFailure)
+
+    @property
+    def pendingCount(self):
+        return len(self._pending)
+
+    def send(self, topic, data=None, timeout=None, action=None, context=None):
+        """
+        Publish a request, `data` is sent as the `d` field of the message if it is not `None`.  The
+        response is reported through the action registered for `topic`, or through `action` if one
+        is given, which avoids registering each of many topics that share an action.  `context` is
+        kept on the request for the action's callbacks.
+
+        # Returns
+        DeviceMgmtRequest: The request, which is set when the response arrives or the request expires
+        """
+        reqId = str(uuid.uuid4())
+        message = {"reqId": reqId}
+        if data is not None:
+            message["d"] = data
+
+        if action is None:
+            action = self._actions.get(topic, None)
+        request = DeviceMgmtRequest(reqId, topic, message, action, context)
+        # Track the request before publishing, so that a fast response can't arrive before it is known
+        with self._lock:
+            self._pending[reqId] = request
+        request._expiryTask = self._wheel.schedule(self.timeout if timeout is None else timeout, self._expire, reqId)
+
+        self._client.publish(topic, payload=json.dumps(message), qos=1, retain=False)
+        return request
+
+    def _expire(self, reqId):
+        with self._lock:
+            request = self._pending.pop(reqId, None)
+        if request is None:
+            return
+        self.expiredCount += 1
+        self.logger.warning("No response to device management request %s: %s" % (reqId, json.dumps(request.message)))
+        request.expired = True
+        request.set()
+
+    def handleResponse(self, pahoMessage):
+        """
+        Process a message received on a device management response topic
+
+        # Returns
+        boolean: `True` if the message was the response to a pending request
+        """
+        try:
+            data = json.loads(pahoMessage.payload.decode("utf-8"))
+        except ValueError as e:
+            raise Exception("Unable to parse JSON.  payload=\"%s\" error=%s" % (pahoMessage.payload, str(e)))
+
+        if 'rc' not in data or 'reqId' not in data:
+            return False
+        rc = data['rc']
+        reqId = data['reqId']
+
+        with self._lock:
+            request = self._pending.pop(reqId, None)
+        if request is None:
+            self.logger.warning("Received unexpected response from device management: %s" % (reqId))
+            return False
+        self.logger.debug("Remaining unprocessed device management requests: %s" % (len(self._pending)))
+        request._expiryTask.cancel()
+
+        request.rc = rc
+        request.response = data
+        action = request.action
+        if action is None:
+            self.logger.warning("[%s] Unknown action response: %s" % (rc, json.dumps(request.message)))
+        elif rc == 200:
+            self.logger.info("[%s] %s action completed: %s" % (rc, action.name, json.dumps(request.message)))
+            if action.onSuccess is not None:
+                action.onSuccess(request)
+        else:
+            self.logger.critical("[%s] %s action failed: %s" % (rc, action.name, json.dumps(request.message)))
+            if action.onFailure is not None:
+                action.onFailure(request)
+
+        # Now set the event, allowing anyone that was waiting on this to proceed
+        request.set()
+        return True
+
+
+def distance(location1, location2):
+    """
+    The great-circle distance in metres between two locations, each a dict with `latitude` and
+    `longitude` in degrees
+    """
+    lat1 = math.radians(location1["latitude"])
+    lat2 = math.radians(location2["latitude"])
+    dLat = lat2 - lat1
+    dLon = math.radians(location2["longitude"] - location1["longitude"])
+    a = math.sin(dLat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dLon / 2) ** 2
+    return 2 * 6371000.0 * math.asin(min(1.0, math.sqrt(a)))
+
+
+class DeviceMgmtCoalescer(object):
+    """
+    Reduces the number of device management notifications a managed client publishes, without
+    losing the latest state:
+
+    - Location updates pass through a deadband: after one is published, further updates are held
+      for `minInterval` seconds and then only the latest is published, and only if it is at least
+      `minDistance` metres from the last location published.
+    - An error code the same as the last one published is suppressed, until the error codes are cleared.
+    - Log entries are buffered, and published when `logBatchSize` are waiting, `logInterval` seconds
+      after the first was buffered, or straight away when an error (severity `2`) is logged.
+      Identical consecutive entries in a batch are published once, with the number of repeats
+      appended to the message.
+    - Field changes are merged over `fieldWindow` seconds, so only the latest value of each field
+      is published, and only if it differs from the last value published.
+
+    Held notifications are published from the process-wide #ibmiotf.scheduler.TimerWheel, and
+    `flush()` publishes everything held straight away.  Calls that do not publish a message
+    return a #DeviceMgmtRequest with `coalesced` set to `True`.
+
+    # Parameters
+    engine (DeviceMgmtRequestEngine): Engine to publish requests with
+    locationTopic (string): Topic location updates are published to
+    errorCodeTopic (string): Topic error codes are published to
+    notifyTopic (string): Topic field changes are published to
+    logTopic (string): Topic log entries are published to, optional
+    minDistance (float): Metres a device must move for its location to be published.  Defaults to `10`
+    minInterval (float): Minimum seconds between location updates.  Defaults to `30`
+    logBatchSize (int): Number of buffered log entries that causes them to be published.  Defaults to `20`
+    logInterval (float): Maximum seconds a log entry is buffered for.  Defaults to `10`
+    fieldWindow (float): Seconds over which field changes are merged.  Defaults to `1`
+    """
+    LOG_SEVERITY_ERROR = 2
+
+    def __init__(self, engine, locationTopic, errorCodeTopic, notifyTopic, logTopic=None,
+                 minDistance=10.0, minInterval=30.0, logBatchSize=20, logInterval=10.0, fieldWindow=1.0):
+        self._engine = engine
+        self.locationTopic = locationTopic
+        self.errorCodeTopic = errorCodeTopic
+        self.notifyTopic = notifyTopic
+        self.logTopic = logTopic
+        self.minDistance = minDistance
+        self.minInterval = minInterval
+        self.logBatchSize = logBatchSize
+        self.logInterval = logInterval
+        self.fieldWindow = fieldWindow
+        self._wheel = sharedTimerWheel()
+        self._lock = threading.Lock()
+        # Held while notifications are taken and published, so they are published in the order
+        # they were taken.  Always acquired before _lock
+        self._sendLock = threading.Lock()
+
+        self._lastLocation = None
+        self._lastLocationTime = 0
+        self._pendingLocation = None
+        self._locationTask = None
+
+        self._lastErrorCode = None
+
+        self._logs = []
+        self._logTask = None
+
+        self._lastFields = {}
+        self._pendingFields = {}
+        self._fieldTask = None
+
+        self.published = 0
+        self.coalesced = 0
+
+    def _send(self, sends):
+        """
+        Publish the `(topic, data)` pairs collected while holding the lock, the caller holds the send lock
+        """
+        requests = [self._engine.send(topic, data) for (topic, data) in sends]
+        with self._lock:
+            self.published += len(requests)
+        return requests
+
+    def _coalesced(self, topic, data):
+        return DeviceMgmtRequest.coalescedRequest(topic, data)
+
+    # Location
+    def setLocation(self, location):
+        """
+        # Parameters
+        location (dict): The location, with at least `latitude` and `longitude`
+
+        # Returns
+        DeviceMgmtRequest: The request, or a coalesced request if the update is held or suppressed
+        """
+        location = dict(location)
+        with self._sendLock:
+            with self._lock:
+                if self._lastLocation is not None and time.time() - self._lastLocationTime < self.minInterval:
+                    if self._pendingLocation is not None:
+                        self.coalesced += 1
+                    self._pendingLocation = location
+                    if self._locationTask is None:
+                        delay = self._lastLocationTime + self.minInterval - time.time()
+                        self._locationTask = self._wheel.schedule(delay, self._flushLocation)
+                    return self._coalesced(self.locationTopic, location)
+                self._pendingLocation = location
+                sends = self._takeLocation()
+            if not sends:
+                return self._coalesced(self.locationTopic, location)
+            return self._send(sends)[0]
+
+    def _takeLocation(self):
+        location = self._pendingLocation
+        self._pendingLocation = None
+        if location is None:
+            return []
+        if self._lastLocation is not None and distance(self._lastLocation, location) < self.minDistance:
+            self.coalesced += 1
+            return []
+        self._lastLocation = location
+        self._lastLocationTime = time.time()
+        return [(self.locationTopic, location)]
+
+    def _flushLocation(self):
+        with self._sendLock:
+            with self._lock:
+                self._locationTask = None
+                sends = self._takeLocation()
+            self._send(sends)
+
+    # Error codes
+    def setErrorCode(self, errorCode):
+        with self._sendLock:
+            with self._lock:
+                if errorCode == self._lastErrorCode:
+                    self.coalesced += 1
+                    return self._coalesced(self.errorCodeTopic, {"errorCode": errorCode})
+                self._lastErrorCode = errorCode
+            return self._send([(self.errorCodeTopic, {"errorCode": errorCode})])[0]
+
+    def clearErrorCodes(self):
+        """
+        Forget the last error code published, call when the error codes are cleared
+        """
+        with self._lock:
+            self._lastErrorCode = None
+
+    # Logs
+    def addLog(self, entry):
+        """
+        # Parameters
+        entry (dict): The log entry, with `message`, `timestamp`, `data` and `severity`
+
+        # Returns
+        DeviceMgmtRequest: The request that carried the entry when the batch is published, or a
+            coalesced request if the entry is held
+        """
+        with self._sendLock:
+            with self._lock:
+                self._logs.append(entry)
+                if len(self._logs) < self.logBatchSize and entry.get("severity", 0) < DeviceMgmtCoalescer.LOG_SEVERITY_ERROR:
+                    if self._logTask is None:
+                        self._logTask = self._wheel.schedule(self.logInterval, self._flushLogs)
+                    return self._coalesced(self.logTopic, entry)
+                sends = self._takeLogs()
+            # The entry was the last in the batch, so it is carried by the last request, on its own or
+            # with the repeats before it
+            return self._send(sends)[-1]
+
+    def _takeLogs(self):
+        if self._logTask is not None:
+            self._logTask.cancel()
+            self._logTask = None
+        logs = self._logs
+        self._logs = []
+
+        sends = []
+        (previous, repeats) = (None, 0)
+        for entry in logs + [None]:
+            if previous is not None and entry is not None and \
+                    (entry["message"], entry["data"], entry["severity"]) == (previous["message"], previous["data"], previous["severity"]):
+                repeats += 1
+                self.coalesced += 1
+                continue
+            if previous is not None:
+                if repeats > 0:
+                    previous = dict(previous, message="%s (repeated %s times)" % (previous["message"], repeats + 1))
+                sends.append((self.logTopic, previous))
+            (previous, repeats) = (entry, 0)
+        return sends
+
+    def _flushLogs(self):
+        with self._sendLock:
+            with self._lock:
+                self._logTask = None
+                sends = self._takeLogs()
+            self._send(sends)
+
+    def discardLogs(self):
+        """
+        Discard the buffered log entries, call when the log is cleared
+        """
+        with self._lock:
+            if self._logTask is not None:
+                self._logTask.cancel()
+                self._logTask = None
+            self.coalesced += len(self._logs)
+            self._logs = []
+
+    # Field changes
+    def notifyFieldChange(self, field, value):
+        with self._lock:
+            if field in self._pendingFields:
+                self.coalesced += 1
+            self._pendingFields[field] = value
+            if self._fieldTask is None:
+                self._fieldTask = self._wheel.schedule(self.fieldWindow, self._flushFields)
+        return self._coalesced(self.notifyTopic, {"field": field, "value": value})
+
+    def _takeFields(self):
+        if self._fieldTask is not None:
+            self._fieldTask.cancel()
+            self._fieldTask = None
+        fields = self._pendingFields
+        self._pendingFields = {}
+
+        sends = []
+        for (field, value) in fields.items():
+            if field in self._lastFields and self._lastFields[field] == value:
+                self.coalesced += 1
+                continue
+            self._lastFields[field] = value
+            sends.append((self.notifyTopic, {"field": field, "value": value}))
+        return sends
+
+    def _flushFields(self):
+        with self._sendLock:
+            with self._lock:
+                self._fieldTask = None
+                sends = self._takeFields()
+            self._send(sends)
+
+    def flush(self):
+        """
+        Publish every held notification now, for example before disconnecting.  A held location
+        is still only published if it is `minDistance` from the last location published.
+
+        # Returns
+        list<DeviceMgmtRequest>: The requests published
+        """
+        with self._sendLock:
+            with self._lock:
+                if self._locationTask is not None:
+                    self._locationTask.cancel()
+                    self._locationTask = None
+                sends = self._takeLocation() + self._takeLogs() + self._takeFields()
+            return self._send(sends)
+
+    def metrics(self):
+        """
+        # Returns
+        dict: The number of notifications `published`, the number `coalesced` (merged with a later
+            notification or suppressed), and the number `pending`
+        """
+        with self._lock:
+            pending = len(self._logs) + len(self._pendingFields) + (1 if self._pendingLocation is not None else 0)
+        return {"published": self.published, "coalesced": self.coalesced, "pending": pending}
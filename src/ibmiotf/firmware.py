@@ -0,0 +1,306 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Firmware states and update statuses reported through the managed client, the same values as
+# the UPDATESTATE_ constants of ibmiotf.device.ManagedClient
+STATE_DOWNLOADING = 1
+STATE_DOWNLOADED = 2
+STATUS_OUT_OF_MEMORY = 2
+STATUS_CONNECTION_LOST = 3
+STATUS_VERIFICATION_FAILED = 4
+STATUS_INVALID_URI = 6
+
+# Hash algorithm of a verifier, by the length of its hex digest
+VERIFIER_ALGORITHMS = {32: "md5", 40: "sha1", 56: "sha224", 64: "sha256", 96: "sha384", 128: "sha512"}
+
+
+class FirmwareDownloadException(Exception):
+    """
+    A firmware image could not be downloaded, `status` is the update status that was reported
+    """
+    def __init__(self, reason, status):
+        Exception.__init__(self, reason)
+        self.reason = reason
+        self.status = status
+
+    def __str__(self):
+        return self.reason
+
+
+class FirmwareDownloader(object):
+    """
+    Downloads the firmware image described by a #ibmiotf.device.DeviceFirmware to a file.  The
+    image is streamed to disk `chunkSize` bytes at a time, so memory use does not depend on the
+    size of the image, and the checksum is updated as each chunk arrives rather than by reading
+    the file again afterwards.
+
+    The image is written to `<file>.<key>.part`, where the key is made from the url, version and
+    verifier of the image, and renamed when it is complete and verified.  If the transfer is
+    interrupted it is resumed from the end of the partial file with an HTTP `Range` request, up
+    to `retries` times, and a partial file left by an earlier attempt at the same image (for
+    example before a reboot) is resumed the same way, partial files of other images are removed.
+    Resumed requests carry an `If-Range` header with the `ETag` or `Last-Modified` of the first
+    response, so the download starts again from the beginning if the image changed on the server,
+    as it does when the server does not support ranges.
+
+    The firmware's `verifier` is compared with the hex digest of the image, using the algorithm
+    given, or else the one implied by the length of the verifier (32 characters for MD5, 64 for
+    SHA-256, ...).
+
+    ```python
+    downloader = FirmwareDownloader("/var/lib/firmware")
+    path = downloader.download(firmware, client)
+    ```
+
+    # Parameters
+    directory (string): Directory the image is written to
+    chunkSize (int): Bytes read and written at a time.  Defaults to `65536`
+    retries (int): Number of times an interrupted transfer is resumed.  Defaults to `5`
+    timeout (float): Seconds to wait to connect, and for each chunk to arrive.  Defaults to `30`
+    algorithm (string): Name of the `hashlib` algorithm of the verifier, optional
+    progressCallback (function): Called with the bytes downloaded and the total bytes (or `None`
+        if the server does not say) at most every `progressInterval` seconds, optional
+    progressInterval (float): Defaults to `5`
+    session (requests.Session): Session used for the requests, optional
+    """
+    def __init__(self, directory, chunkSize=65536, retries=5, timeout=30, algorithm=None,
+                 progressCallback=None, progressInterval=5, session=None):
+        self.directory = directory
+        self.chunkSize = chunkSize
+        self.retries = retries
+        self.timeout = timeout
+        self.algorithm = algorithm
+        self.progressCallback = progressCallback
+        self.progressInterval = progressInterval
+        self._session = session if session is not None else requests.Session()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Stop the download in progress after the current chunk, the partial file is kept.  A cancel
+        made before a download starts stops it as soon as it starts, until `reset()` is called.
+        """
+        self._cancelled.set()
+
+    def reset(self):
+        """
+        Forget an earlier cancel, call before accepting a new download so that a cancel that
+        arrives before the download starts is not lost
+        """
+        self._cancelled.clear()
+
+    def path(self, firmware):
+        """
+        The file a firmware image is downloaded to, named after the last part of its url
+        """
+        name = re.sub("[^A-Za-z0-9._-]", "_", firmware.url.rstrip("/").split("/")[-1].split("?")[0])
+        if name in ("", ".", ".."):
+            name = "firmware"
+        return os.path.join(self.directory, name)
+
+    def partPath(self, firmware):
+        """
+        The partial file a firmware image is downloaded to, only an attempt at the same image resumes it
+        """
+        key = "%s\n%s\n%s" % (firmware.url, firmware.version, firmware.verifier)
+        return "%s.%s.part" % (self.path(firmware), hashlib.sha1(key.encode("utf-8")).hexdigest()[:12])
+
+    def _removeOtherParts(self, firmware, partPath):
+        prefix = os.path.basename(self.path(firmware)) + "."
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(".part") and name != os.path.basename(partPath):
+                logger.info("Removing partial download of a different image: %s" % (name))
+                os.remove(os.path.join(self.directory, name))
+
+    def _hash(self, firmware):
+        algorithm = self.algorithm
+        if algorithm is None and firmware.verifier:
+            algorithm = VERIFIER_ALGORITHMS.get(len(firmware.verifier), None)
+        if algorithm is None:
+            return None
+        return hashlib.new(algorithm)
+
+    def download(self, firmware, client=None):
+        """
+        Download and verify a firmware image.  When a managed `client` is given the firmware state
+        is reported with `setState()` as the download starts and completes, and a failure is
+        reported with `setUpdateStatus()`.  The download is stopped if `cancel()` has been called
+        since the last `reset()`.
+
+        # Parameters
+        firmware (DeviceFirmware): The firmware to download, from the `mgmt.firmware` field
+        client (ibmiotf.device.ManagedClient): Client to report progress through, optional
+
+        # Returns
+        string: The path of the downloaded image
+
+        # Raises
+        FirmwareDownloadException: If the image can not be downloaded or does not match the verifier
+        """
+        if client is not None:
+            client.setState(STATE_DOWNLOADING)
+        try:
+            path = self._download(firmware)
+        except FirmwareDownloadException as e:
+            logger.error("Firmware download from %s failed: %s" % (firmware.url, e.reason))
+            if client is not None:
+                client.setUpdateStatus(e.status)
+            raise
+        except MemoryError:
+            if client is not None:
+                client.setUpdateStatus(STATUS_OUT_OF_MEMORY)
+            raise FirmwareDownloadException("Out of memory", STATUS_OUT_OF_MEMORY)
+        except (IOError, OSError) as e:
+            # Disk errors, such as running out of space
+            if client is not None:
+                client.setUpdateStatus(STATUS_OUT_OF_MEMORY)
+            raise FirmwareDownloadException("Unable to write firmware image: %s" % (str(e)), STATUS_OUT_OF_MEMORY)
+
+        firmware.path = path
+        if client is not None:
+            client.setState(STATE_DOWNLOADED)
+        return path
+
+    def _download(self, firmware):
+        if not firmware.url or not re.match("https?://", firmware.url):
+            raise FirmwareDownloadException("Invalid firmware url: %s" % (firmware.url), STATUS_INVALID_URI)
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self.path(firmware)
+        transfer = _Transfer(self.partPath(firmware), self._hash(firmware))
+        self._removeOtherParts(firmware, transfer.partPath)
+
+        # Resume a partial file left by an earlier attempt at this image, hashing what is already there
+        if os.path.exists(transfer.partPath):
+            with open(transfer.partPath, "rb") as f:
+                for chunk in iter(lambda: f.read(self.chunkSize), b""):
+                    transfer.add(chunk)
+
+        attempt = 0
+        while True:
+            if self._cancelled.is_set():
+                raise FirmwareDownloadException("Download cancelled", STATUS_CONNECTION_LOST)
+            try:
+                complete = self._transfer(firmware, transfer)
+            except requests.exceptions.RequestException as e:
+                # Every byte that reached the file has been hashed, so the transfer can resume from the offset
+                logger.warning("Firmware download from %s interrupted at %s bytes: %s" % (firmware.url, transfer.offset, str(e)))
+                complete = False
+            if complete:
+                break
+            attempt += 1
+            if attempt > self.retries:
+                raise FirmwareDownloadException("Download interrupted %s times" % (attempt), STATUS_CONNECTION_LOST)
+            time.sleep(min(2 ** attempt, 30))
+
+        if transfer.hasher is not None and firmware.verifier and transfer.hasher.hexdigest().lower() != firmware.verifier.lower():
+            os.remove(transfer.partPath)
+            raise FirmwareDownloadException("Image does not match verifier %s" % (firmware.verifier), STATUS_VERIFICATION_FAILED)
+
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(transfer.partPath, path)
+        return path
+
+    def _transfer(self, firmware, transfer):
+        """
+        Make one request for the rest of the image, appending what arrives to the partial file
+
+        # Returns
+        boolean: Whether the image is complete
+        """
+        headers = {}
+        if transfer.offset > 0:
+            headers["Range"] = "bytes=%s-" % (transfer.offset)
+            if transfer.validator is not None:
+                # The server sends the whole image instead of the range if it has changed since
+                headers["If-Range"] = transfer.validator
+        r = self._session.get(firmware.url, headers=headers, stream=True, timeout=self.timeout)
+        try:
+            if r.status_code == 416 and transfer.total is not None and transfer.offset >= transfer.total:
+                return True
+            if r.status_code == 416 or r.status_code == 200 and transfer.offset > 0:
+                # The server can't resume from here, start again from the beginning
+                logger.info("Firmware server did not accept a range request, restarting download from %s" % (firmware.url))
+                transfer.restart(self._hash(firmware))
+                if r.status_code == 416:
+                    return False
+            if r.status_code == 404 or r.status_code == 403:
+                raise FirmwareDownloadException("Firmware not found at %s: %s" % (firmware.url, r.status_code), STATUS_INVALID_URI)
+            if r.status_code not in (200, 206):
+                raise FirmwareDownloadException("Firmware download from %s failed: %s" % (firmware.url, r.status_code), STATUS_CONNECTION_LOST)
+
+            if transfer.validator is None:
+                transfer.validator = r.headers.get("ETag", None) or r.headers.get("Last-Modified", None)
+
+            contentRange = r.headers.get("Content-Range", None)
+            if r.status_code == 206 and contentRange and "/" in contentRange and not contentRange.endswith("*"):
+                transfer.total = int(contentRange.split("/")[-1])
+            elif "Content-Length" in r.headers:
+                transfer.total = transfer.offset + int(r.headers["Content-Length"])
+
+            lastProgress = time.time()
+            with open(transfer.partPath, "ab") as f:
+                for chunk in r.iter_content(self.chunkSize):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    transfer.add(chunk)
+
+                    if self.progressCallback is not None and time.time() - lastProgress >= self.progressInterval:
+                        lastProgress = time.time()
+                        self.progressCallback(transfer.offset, transfer.total)
+                    if self._cancelled.is_set():
+                        return False
+
+            if self.progressCallback is not None:
+                self.progressCallback(transfer.offset, transfer.total)
+            return transfer.total is None or transfer.offset >= transfer.total
+        finally:
+            r.close()
+
+
+class _Transfer(object):
+    """
+    Progress of one download: the partial file, the bytes in it, the hash of those bytes and the
+    `ETag` or `Last-Modified` of the image they came from
+    """
+    __slots__ = ["partPath", "offset", "total", "hasher", "validator"]
+
+    def __init__(self, partPath, hasher):
+        self.partPath = partPath
+        self.offset = 0
+        self.total = None
+        self.hasher = hasher
+        self.validator = None
+
+    def add(self, chunk):
+        self.offset += len(chunk)
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+
+    def restart(self, hasher):
+        if os.path.exists(self.partPath):
+            os.remove(self.partPath)
+        self.offset = 0
+        self.total = None
+        self.hasher = hasher
+        self.validator = None
@@ -14,8 +14,10 @@
 
 import json
 import re
+import time
+import zlib
+import heapq
 import pytz
-import uuid
 import threading
 import requests
 import logging
@@ -25,6 +27,8 @@ from datetime import datetime
 
 from ibmiotf import AbstractClient, InvalidEventException, UnsupportedAuthenticationMethod,ConfigurationException, ConnectionException, MissingMessageEncoderException,MissingMessageDecoderException
 from ibmiotf.codecs import jsonCodec
+from ibmiotf.dm import DeviceMgmtRequestEngine, DeviceMgmtCoalescer, DeviceMgmtAction
+from ibmiotf.scheduler import sharedTimerWheel
 from ibmiotf import api
 
 # Support Python 2.7 and 3.4 versions of configparser
@@ -33,16 +37,23 @@ try:
 except ImportError:
     import ConfigParser as configparser
 
+# Support Python 2.7 and 3.x locations of intern
+try:
+    from sys import intern as _intern
+except ImportError:
+    _intern = intern
+
 COMMAND_RE = re.compile("iot-2/type/(.+)/id/(.+)/cmd/(.+)/fmt/(.+)")
 
 class Command:
     def __init__(self, pahoMessage, messageEncoderModules):
-        result = COMMAND_RE.match(pahoMessage.topic)
-        if result:
-            self.type = result.group(1)
-            self.id = result.group(2)
-            self.command = result.group(3)
-            self.format = result.group(4)
+        # iot-2/type/<type>/id/<id>/cmd/<command>/fmt/<format>, none of the names can contain a "/"
+        parts = pahoMessage.topic.split("/")
+        if len(parts) == 9 and parts[0] == "iot-2" and parts[1] == "type" and parts[3] == "id" and parts[5] == "cmd" and parts[7] == "fmt":
+            self.type = parts[2]
+            self.id = parts[4]
+            self.command = parts[6]
+            self.format = parts[8]
 
             if self.format in messageEncoderModules:
                 message = messageEncoderModules[self.format].decode(pahoMessage)
@@ -72,6 +83,79 @@ class Notification:
         else:
             raise InvalidEventException("Received notification on invalid topic: %s" % (pahoMessage.topic))
 
+class CommandRoute(object):
+    """
+    Where the commands sent to one device attached to a gateway are delivered, see
+    `Client.routeDeviceCommands()`
+    """
+    __slots__ = ["handler", "commands", "executor"]
+
+    def __init__(self, handler=None, executor=None):
+        self.handler = handler
+        self.commands = {}
+        self.executor = executor
+
+
+class DeviceChannel(object):
+    """
+    Publishes one event on behalf of one device attached to a gateway, obtained with
+    `Client.deviceChannel()`.  The topic is built and the encoder looked up once, when the
+    channel is created, so `send()` only encodes the data and publishes it.  Unlike
+    `Client.publishDeviceEvent()`, `send()` does not wait for the gateway to connect, it returns
+    `False` straight away if the gateway is not connected.  The encoder is bound when the
+    channel is created, so channels created before `setMessageEncoderModule()` is called keep
+    the previous encoder.
+
+    ```python
+    channel = gatewayClient.deviceChannel("sensor", "s-0042", "reading")
+    for reading in readings:
+        channel.send({"t": reading})
+    ```
+    """
+    __slots__ = ["deviceType", "deviceId", "event", "msgFormat", "qos", "topic", "_encode", "_publish", "_connected", "_trackPublish"]
+
+    def __init__(self, gateway, deviceType, deviceId, event, msgFormat, qos=0):
+        self.deviceType = deviceType
+        self.deviceId = deviceId
+        self.event = event
+        self.msgFormat = msgFormat
+        self.qos = qos
+        self.topic = 'iot-2/type/' + deviceType + '/id/' + deviceId + '/evt/' + event + '/fmt/' + msgFormat
+        self._encode = gateway._messageEncoderModules[msgFormat].encode
+        self._publish = gateway.client.publish
+        self._connected = gateway.connectEvent
+        self._trackPublish = gateway._trackPublish
+
+    def send(self, data, on_publish=None):
+        """
+        Encode and publish the event
+
+        # Parameters
+        data: The data of the event
+        on_publish (function): Called when the event has been published, see `Client.publishDeviceEvent()`
+
+        # Returns
+        boolean: Whether the event was handed to the MQTT client
+        """
+        return self.sendEncoded(self._encode(data, datetime.now(pytz.utc)), on_publish)
+
+    def sendEncoded(self, payload, on_publish=None):
+        """
+        Publish an event whose payload is already encoded, for example when forwarding bytes
+        received from the device unchanged
+
+        # Returns
+        boolean: Whether the event was handed to the MQTT client
+        """
+        if not self._connected.is_set():
+            return False
+        result = self._publish(self.topic, payload, self.qos, False)
+        if result[0] != paho.MQTT_ERR_SUCCESS:
+            return False
+        self._trackPublish(result[1], on_publish)
+        return True
+
+
 class Client(AbstractClient):
 
     def __init__(self, options, logHandlers=None):
@@ -149,6 +233,12 @@ class Client(AbstractClient):
         self.client.on_disconnect = self._onDisconnect
         self.setMessageEncoderModule('json', jsonCodec)
 
+        # Channels handed out by deviceChannel(), by (deviceType, deviceId, event, msgFormat, qos)
+        self._deviceChannels = {}
+
+        # Command handlers of attached devices, by (deviceType, deviceId), see routeDeviceCommands()
+        self._commandRoutes = {}
+
         # Create api key for gateway authentication
         self.gatewayApiKey = "g/" + self._options['org'] + '/' + self._options['type'] + '/' + self._options['id']
         self.logger = logging.getLogger(self.__module__+"."+self.__class__.__name__)
@@ -255,28 +345,103 @@ class Client(AbstractClient):
 
                 result = self.client.publish(topic, payload=payload, qos=qos, retain=False)
                 if result[0] == paho.MQTT_ERR_SUCCESS:
-                    # Because we are dealing with aync pub/sub model and callbacks it is possible that 
-                    # the _onPublish() callback for this mid is called before we obtain the lock to place
-                    # the mid into the _onPublishCallbacks list.
-                    #
-                    # _onPublish knows how to handle a scenario where the mid is not present (no nothing)
-                    # in this scenario we will need to invoke the callback directly here, because at the time
-                    # the callback was invoked the mid was not yet in the list.
-                    with self._messagesLock:
-                        if result[1] in self._onPublishCallbacks:
-                            # Paho callback beat this thread so call callback inline now
-                            del self._onPublishCallbacks[result[1]]
-                            if on_publish is not None:
-                                on_publish()
-                        else:
-                            # this thread beat paho callback so set up for call later
-                            self._onPublishCallbacks[result[1]] = on_publish
+                    self._trackPublish(result[1], on_publish)
                     return True
                 else:
                     return False
             else:
                 raise MissingMessageEncoderException(msgFormat)
 
+    def _trackPublish(self, mid, on_publish):
+        # Because we are dealing with aync pub/sub model and callbacks it is possible that
+        # the _onPublish() callback for this mid is called before we obtain the lock to place
+        # the mid into the _onPublishCallbacks list.
+        #
+        # _onPublish knows how to handle a scenario where the mid is not present (no nothing)
+        # in this scenario we will need to invoke the callback directly here, because at the time
+        # the callback was invoked the mid was not yet in the list.
+        with self._messagesLock:
+            if mid in self._onPublishCallbacks:
+                # Paho callback beat this thread so call callback inline now
+                del self._onPublishCallbacks[mid]
+                if on_publish is not None:
+                    on_publish()
+            else:
+                # this thread beat paho callback so set up for call later
+                self._onPublishCallbacks[mid] = on_publish
+
+    def routeDeviceCommands(self, deviceType, deviceId, handler, command=None, executor=None):
+        """
+        Deliver the commands sent to one attached device straight to its handler, rather than
+        to `deviceCommandCallback`.  Routes are looked up in a dictionary by device, and then by
+        command name when handlers are registered for particular commands, so the cost of
+        delivering a command does not depend on how many devices the gateway serves.  Commands
+        for devices without a route still go to `deviceCommandCallback`.
+
+        ```python
+        gatewayClient.routeDeviceCommands("sensor", "s1", adapter.onCommand)
+        gatewayClient.routeDeviceCommands("sensor", "s1", adapter.onReboot, command="reboot")
+        ```
+
+        # Parameters
+        deviceType (string): Type of the attached device
+        deviceId (string): Id of the attached device
+        handler (function): Called with each #Command for the device
+        command (string): Only route this command to `handler`, other commands go to the device's
+            default handler if it has one.  Optional
+        executor (ibmiotf.scheduler.BoundedExecutor): Run the device's handlers on this executor
+            rather than on the MQTT client's thread, anything with a `submit(function, *args)`
+            method can be used.  A #ibmiotf.scheduler.BoundedExecutor runs a command on the MQTT
+            client's thread when its queue is full, one created with a single worker and `block`
+            keeps the device's commands in order instead.  Optional, when given it replaces the
+            device's previous executor
+        """
+        key = (deviceType, deviceId)
+        route = self._commandRoutes.get(key, None)
+        if route is None:
+            route = CommandRoute()
+            self._commandRoutes[key] = route
+        if command is None:
+            route.handler = handler
+        else:
+            route.commands[command] = handler
+        if executor is not None:
+            route.executor = executor
+
+    def unrouteDeviceCommands(self, deviceType, deviceId, command=None):
+        """
+        Remove the route of an attached device, or of one of its commands if `command` is given
+        """
+        key = (deviceType, deviceId)
+        route = self._commandRoutes.get(key, None)
+        if route is None:
+            return
+        if command is None:
+            del self._commandRoutes[key]
+        else:
+            route.commands.pop(command, None)
+
+    def deviceChannel(self, deviceType, deviceId, event, msgFormat="json", qos=0):
+        """
+        Get the #DeviceChannel for publishing one event of one device, for gateways that forward
+        the same events for the same devices many times.  Channels are cached, so each device
+        and event gets a single channel however many times this is called.
+
+        # Returns
+        DeviceChannel: The channel
+
+        # Raises
+        MissingMessageEncoderException: If there is no encoder for `msgFormat`
+        """
+        key = (deviceType, deviceId, event, msgFormat, qos)
+        channel = self._deviceChannels.get(key, None)
+        if channel is None:
+            if msgFormat not in self._messageEncoderModules:
+                raise MissingMessageEncoderException(msgFormat)
+            channel = DeviceChannel(self, deviceType, deviceId, event, msgFormat, qos)
+            self._deviceChannels[key] = channel
+        return channel
+
 
     '''
     Publish an event in Watson IoT as a device.
@@ -314,22 +479,7 @@ class Client(AbstractClient):
 
                 result = self.client.publish(topic, payload=payload, qos=qos, retain=False)
                 if result[0] == paho.MQTT_ERR_SUCCESS:
-                    # Because we are dealing with aync pub/sub model and callbacks it is possible that 
-                    # the _onPublish() callback for this mid is called before we obtain the lock to place
-                    # the mid into the _onPublishCallbacks list.
-                    #
-                    # _onPublish knows how to handle a scenario where the mid is not present (no nothing)
-                    # in this scenario we will need to invoke the callback directly here, because at the time
-                    # the callback was invoked the mid was not yet in the list.
-                    with self._messagesLock:
-                        if result[1] in self._onPublishCallbacks:
-                            # paho callback beat this thread so call callback inline now
-                            if on_publish is not None:
-                              on_publish()
-                            del self._onPublishCallbacks[result[1]]
-                        else:
-                            # this thread beat paho callback so set up for call later
-                            self._onPublishCallbacks[result[1]] = on_publish
+                    self._trackPublish(result[1], on_publish)
                     return True
                 else:
                     return False
@@ -427,6 +577,15 @@ class Client(AbstractClient):
             self.logger.critical(str(e))
         else:
             self.logger.debug("Received gateway command '%s'" % (command.command))
+            route = self._commandRoutes.get((command.type, command.id), None)
+            if route is not None:
+                handler = route.commands.get(command.command, route.handler)
+                if handler is not None:
+                    if route.executor is not None:
+                        route.executor.submit(handler, command)
+                    else:
+                        handler(command)
+                    return
             if self.deviceCommandCallback: self.deviceCommandCallback(command)
 
     '''
@@ -459,6 +618,291 @@ class DeviceInfo(object):
         return json.dumps(self.__dict__, sort_keys=True)
 
 
+# The fields of DeviceInfo, in the order child devices keep them
+DEVICE_INFO_FIELDS = ("serialNumber", "manufacturer", "model", "deviceClass", "description", "fwVersion", "hwVersion", "descriptiveLocation")
+
+
+def _childKey(typeId, deviceId):
+    # Children are kept, and their requests sent, under string ids, with the type ids shared
+    return (_intern(str(typeId)), str(deviceId))
+
+
+class ChildDevice(object):
+    """
+    A device managed through a gateway by a #ChildDeviceManager.  The device information is
+    kept as a tuple in the order of `DEVICE_INFO_FIELDS`, or `None` if none is set.
+    """
+    __slots__ = ["typeId", "deviceId", "info", "metadata", "supports", "managed", "due", "lastManaged"]
+
+    def __init__(self, typeId, deviceId, info, metadata, supports):
+        self.typeId = typeId
+        self.deviceId = deviceId
+        self.info = info
+        self.metadata = metadata
+        self.supports = supports
+        self.managed = False
+        self.due = None
+        self.lastManaged = None
+
+    @property
+    def deviceInfo(self):
+        """
+        The device information as a dict, with the fields that are not set left out
+        """
+        if self.info is None:
+            return {}
+        return dict((field, value) for (field, value) in zip(DEVICE_INFO_FIELDS, self.info) if value is not None)
+
+
+class ChildDeviceManager(object):
+    """
+    Manages many devices attached to a gateway over the gateway's connection, using the gateway
+    DM topics with each child's type and id.  Manage requests, for new children and to renew
+    their lifetime, are sent from a single task on the process-wide
+    #ibmiotf.scheduler.TimerWheel, at most `batchSize` every `interval` seconds, so adding
+    thousands of children does not flood the connection.  Each child's renewal is due
+    `lifetime - 120` seconds after it was last sent, less an offset derived from its id that
+    spreads renewals over the last `spread` fraction of that time, so renewals of children added
+    together do not all fall in the same second.
+
+    Responses are tracked by the gateway's #ibmiotf.dm.DeviceMgmtRequestEngine, with one shared
+    action for all children rather than one registration per child topic.
+
+    ```python
+    children = gatewayClient.enableChildDeviceManagement(lifetime=3600, batchSize=100)
+    for sensor in sensors:
+        children.add("sensor", sensor.id, supportDeviceActions=True)
+    ```
+
+    # Parameters
+    gateway (ManagedClient): The gateway the children are attached to
+    lifetime (int): Lifetime of the children in seconds, `0` for no expiry.  Defaults to `3600`
+    batchSize (int): Maximum manage requests sent every `interval`.  Defaults to `50`
+    interval (float): Seconds between batches.  Defaults to `1`
+    spread (float): Fraction of the renewal period over which renewals are spread.  Defaults to `0.25`
+    retryInterval (float): Seconds before a failed manage request is retried.  Defaults to `60`
+    """
+    def __init__(self, gateway, lifetime=3600, batchSize=50, interval=1.0, spread=0.25, retryInterval=60):
+        # The minimum lifetime is 1 hour, anything less is treated as no expiry, as for the gateway itself
+        if lifetime < 3600:
+            lifetime = 0
+        self._gateway = gateway
+        self.lifetime = lifetime
+        self.batchSize = batchSize
+        self.interval = interval
+        self.spread = spread
+        self.retryInterval = retryInterval
+        self._wheel = sharedTimerWheel()
+
+        self._children = {}
+        # Heap of (due time, typeId, deviceId), entries that no longer match the child's due time are skipped
+        self._queue = []
+        self._lock = threading.Lock()
+        self._task = None
+        self._lastBatch = 0
+        self._managedCount = 0
+        self.sent = 0
+        self.failed = 0
+
+        self._manageAction = DeviceMgmtAction("Manage child device", onSuccess=self._onManaged, onFailure=self._onFailed)
+        self._unmanageAction = DeviceMgmtAction("Unmanage child device")
+
+    def __len__(self):
+        return len(self._children)
+
+    def __contains__(self, key):
+        return _childKey(*key) in self._children
+
+    def __iter__(self):
+        return iter(list(self._children.values()))
+
+    def get(self, typeId, deviceId):
+        """
+        # Returns
+        ChildDevice: The child, or `None` if it has not been added
+        """
+        return self._children.get(_childKey(typeId, deviceId), None)
+
+    def isManaged(self, typeId, deviceId):
+        child = self._children.get(_childKey(typeId, deviceId), None)
+        return child is not None and child.managed
+
+    @property
+    def managedCount(self):
+        return self._managedCount
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    def add(self, typeId, deviceId, deviceInfo=None, metadata=None, supportDeviceActions=False, supportFirmwareActions=False):
+        """
+        Add a child device, its manage request is sent with the next batch.  Adding a child that
+        has already been added updates its information, which is sent with its next renewal, or
+        with the next batch if it has no renewal due because the lifetime is `0`.
+
+        # Parameters
+        typeId (string): Type of the child device
+        deviceId (string): Id of the child device
+        deviceInfo (DeviceInfo or dict): Device information, optional
+        metadata (dict): Device metadata, optional
+        supportDeviceActions (boolean): Whether the child supports device actions
+        supportFirmwareActions (boolean): Whether the child supports firmware actions
+
+        # Returns
+        ChildDevice: The child
+        """
+        if deviceInfo is None:
+            info = None
+        else:
+            if not isinstance(deviceInfo, dict):
+                deviceInfo = deviceInfo.__dict__
+            info = tuple(deviceInfo.get(field, None) for field in DEVICE_INFO_FIELDS)
+            if not any(value is not None for value in info):
+                info = None
+        supports = (supportDeviceActions, supportFirmwareActions)
+
+        key = _childKey(typeId, deviceId)
+        with self._lock:
+            child = self._children.get(key, None)
+            if child is not None:
+                child.info = info
+                child.metadata = metadata
+                child.supports = supports
+                if child.due is None:
+                    # Without a renewal the updated information would never be sent
+                    self._enqueue(child, time.time())
+            else:
+                child = ChildDevice(key[0], key[1], info, metadata, supports)
+                self._children[key] = child
+                self._enqueue(child, time.time())
+        self._schedule()
+        return child
+
+    def addAll(self, devices):
+        """
+        Add many child devices
+
+        # Parameters
+        devices (iterable): `(typeId, deviceId)` tuples, or dicts of the parameters of `add()`
+        """
+        for device in devices:
+            if isinstance(device, dict):
+                self.add(**device)
+            else:
+                self.add(device[0], device[1])
+
+    def remove(self, typeId, deviceId):
+        """
+        Stop managing a child device, an unmanage request is sent if it is managed
+
+        # Returns
+        DeviceMgmtRequest: The unmanage request, or `None` if the child was not managed
+        """
+        with self._lock:
+            child = self._children.pop(_childKey(typeId, deviceId), None)
+            if child is None:
+                return None
+            child.due = None
+            wasManaged = child.managed
+            if wasManaged:
+                child.managed = False
+                self._managedCount -= 1
+        if not wasManaged:
+            return None
+        topic = ManagedClient.UNMANAGE_TOPIC_TEMPLATE % (child.typeId, child.deviceId)
+        return self._gateway.deviceMgmtRequests.send(topic, action=self._unmanageAction, context=child)
+
+    def _enqueue(self, child, due):
+        child.due = due
+        heapq.heappush(self._queue, (due, child.typeId, child.deviceId))
+
+    def _renewalDelay(self, child):
+        if self.lifetime == 0:
+            return None
+        period = self.lifetime - 120
+        # Children added together are renewed at different times, by an offset derived from their id
+        offset = (zlib.crc32(("%s:%s" % (child.typeId, child.deviceId)).encode("utf-8")) & 0xffffffff) % max(1, int(period * self.spread))
+        return period - offset
+
+    def _schedule(self):
+        with self._lock:
+            if self._task is not None or not self._queue:
+                return
+            now = time.time()
+            delay = max(0, self._queue[0][0] - now, self._lastBatch + self.interval - now)
+            self._task = self._wheel.schedule(delay, self._sendBatch)
+
+    def _sendBatch(self):
+        now = time.time()
+        batch = []
+        with self._lock:
+            self._task = None
+            self._lastBatch = now
+            if self._gateway.connectEvent.is_set():
+                while self._queue and len(batch) < self.batchSize and self._queue[0][0] <= now:
+                    (due, typeId, deviceId) = heapq.heappop(self._queue)
+                    child = self._children.get((typeId, deviceId), None)
+                    if child is None or child.due != due:
+                        continue
+                    delay = self._renewalDelay(child)
+                    if delay is None:
+                        child.due = None
+                    else:
+                        self._enqueue(child, now + delay)
+                    batch.append(child)
+
+        for child in batch:
+            self._manage(child)
+
+        with self._lock:
+            if self._queue:
+                self._task = self._wheel.schedule(max(self.interval, self._queue[0][0] - time.time()), self._sendBatch)
+
+    def _manage(self, child):
+        data = {
+            "lifetime": self.lifetime,
+            "supports": {
+                "deviceActions": child.supports[0],
+                "firmwareActions": child.supports[1]
+            },
+            "deviceInfo": child.deviceInfo,
+            "metadata": child.metadata if child.metadata is not None else {}
+        }
+        topic = ManagedClient.MANAGE_TOPIC_TEMPLATE % (child.typeId, child.deviceId)
+        self.sent += 1
+        return self._gateway.deviceMgmtRequests.send(topic, data, action=self._manageAction, context=child)
+
+    def _onManaged(self, request):
+        child = request.context
+        with self._lock:
+            child.lastManaged = time.time()
+            if not child.managed and (child.typeId, child.deviceId) in self._children:
+                child.managed = True
+                self._managedCount += 1
+
+    def _onFailed(self, request):
+        child = request.context
+        with self._lock:
+            self.failed += 1
+            if (child.typeId, child.deviceId) not in self._children:
+                return
+            if child.managed:
+                child.managed = False
+                self._managedCount -= 1
+            self._enqueue(child, time.time() + self.retryInterval)
+        self._schedule()
+
+    def metrics(self):
+        """
+        # Returns
+        dict: The number of `children`, the number `managed`, the number of manage requests
+            `queued`, `sent` and `failed`
+        """
+        return {"children": len(self._children), "managed": self._managedCount, "queued": len(self._queue),
+                "sent": self.sent, "failed": self.failed}
+
+
 class ManagedClient(Client):
 
     # Publish MQTT topics
@@ -485,6 +929,8 @@ class ManagedClient(Client):
     # Subscribe MQTT topics
     DM_RESPONSE_TOPIC_TEMPLATE = 'iotdm-1/type/%s/id/%s/response'
     DM_OBSERVE_TOPIC_TEMPLATE = 'iotdm-1/type/%s/id/%s/observe'
+    # Responses to the DM requests of the gateway and of its child devices
+    DM_CHILD_RESPONSE_TOPIC = 'iotdm-1/type/+/id/+/response'
 
     def __init__(self, options, logHandlers=None, deviceInfo=None):
         if options['org'] == "quickstart":
@@ -493,16 +939,12 @@ class ManagedClient(Client):
         Client.__init__(self, options, logHandlers)
         # TODO: Raise fatal exception if tries to create managed device client for QuickStart
 
-        # Add handler for supported device management commands
-        self.client.message_callback_add("iotdm-1/#", self.__onDeviceMgmtResponse)
+        # Add handler for device management responses
+        self.client.message_callback_add(ManagedClient.DM_CHILD_RESPONSE_TOPIC, self.__onDeviceMgmtResponse)
         self.client.on_subscribe = self.__onSubscribe
 
         self.readyForDeviceMgmt = threading.Event()
 
-        # List of DM requests that have not received a response yet
-        self._deviceMgmtRequestsPendingLock = threading.Lock()
-        self._deviceMgmtRequestsPending = {}
-
         # List of DM notify hook
         self._deviceMgmtObservationsLock = threading.Lock()
         self._deviceMgmtObservations = []
@@ -520,6 +962,64 @@ class ManagedClient(Client):
         self._gatewayType = self._options['type']
         self._gatewayId = self._options['id']
 
+        self.manageTimer = None
+
+        # The gateway's DM topics are fixed, so build them once
+        self._manageTopic = ManagedClient.MANAGE_TOPIC_TEMPLATE % (self._gatewayType, self._gatewayId)
+        self._unmanageTopic = ManagedClient.UNMANAGE_TOPIC_TEMPLATE % (self._gatewayType, self._gatewayId)
+        self._updateLocationTopic = ManagedClient.UPDATE_LOCATION_TOPIC_TEMPLATE % (self._gatewayType, self._gatewayId)
+        self._addErrorCodeTopic = ManagedClient.ADD_ERROR_CODE_TOPIC_TEMPLATE % (self._gatewayType, self._gatewayId)
+        self._clearErrorCodesTopic = ManagedClient.CLEAR_ERROR_CODES_TOPIC_TEMPLATE % (self._gatewayType, self._gatewayId)
+        self._notifyTopic = ManagedClient.NOTIFY_TOPIC_TEMPLATE % (self._gatewayType, self._gatewayId)
+
+        # DM requests that have not received a response yet, by the topic they are published to
+        self.deviceMgmtRequests = DeviceMgmtRequestEngine(self.client, self.logger)
+        self.deviceMgmtRequests.register(self._manageTopic, "Manage", onSuccess=lambda request: self.readyForDeviceMgmt.set())
+        self.deviceMgmtRequests.register(self._unmanageTopic, "Unmanage", onSuccess=lambda request: self.readyForDeviceMgmt.clear())
+        self.deviceMgmtRequests.register(self._updateLocationTopic, "Location update")
+        self.deviceMgmtRequests.register(self._addErrorCodeTopic, "Add error code")
+        self.deviceMgmtRequests.register(self._clearErrorCodesTopic, "Clear error codes")
+        self.deviceMgmtRequests.register(self._notifyTopic, "Notify field change")
+
+        # Merges and suppresses DM notifications when enabled, see enableCoalescing()
+        self.coalescer = None
+
+        # Manages attached devices when enabled, see enableChildDeviceManagement()
+        self.childDevices = None
+
+    def enableChildDeviceManagement(self, lifetime=3600, batchSize=50, interval=1.0, spread=0.25, retryInterval=60):
+        """
+        Manage devices attached to the gateway over the gateway's connection, see #ChildDeviceManager
+        for the parameters.  The gateway subscribes to the DM responses of all its children.
+
+        # Returns
+        ChildDeviceManager: The manager, use `add()` to manage a child device
+        """
+        if self.childDevices is None:
+            self.childDevices = ChildDeviceManager(self, lifetime=lifetime, batchSize=batchSize, interval=interval, spread=spread,
+                                                   retryInterval=retryInterval)
+            if self.connectEvent.is_set():
+                self.client.subscribe(ManagedClient.DM_CHILD_RESPONSE_TOPIC, qos=1)
+        return self.childDevices
+
+    def enableCoalescing(self, minDistance=10.0, minInterval=30.0, fieldWindow=1.0):
+        """
+        Publish fewer location, error code and field change notifications for the gateway, see
+        #ibmiotf.dm.DeviceMgmtCoalescer for the rules and parameters
+
+        # Returns
+        DeviceMgmtCoalescer: The coalescer, see `flush()` and `metrics()`
+        """
+        self.coalescer = DeviceMgmtCoalescer(
+            self.deviceMgmtRequests,
+            self._updateLocationTopic,
+            self._addErrorCodeTopic,
+            self._notifyTopic,
+            minDistance=minDistance,
+            minInterval=minInterval,
+            fieldWindow=fieldWindow
+        )
+        return self.coalescer
 
     def setSerialNumber(self, serialNumber):
         self._deviceInfo.serialNumber = serialNumber
@@ -561,23 +1061,9 @@ class ManagedClient(Client):
                     self.logger.warning("Unable to notify service of field change because gateway is not ready for gateway management")
                     return threading.Event().set()
 
-                reqId = str(uuid.uuid4())
-                message = {
-                    "d": {
-                        "field": field,
-                        "value": value
-                    },
-                    "reqId": reqId
-                }
-
-                notify_topic = ManagedClient.NOTIFY_TOPIC_TEMPLATE %  (self._gatewayType,self._gatewayId)
-                resolvedEvent = threading.Event()
-
-                self.client.publish(notify_topic, payload=json.dumps(message), qos=1, retain=False)
-                with self._deviceMgmtRequestsPendingLock:
-                    self._deviceMgmtRequestsPending[reqId] = {"topic": notify_topic, "message": message, "event": resolvedEvent}
-
-                return resolvedEvent
+                if self.coalescer is not None:
+                    return self.coalescer.notifyFieldChange(field, value)
+                return self.deviceMgmtRequests.send(self._notifyTopic, {"field": field, "value": value})
             else:
                 return threading.Event().set()
 
@@ -588,7 +1074,10 @@ class ManagedClient(Client):
             if self._options['org'] != "quickstart":
                 dm_response_topic = ManagedClient.DM_RESPONSE_TOPIC_TEMPLATE %  (self._gatewayType,self._gatewayId)
                 dm_observe_topic = ManagedClient.DM_OBSERVE_TOPIC_TEMPLATE %  (self._gatewayType,self._gatewayId)
-                (self.dmSubscriptionResult, self.dmSubscriptionMid) = self.client.subscribe( [(dm_response_topic, 1), (dm_observe_topic, 1), (self.COMMAND_TOPIC, 1)] )
+                subscriptions = [(dm_response_topic, 1), (dm_observe_topic, 1), (self.COMMAND_TOPIC, 1)]
+                if self.childDevices is not None:
+                    subscriptions.append((ManagedClient.DM_CHILD_RESPONSE_TOPIC, 1))
+                (self.dmSubscriptionResult, self.dmSubscriptionMid) = self.client.subscribe(subscriptions)
 
                 if self.dmSubscriptionResult != paho.MQTT_ERR_SUCCESS:
                     self._logAndRaiseException(ConnectionException("Unable to subscribe to device management topics"))
@@ -621,32 +1110,23 @@ class ManagedClient(Client):
             self.logger.warning("Unable to send register for device management because device subscriptions are not in place")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            'd': {
-                "lifetime": lifetime,
-                "supports": {
-                    "deviceActions": supportDeviceActions,
-                    "firmwareActions": supportFirmwareActions
-                },
-                "deviceInfo" : self._deviceInfo.__dict__,
-                "metadata" : self.metadata
+        request = self.deviceMgmtRequests.send(self._manageTopic, {
+            "lifetime": lifetime,
+            "supports": {
+                "deviceActions": supportDeviceActions,
+                "firmwareActions": supportFirmwareActions
             },
-            'reqId': reqId
-        }
-
-        manage_topic = ManagedClient.MANAGE_TOPIC_TEMPLATE % (self._gatewayType,self._gatewayId)
-        resolvedEvent = threading.Event()
-
-        self.client.publish(manage_topic, payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {"topic": manage_topic, "message": message, "event": resolvedEvent}
+            "deviceInfo" : self._deviceInfo.__dict__,
+            "metadata" : self.metadata
+        })
 
         # Register the future call back to Watson IoT Platform 2 minutes before the device lifetime expiry
         if lifetime != 0:
-            threading.Timer(lifetime-120, self.manage, [lifetime, supportDeviceActions, supportFirmwareActions]).start()
+            if self.manageTimer is not None:
+                self.manageTimer.cancel()
+            self.manageTimer = sharedTimerWheel().schedule(lifetime-120, self.manage, lifetime, supportDeviceActions, supportFirmwareActions)
 
-        return resolvedEvent
+        return request
 
 
     def unmanage(self):
@@ -654,19 +1134,9 @@ class ManagedClient(Client):
             self.logger.warning("Unable to set device to unmanaged because device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            'reqId': reqId
-        }
-
-        unmanage_topic = ManagedClient.UNMANAGE_TOPIC_TEMPLATE % (self._gatewayType,self._gatewayId)
-        resolvedEvent = threading.Event()
-
-        self.client.publish(unmanage_topic, payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {"topic": unmanage_topic, "message": message, "event": resolvedEvent}
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            self.coalescer.flush()
+        return self.deviceMgmtRequests.send(self._unmanageTopic)
 
     def setLocation(self, longitude, latitude, elevation=None, accuracy=None):
         # TODO: Add validation (e.g. ensure numeric values)
@@ -689,20 +1159,9 @@ class ManagedClient(Client):
             self.logger.warning("Unable to publish device location because device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "d": self._location,
-            "reqId": reqId
-        }
-
-        update_location_topic = ManagedClient.UPDATE_LOCATION_TOPIC_TEMPLATE % (self._gatewayType,self._gatewayId)
-        resolvedEvent = threading.Event()
-
-        self.client.publish(update_location_topic, payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {"topic": update_location_topic, "message": message, "event": resolvedEvent}
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            return self.coalescer.setLocation(self._location)
+        return self.deviceMgmtRequests.send(self._updateLocationTopic, self._location)
 
 
     def setErrorCode(self, errorCode=0):
@@ -715,20 +1174,9 @@ class ManagedClient(Client):
             self.logger.warning("Unable to publish error code because device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "d": { "errorCode": errorCode },
-            "reqId": reqId
-        }
-
-        add_error_code_topic = ManagedClient.ADD_ERROR_CODE_TOPIC_TEMPLATE %  (self._gatewayType,self._gatewayId)
-        resolvedEvent = threading.Event()
-
-        self.client.publish(add_error_code_topic, payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {"topic": add_error_code_topic, "message": message, "event": resolvedEvent}
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            return self.coalescer.setErrorCode(errorCode)
+        return self.deviceMgmtRequests.send(self._addErrorCodeTopic, {"errorCode": errorCode})
 
     def clearErrorCodes(self):
         self._errorCode = None
@@ -737,87 +1185,13 @@ class ManagedClient(Client):
             self.logger.warning("Unable to clear error codes because device is not ready for device management")
             return threading.Event().set()
 
-        reqId = str(uuid.uuid4())
-        message = {
-            "reqId": reqId
-        }
-
-        clear_error_codes_topic = ManagedClient.CLEAR_ERROR_CODES_TOPIC_TEMPLATE %  (self._gatewayType,self._gatewayId)
-        resolvedEvent = threading.Event()
-
-        self.client.publish(clear_error_codes_topic, payload=json.dumps(message), qos=1, retain=False)
-        with self._deviceMgmtRequestsPendingLock:
-            self._deviceMgmtRequestsPending[reqId] = {"topic": clear_error_codes_topic, "message": message, "event": resolvedEvent}
-
-        return resolvedEvent
+        if self.coalescer is not None:
+            self.coalescer.clearErrorCodes()
+        return self.deviceMgmtRequests.send(self._clearErrorCodesTopic)
 
 
     def __onDeviceMgmtResponse(self, client, userdata, pahoMessage):
-        try:
-            data = json.loads(pahoMessage.payload.decode("utf-8"))
-
-            rc = data['rc']
-            reqId = data['reqId']
-        except ValueError as e:
-            raise Exception("Unable to parse JSON.  payload=\"%s\" error=%s" % (pahoMessage.payload, str(e)))
-        else:
-            request = None
-            with self._deviceMgmtRequestsPendingLock:
-                try:
-                    request = self._deviceMgmtRequestsPending.pop(reqId)
-                except KeyError:
-                    self.logger.warning("Received unexpected response from device management: %s" % (reqId))
-                else:
-                    self.logger.debug("Remaining unprocessed device management requests: %s" % (len(self._deviceMgmtRequestsPending)))
-
-
-            if request is None:
-                return False
-
-            manage_topic = ManagedClient.MANAGE_TOPIC_TEMPLATE % (self._gatewayType,self._gatewayId)
-            unmanage_topic = ManagedClient.UNMANAGE_TOPIC_TEMPLATE % (self._gatewayType,self._gatewayId)
-            update_location_topic = ManagedClient.UPDATE_LOCATION_TOPIC_TEMPLATE % (self._gatewayType,self._gatewayId)
-            add_error_code_topic = ManagedClient.ADD_ERROR_CODE_TOPIC_TEMPLATE % (self._gatewayType,self._gatewayId)
-            clear_error_codes_topic = ManagedClient.CLEAR_ERROR_CODES_TOPIC_TEMPLATE %  (self._gatewayType,self._gatewayId)
-
-            if request['topic'] == manage_topic:
-                if rc == 200:
-                    self.logger.info("[%s] Manage action completed: %s" % (rc, json.dumps(request['message'])))
-                    self.readyForDeviceMgmt.set()
-                else:
-                    self.logger.critical("[%s] Manage action failed: %s" % (rc, json.dumps(request['message'])))
-
-            elif request['topic'] == unmanage_topic:
-                if rc == 200:
-                    self.logger.info("[%s] Unmanage action completed: %s" % (rc, json.dumps(request['message'])))
-                    self.readyForDeviceMgmt.clear()
-                else:
-                    self.logger.critical("[%s] Unmanage action failed: %s" % (rc, json.dumps(request['message'])))
-
-            elif request['topic'] == update_location_topic:
-                if rc == 200:
-                    self.logger.info("[%s] Location update action completed: %s" % (rc, json.dumps(request['message'])))
-                else:
-                    self.logger.critical("[%s] Location update action failed: %s" % (rc, json.dumps(request['message'])))
-
-            elif request['topic'] == add_error_code_topic:
-                if rc == 200:
-                    self.logger.info("[%s] Add error code action completed: %s" % (rc, json.dumps(request['message'])))
-                else:
-                    self.logger.critical("[%s] Add error code action failed: %s" % (rc, json.dumps(request['message'])))
-
-            elif request['topic'] == clear_error_codes_topic:
-                if rc == 200:
-                    self.logger.info("[%s] Clear error codes action completed: %s" % (rc, json.dumps(request['message'])))
-                else:
-                    self.logger.critical("[%s] Clear error codes action failed: %s" % (rc, json.dumps(request['message'])))
-
-            else:
-                self.logger.warning("[%s] Unknown action response: %s" % (rc, json.dumps(request['message'])))
-
-            # Now clear the event, allowing anyone that was waiting on this to proceed
-            request["event"].set()
-            return True
+        return self.deviceMgmtRequests.handleResponse(pahoMessage)
 
 
 
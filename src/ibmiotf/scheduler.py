@@ -0,0 +1,320 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import math
+import time
+import logging
+import threading
+
+# Support Python 2.7 and 3.x names of the queue module
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor(object):
+    """
+    Runs functions on a small pool of worker threads fed from a bounded queue, in place of
+    starting a thread per call.  Workers are started as they are needed, up to `maxWorkers`.
+    When the queue is full the function runs in the calling thread instead, so bursts slow
+    the caller down rather than growing without limit.  With `block` the caller waits for room
+    in the queue instead, so functions submitted to a single worker always run in order.
+
+    ```python
+    executor = BoundedExecutor(maxWorkers=4)
+    executor.submit(client.respondDeviceAction, reqId, 202)
+    print(executor.metrics())
+    ```
+
+    # Parameters
+    maxWorkers (int): Maximum number of worker threads.  Defaults to `4`
+    maxQueueSize (int): Maximum number of functions waiting for a worker.  Defaults to `1000`
+    name (string): Prefix of the worker thread names
+    block (boolean): Wait for room in the queue rather than running in the caller when it is full.
+        Defaults to `False`
+    """
+    def __init__(self, maxWorkers=4, maxQueueSize=1000, name="executor", block=False):
+        self.maxWorkers = maxWorkers
+        self.name = name
+        self.block = block
+        self._queue = queue.Queue(maxQueueSize)
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._idle = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.callerRuns = 0
+        self.maxQueueDepth = 0
+
+    @property
+    def queueDepth(self):
+        return self._queue.qsize()
+
+    def submit(self, function, *args):
+        """
+        Run `function(*args)` on a worker thread.  If the queue is full it runs in the calling
+        thread, or with `block` the call waits until there is room in the queue
+        """
+        with self._lock:
+            self.submitted += 1
+            if self._idle == 0 and self._workers < self.maxWorkers:
+                self._workers += 1
+                worker = threading.Thread(target=self._work, name="%s-%s" % (self.name, self._workers))
+                worker.daemon = True
+                worker.start()
+
+        if self.block:
+            self._queue.put((function, args))
+            self._updateMaxQueueDepth()
+            return
+
+        try:
+            self._queue.put_nowait((function, args))
+        except queue.Full:
+            with self._lock:
+                self.callerRuns += 1
+            self._run(function, args)
+            return
+        self._updateMaxQueueDepth()
+
+    def _updateMaxQueueDepth(self):
+        depth = self._queue.qsize()
+        if depth > self.maxQueueDepth:
+            self.maxQueueDepth = depth
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            (function, args) = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            self._run(function, args)
+
+    def _run(self, function, args):
+        try:
+            function(*args)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.exception("Background task %s failed: %s" % (function, str(e)))
+        finally:
+            with self._lock:
+                self.completed += 1
+
+    def metrics(self):
+        """
+        # Returns
+        dict: The current `queueDepth`, the `maxQueueDepth` seen, the number of `workers`, and
+            the number of functions `submitted`, `completed`, `failed` and run in the caller (`callerRuns`)
+        """
+        return {
+            "queueDepth": self.queueDepth,
+            "maxQueueDepth": self.maxQueueDepth,
+            "workers": self._workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "callerRuns": self.callerRuns
+        }
+
+
+class TimerTask(object):
+    """
+    A function scheduled on a #TimerWheel, returned by `TimerWheel.schedule()`
+    """
+    __slots__ = ["_wheel", "tick", "function", "args", "cancelled"]
+
+    def __init__(self, wheel, tick, function, args):
+        self._wheel = wheel
+        self.tick = tick
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Stop the task from running, if it has not run already
+        """
+        self._wheel._cancel(self)
+
+
+class TimerWheel(object):
+    """
+    Runs scheduled functions from a single thread, however many are scheduled.  Time is divided
+    into ticks of `tickInterval` seconds and tasks are kept in a ring of `wheelSize` slots by
+    the tick they are due, so scheduling and cancelling are constant time and each tick only
+    looks at the tasks in one slot.  Tasks due more than a full turn of the wheel ahead stay in
+    their slot until the turn they are due.  Tasks run up to one tick late, on the wheel's own
+    thread, or handed to `executor` if one is given, so that slow tasks don't delay others.
+
+    The thread is started when the first task is scheduled and sleeps while there is nothing
+    scheduled.
+
+    ```python
+    wheel = TimerWheel(tickInterval=0.5)
+    task = wheel.schedule(30, client.disconnect)
+    task.cancel()
+    ```
+
+    # Parameters
+    tickInterval (float): Resolution of the wheel in seconds.  Defaults to `0.5`
+    wheelSize (int): Number of slots in the wheel.  Defaults to `512`
+    name (string): Name of the wheel's thread
+    executor (BoundedExecutor): Executor to run tasks on, optional
+    """
+    def __init__(self, tickInterval=0.5, wheelSize=512, name="timer-wheel", executor=None):
+        self.tickInterval = tickInterval
+        self.wheelSize = wheelSize
+        self.name = name
+        self.executor = executor
+        self.fired = 0
+        self.cancelled = 0
+
+        self._slots = [set() for i in range(wheelSize)]
+        self._startTime = time.time()
+        self._processedTick = 0
+        self._pending = 0
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = None
+        self._stopped = False
+
+    @property
+    def pending(self):
+        """
+        The number of tasks waiting to run
+        """
+        return self._pending
+
+    def schedule(self, delay, function, *args):
+        """
+        Run `function(*args)` after `delay` seconds
+
+        # Returns
+        TimerTask: The task, which can be cancelled
+        """
+        with self._condition:
+            tick = int(math.ceil((time.time() + delay - self._startTime) / self.tickInterval))
+            tick = max(tick, self._processedTick + 1)
+            task = TimerTask(self, tick, function, args)
+            self._slots[tick % self.wheelSize].add(task)
+            self._pending += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        return task
+
+    def _cancel(self, task):
+        with self._condition:
+            if not task.cancelled:
+                task.cancelled = True
+                slot = self._slots[task.tick % self.wheelSize]
+                if task in slot:
+                    slot.discard(task)
+                    self._pending -= 1
+                    self.cancelled += 1
+
+    def stop(self):
+        """
+        Stop the wheel's thread, tasks that have not run yet are discarded
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _due(self, tick):
+        slot = self._slots[tick % self.wheelSize]
+        due = [task for task in slot if task.tick <= tick]
+        for task in due:
+            slot.discard(task)
+        self._pending -= len(due)
+        self.fired += len(due)
+        return due
+
+    def _run(self):
+        while True:
+            due = []
+            with self._condition:
+                while not self._stopped and self._pending == 0:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+                currentTick = int((time.time() - self._startTime) / self.tickInterval)
+                if self._processedTick >= currentTick:
+                    self._condition.wait(self._startTime + (currentTick + 1) * self.tickInterval - time.time())
+                    continue
+                while self._processedTick < currentTick:
+                    self._processedTick += 1
+                    due.extend(self._due(self._processedTick))
+
+            for task in due:
+                if self.executor is not None:
+                    self.executor.submit(self._runTask, task)
+                else:
+                    self._runTask(task)
+
+    def metrics(self):
+        """
+        # Returns
+        dict: The number of tasks `pending`, and the number `fired` and `cancelled` so far
+        """
+        return {"pending": self._pending, "fired": self.fired, "cancelled": self.cancelled}
+
+    def _runTask(self, task):
+        try:
+            task.function(*task.args)
+        except Exception as e:
+            logger.exception("Scheduled task %s failed: %s" % (task.function, str(e)))
+
+
+_sharedExecutor = None
+_sharedTimerWheel = None
+_sharedLock = threading.Lock()
+
+
+def sharedExecutor():
+    """
+    The process-wide #BoundedExecutor used for the background work of the clients in this package
+    """
+    global _sharedExecutor
+    with _sharedLock:
+        if _sharedExecutor is None:
+            _sharedExecutor = BoundedExecutor(maxWorkers=8, maxQueueSize=10000, name="ibmiotf-worker")
+        return _sharedExecutor
+
+
+def sharedTimerWheel():
+    """
+    The process-wide #TimerWheel used by the clients in this package, its tasks run on the
+    `sharedExecutor()`
+    """
+    global _sharedTimerWheel
+    executor = sharedExecutor()
+    with _sharedLock:
+        if _sharedTimerWheel is None:
+            _sharedTimerWheel = TimerWheel(name="ibmiotf-timer-wheel", executor=executor)
+        return _sharedTimerWheel
+
+
+def metrics():
+    """
+    Queue depths and counters of the shared executor and timer wheel, for monitoring
+
+    # Returns
+    dict: The `executor` and `timerWheel` metrics
+    """
+    return {"executor": sharedExecutor().metrics(), "timerWheel": sharedTimerWheel().metrics()}
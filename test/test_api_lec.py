@@ -17,6 +17,7 @@ from nose import SkipTest
 
 import testUtils
 import ibmiotf.device
+import ibmiotf.application
 from datetime import datetime
 from ibmiotf.api.registry.devices import DeviceUid, DeviceInfo, DeviceCreateRequest
 from ibmiotf.api.common import ApiException
@@ -81,6 +82,81 @@ class TestLEC(testUtils.AbstractTest):
         assert_true("foo" in decodedPayload2)
         assert_equals(decodedPayload2["foo"], "bar2")
         
+        # Fetch many devices at once, including one that has never sent an event
+        device2Id = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        results = dict((deviceUid.deviceId, events) for (deviceUid, events) in self.lec.getAllMany([device1Id, device2Id], eventIds=["test2"]))
+        assert_equals(2, len(results))
+        assert_equals([], results[device2Id.deviceId])
+        assert_equals(["test2"], [event.eventId for event in results[device1Id.deviceId]])
+        
+        lastEvent = results[device1Id.deviceId][0]
+        assert_true(lastEvent.timestamp is lastEvent.timestamp)
+        assert_equals("bar2", json.loads(lastEvent.decodedPayload.decode('utf-8'))["foo"])
+        
         self.registry.devices.delete(device1Id)
         assert_false(device1Id.deviceId in myDeviceType.devices)
 
+
+    def testWarmStart(self):
+        device1Id = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        registeredDevice = self.registry.devices.create(device1Id)
+        
+        deviceOptions={
+            "org": os.getenv("WIOTP_ORG_ID"),
+            "type": device1Id.typeId,
+            "id": device1Id.deviceId,
+            "auth-method": "token",
+            "auth-token": registeredDevice.authToken
+        }
+        deviceClient = ibmiotf.device.Client(deviceOptions)
+        deviceClient.connect()
+        deviceClient.publishEvent(event="warm", msgFormat="json", data={"foo": "cached"}, qos=1)
+        deviceClient.disconnect()
+        
+        # A new application starts with the cached state of the device
+        appClient = ibmiotf.application.Client({'auth-key': self.WIOTP_API_KEY, 'auth-token': self.WIOTP_API_TOKEN})
+        cachedEvents = []
+        appClient.deviceEventCallback = lambda event: cachedEvents.append(event) if event.cached else None
+        appClient.enableWarmStart(["test"], eventIds=["warm"])
+        appClient.connect()
+        try:
+            assert_true(appClient.warmStartEvent.wait(timeout=60))
+            
+            event = appClient.deviceState.get("test", device1Id.deviceId, "warm")
+            assert_true(event is not None)
+            assert_true(event.cached)
+            assert_equals("cached", event.data["foo"])
+            assert_true(device1Id.deviceId in [cachedEvent.deviceId for cachedEvent in cachedEvents])
+        finally:
+            appClient.disconnect()
+            self.registry.devices.delete(device1Id)
+
+
+class FakeEvent(object):
+    def __init__(self, timestamp, cached):
+        self.deviceType = "sensor"
+        self.deviceId = "s1"
+        self.event = "status"
+        self.timestamp = timestamp
+        self.cached = cached
+
+
+class TestDeviceState(object):
+
+    def testCachedAndLiveOrdering(self):
+        state = ibmiotf.application.DeviceState()
+        state.newConnection()
+
+        assert_true(state.update(FakeEvent(datetime(2018, 1, 1, 12, 0), True)))
+        assert_false(state.update(FakeEvent(datetime(2018, 1, 1, 11, 0), True)))
+
+        # A live event received on this connection is kept, whatever the clocks say
+        live = FakeEvent(datetime(2018, 1, 1, 10, 0), False)
+        assert_true(state.update(live))
+        assert_false(state.update(FakeEvent(datetime(2018, 1, 1, 13, 0), True)))
+        assert_true(state.get("sensor", "s1", "status") is live)
+
+        # After reconnecting, a newer cached event replaces the live event from the last connection
+        state.newConnection()
+        assert_false(state.update(FakeEvent(datetime(2018, 1, 1, 9, 0), True)))
+        assert_true(state.update(FakeEvent(datetime(2018, 1, 1, 13, 0), True)))
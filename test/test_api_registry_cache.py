@@ -0,0 +1,61 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import uuid
+from nose.tools import *
+from nose import SkipTest
+
+import testUtils
+from ibmiotf.api.registry import Registry
+from ibmiotf.api.registry.devices import DeviceUid
+
+class TestRegistryCache(testUtils.AbstractTest):
+
+    def testCachedLookups(self):
+        registry = Registry(self.setupAppClient.api.newApiClient)
+        cache = registry.enableCache(ttl=300)
+        
+        deviceUid = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        registry.devices.create(deviceUid)
+        
+        clientId = "d:%s:%s:%s" % (self.ORG_ID, deviceUid.typeId, deviceUid.deviceId)
+        assert_true(clientId in registry.devices)
+        device = registry.devices[clientId]
+        assert_equals(deviceUid.deviceId, device.deviceId)
+        assert_equals(1, cache.misses)
+        assert_equals(1, cache.hits)
+        
+        # An update through the same registry invalidates the cached device
+        registry.devices.update(deviceUid, metadata={"foo": "bar"})
+        assert_equals("bar", registry.devices[clientId].metadata["foo"])
+        assert_equals(2, cache.misses)
+        
+        # A delete through the same registry invalidates the cached device
+        registry.devices.delete(deviceUid)
+        assert_false(clientId in registry.devices)
+
+    def testNegativeCaching(self):
+        registry = Registry(self.setupAppClient.api.newApiClient)
+        cache = registry.enableCache(negativeTtl=300)
+        
+        clientId = "d:%s:test:%s" % (self.ORG_ID, str(uuid.uuid4()))
+        assert_false(clientId in registry.devices)
+        assert_false(clientId in registry.devices)
+        assert_equals(1, cache.misses)
+        assert_equals(1, cache.hits)
+        
+    def testCachedDeviceTypeLookups(self):
+        registry = Registry(self.setupAppClient.api.newApiClient)
+        cache = registry.enableCache()
+        
+        assert_true("test" in registry.devicetypes)
+        deviceType = registry.devicetypes["test"]
+        assert_equals("test", deviceType.id)
+        assert_equals(1, cache.hits)
+        assert_true(deviceType.devices._cache is cache)
@@ -0,0 +1,75 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import uuid
+from nose.tools import *
+
+import testUtils
+from ibmiotf.api.registry.devices import DeviceUid
+from ibmiotf.api.registry.connections import ConnectionLogEvent, ConnectionLogFetcher, ConnectionLogAnalyzer, parseConnectionLogEntry
+
+class TestRegistryConnections(testUtils.AbstractTest):
+    
+    def testParseConnectionLogEntry(self):
+        event = parseConnectionLogEntry("test", "dev1", {"timestamp": "2018-01-02T16:51:10.000Z", "message": "Token auth succeeded: ClientID='d:org:test:dev1', ClientIP=32.97.110.54"})
+        assert_true(event.connected)
+        assert_equals("32.97.110.54", event.clientAddr)
+        assert_equals(1514911870.0, event.timestamp)
+        
+        event = parseConnectionLogEntry("test", "dev1", {"timestamp": "2018-01-02T16:51:10.000Z", "message": "Closed connection from 32.97.110.54. The connection has completed normally."})
+        assert_false(event.connected)
+        assert_equals("32.97.110.54", event.clientAddr)
+    
+    def testFetchConnectionLogs(self):
+        deviceUid = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        self.registry.devices.create(deviceUid)
+        try:
+            fetcher = ConnectionLogFetcher(self.setupAppClient.api.newApiClient)
+            results = list(fetcher.fetch([deviceUid]))
+            assert_equals(1, len(results))
+            assert_equals(deviceUid.deviceId, results[0][0].deviceId)
+            assert_equals([], results[0][1])
+        finally:
+            self.registry.devices.delete(deviceUid)
+    
+    def testAnalyzeConnections(self):
+        analyzer = ConnectionLogAnalyzer(window=3600, flapWindow=300, flapThreshold=6)
+        
+        # A device with a single 20 minute session
+        analyzer.add(ConnectionLogEvent("test", "stable", 1000, True, None, ""))
+        analyzer.add(ConnectionLogEvent("test", "stable", 2200, False, None, ""))
+        
+        # A device that reconnects every 10 seconds
+        for i in range(10):
+            analyzer.add(ConnectionLogEvent("test", "flappy", 3000 + i * 10, i % 2 == 0, None, ""))
+        
+        summary = analyzer.summary()
+        assert_equals(6, summary["connects"])
+        assert_equals(6, summary["disconnects"])
+        assert_equals(6, summary["sessions"])
+        assert_equals(1200, summary["maxDuration"])
+        assert_equals(0, summary["openSessions"])
+        assert_equals(1, len(summary["flapping"]))
+        assert_equals("flappy", summary["flapping"][0]["deviceId"])
+        assert_equals(10, summary["flapping"][0]["transitions"])
+        
+        # Activity that has left the window is no longer counted
+        analyzer.add(ConnectionLogEvent("test", "stable", 9000, True, None, ""))
+        summary = analyzer.summary()
+        assert_equals(1, summary["connects"])
+        assert_equals(0, summary["sessions"])
+        assert_equals([], summary["flapping"])
+        assert_equals(1, summary["openSessions"])
+        
+        # A session left open before the window is forgotten once the window moves past it
+        analyzer.add(ConnectionLogEvent("test", "idle", 9100, True, None, ""))
+        analyzer.add(ConnectionLogEvent("test", "other", 12700, True, None, ""))
+        summary = analyzer.summary()
+        assert_equals(2, summary["openSessions"])
+        assert_equals(set([("test", "idle"), ("test", "other")]), set(analyzer._openSessions.keys()))
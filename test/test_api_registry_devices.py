@@ -5,7 +5,7 @@ from nose import SkipTest
 from pprint import pprint
 
 import testUtils
-from ibmiotf.api.registry.devices import DeviceUid, DeviceInfo, DeviceCreateRequest, DeviceLocation
+from ibmiotf.api.registry.devices import DeviceUid, DeviceInfo, DeviceCreateRequest, DeviceLocation, Devices, deviceRecordClass
 from ibmiotf.api.common import ApiException
 
 class TestRegistryDevices(testUtils.AbstractTest):
@@ -42,6 +42,24 @@ class TestRegistryDevices(testUtils.AbstractTest):
         assert_false(device1Id.deviceId in myDeviceType.devices)
         assert_false(device2Id.deviceId in myDeviceType.devices)
     
+    def testStreamingBulkAddAndDelete(self):
+        deviceIds = [str(uuid.uuid4()) for i in range(25)]
+        
+        # Force the devices to be split across several requests
+        requests = (DeviceCreateRequest(typeId="test", deviceId=deviceId) for deviceId in deviceIds)
+        responses = list(self.registry.devices.createMany(requests, maxRequestBytes=512))
+        assert_equals(set(deviceIds), set([response.deviceId for response in responses]))
+        for response in responses:
+            assert_true(response.success)
+            assert_true(response.authToken is not None)
+        
+        myDeviceType = self.registry.devicetypes["test"]
+        assert_true(deviceIds[0] in myDeviceType.devices)
+        
+        clientIds = ["d:%s:test:%s" % (self.ORG_ID, deviceId) for deviceId in deviceIds]
+        responses = list(self.registry.devices.deleteMany(clientIds, maxRequestBytes=512))
+        assert_equals(25, len(responses))
+        assert_false(deviceIds[0] in myDeviceType.devices)
             
     # =========================================================================
     # Device tests
@@ -135,4 +153,182 @@ class TestRegistryDevices(testUtils.AbstractTest):
             #print(device.clientId)
             count += 1
             if count > 10:
-                break
\ No newline at end of file
+                break
+
+    def testListDevicePages(self):
+        pageSizes = []
+        for page in self.registry.devices.iter(pageSize=5).pages():
+            assert_true(isinstance(page, list))
+            pageSizes.append(len(page))
+            if len(pageSizes) > 2:
+                break
+        assert_true(len(pageSizes) > 0)
+        assert_true(max(pageSizes) <= 5)
+
+    def testListRawDevices(self):
+        count = 0
+        for device in self.registry.devices.iter(prefetch=False).raw():
+            assert_true(isinstance(device, dict))
+            assert_true("clientId" in device)
+            count += 1
+            if count > 10:
+                break
+
+    def testScanDevices(self):
+        seen = set()
+        lastDeviceIdByType = {}
+        for device in self.registry.devices.scan(concurrency=4):
+            assert_false(device.clientId in seen)
+            seen.add(device.clientId)
+            # Devices of the same type are always returned in deviceId order
+            if device.typeId in lastDeviceIdByType:
+                assert_true(lastDeviceIdByType[device.typeId] < device.deviceId)
+            lastDeviceIdByType[device.typeId] = device.deviceId
+
+    def testOrderedScanMatchesBulkListing(self):
+        bulkListing = [device["clientId"] for device in iter(self.registry.devices).raw()]
+        scanListing = [device["clientId"] for device in self.registry.devices.scan(ordered=True).raw()]
+        assert_equals(bulkListing, scanListing)
+
+    def testListDeviceRecords(self):
+        records = list(self.registry.devices.records(["typeId", "deviceId", "fwVersion", "metadata.foo"]))
+        assert_true(len(records) > 0)
+        for record in records:
+            assert_true(record.typeId is not None)
+            assert_true(record.deviceId is not None)
+            assert_equals(set(["typeId", "deviceId", "fwVersion", "foo"]), set(record.json().keys()))
+        
+        # Records are read-only and only hold the selected fields
+        assert_raises(AttributeError, setattr, records[0], "typeId", "foo")
+        assert_raises(AttributeError, getattr, records[0], "clientId")
+        
+        # Repeated values are shared between records
+        sameType = [record for record in records if record.typeId == records[0].typeId]
+        assert_true(sameType[0].typeId is sameType[-1].typeId)
+
+    def testGetManyDevices(self):
+        deviceUid = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        self.registry.devices.create(deviceUid)
+        
+        try:
+            existingClientId = "d:%s:test:%s" % (self.ORG_ID, deviceUid.deviceId)
+            missingClientId = "d:%s:test:%s" % (self.ORG_ID, str(uuid.uuid4()))
+            
+            results = list(self.registry.devices.getMany([missingClientId, existingClientId, deviceUid]))
+            assert_equals([missingClientId, existingClientId, deviceUid], [key for (key, device) in results])
+            assert_equals(None, results[0][1])
+            assert_equals(deviceUid.deviceId, results[1][1].deviceId)
+            assert_equals(deviceUid.deviceId, results[2][1].deviceId)
+            
+            results = dict(self.registry.devicetypes.getMany(["test", str(uuid.uuid4())], ordered=False))
+            assert_equals(2, len(results))
+            assert_equals("test", results["test"].id)
+        finally:
+            self.registry.devices.delete(deviceUid)
+
+    def testUpdateManyDevices(self):
+        deviceUids = [DeviceUid(typeId="test", deviceId=str(uuid.uuid4())) for i in range(3)]
+        self.registry.devices.create(deviceUids)
+        
+        try:
+            updates = [(deviceUid, {"metadata": {"migrated": True}}) for deviceUid in deviceUids]
+            updates.append((DeviceUid(typeId="test", deviceId=str(uuid.uuid4())), {"metadata": {"migrated": True}}))
+            
+            results = list(self.registry.devices.updateMany(updates))
+            assert_equals(4, len(results))
+            statuses = sorted([result.status for result in results])
+            assert_equals(["notFound", "updated", "updated", "updated"], statuses)
+            for result in results:
+                if result.status == "updated":
+                    assert_equals({"migrated": True}, result.device.metadata)
+            
+            # A second run with the same patch makes no changes
+            results = list(self.registry.devices.updateMany(updates[:3]))
+            assert_equals(["unchanged"] * 3, [result.status for result in results])
+        finally:
+            self.registry.devices.delete(deviceUids)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+        self.text = ""
+        self.reason = ""
+
+    def json(self):
+        return self.body
+
+
+class FlakyBulkApiClient(object):
+    """
+    Registers the first device of the first bulk add and then fails it with a 503, as if the 
+    server applied part of the request before the connection to it was lost
+    """
+    def __init__(self):
+        self.registered = {}
+        self.posts = []
+
+    def post(self, url, data):
+        self.posts.append([device["deviceId"] for device in data])
+        if len(self.posts) == 1:
+            self.registered[data[0]["deviceId"]] = data[0]["authToken"]
+            return FakeResponse(503, {})
+        responses = []
+        for device in data:
+            self.registered[device["deviceId"]] = device["authToken"]
+            responses.append({"typeId": device["typeId"], "deviceId": device["deviceId"], "authToken": device["authToken"], "success": True})
+        return FakeResponse(201, responses)
+
+    def get(self, url):
+        return FakeResponse(200 if url.split("/")[-1] in self.registered else 404, {})
+
+
+class TestBulkAddRetry(object):
+
+    def testRetryOnlyMissingDevices(self):
+        apiClient = FlakyBulkApiClient()
+        devices = Devices(apiClient)
+        requests = [DeviceCreateRequest(typeId="test", deviceId="d%s" % i) for i in range(3)]
+
+        responses = dict((response.deviceId, response) for response in devices._addChunk([devices._withAuthToken(r) for r in requests], retries=2, backoff=0))
+        assert_equals([["d0", "d1", "d2"], ["d1", "d2"]], apiClient.posts)
+        # The device registered by the interrupted request is unconfirmed, but its token is known
+        assert_equals(None, responses["d0"].success)
+        assert_true(responses["d1"].success)
+        for deviceId in ["d0", "d1", "d2"]:
+            assert_equals(apiClient.registered[deviceId], responses[deviceId].authToken)
+
+    def testFailedRequestIsReported(self):
+        apiClient = FlakyBulkApiClient()
+        devices = Devices(apiClient)
+        requests = [DeviceCreateRequest(typeId="test", deviceId="d%s" % i, authToken="token%s" % i) for i in range(3)]
+
+        responses = list(devices.createMany(requests, retries=0))
+        assert_equals(3, len(responses))
+        for response in responses:
+            assert_false(response.success)
+            assert_true(isinstance(response.error, ApiException))
+            assert_equals("token" + response.deviceId[1:], response.authToken)
+
+
+class TestDeviceRecords(object):
+
+    def testFieldNames(self):
+        recordClass = deviceRecordClass(["typeId", "fwVersion", "metadata.some-key", "metadata.class"])
+        record = recordClass(None, {"typeId": "sensor", "deviceInfo": {"fwVersion": "1.0"}, "metadata": {"some-key": 1, "class": 2}})
+        assert_equals("sensor", record.typeId)
+        assert_equals("1.0", record.fwVersion)
+        assert_equals(1, record.some_key)
+        assert_equals(2, record.class_)
+        assert_equals({"typeId": "sensor", "fwVersion": "1.0", "some-key": 1, "class": 2}, record.json())
+        assert_raises(AttributeError, setattr, record, "typeId", "other")
+
+    def testHashable(self):
+        recordClass = deviceRecordClass(["typeId", "deviceId", "metadata.config"])
+        record = recordClass(None, {"typeId": "sensor", "deviceId": "s1", "metadata": {"config": {"rates": [1, 2]}}})
+        same = recordClass(None, {"typeId": "sensor", "deviceId": "s1", "metadata": {"config": {"rates": [1, 2]}}})
+        other = recordClass(None, {"typeId": "sensor", "deviceId": "s2"})
+        assert_equals(record, same)
+        assert_equals(hash(record), hash(same))
+        assert_equals(2, len(set([record, same, other])))
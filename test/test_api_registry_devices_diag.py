@@ -73,6 +73,35 @@ class TestRegistryDevicesDiag(testUtils.AbstractTest):
         assert_false(deviceUid.deviceId in myDeviceType.devices)
     
     
+    def testDeviceDiagLogSnapshot(self):
+        deviceUid = DeviceCreateRequest(typeId="test", deviceId=str(uuid.uuid4()))
+        self.registry.devices.create(deviceUid)
+        device = self.registry.devicetypes[deviceUid.typeId].devices[deviceUid.deviceId]
+        
+        for i in range(3):
+            device.diagLogs.append(message="log%s" % i, data=str(i), timestamp=datetime.now(), severity=0)
+        time.sleep(5)
+        
+        logs = device.diagLogs.snapshot(ttl=300)
+        assert_true(logs.isSnapshot)
+        assert_equals(3, len(logs))
+        assert_equals([logs[i].id for i in range(len(logs))], [log.id for log in logs])
+        
+        # The snapshot is not updated by changes made elsewhere until it is refreshed
+        device.diagLogs.append(message="log3", data="3", timestamp=datetime.now(), severity=0)
+        time.sleep(5)
+        assert_equals(3, len(logs))
+        logs.refresh()
+        assert_equals(4, len(logs))
+        
+        results = dict(logs.deleteMany([log.id for log in logs] + [str(uuid.uuid4())]))
+        assert_equals(5, len(results))
+        assert_equals(4, len([deleted for deleted in results.values() if deleted]))
+        time.sleep(5)
+        assert_equals(0, len(logs))
+        
+        self.registry.devices.delete({"typeId": deviceUid.typeId, "deviceId": deviceUid.deviceId})
+    
     def testDeviceBadDiagLogs(self):
         deviceUid = DeviceCreateRequest(
             typeId="test", 
@@ -0,0 +1,42 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import os
+import json
+import shutil
+import tempfile
+from nose.tools import *
+
+import testUtils
+from ibmiotf.api.registry.export import Exporter
+from ibmiotf.api.registry.ndjson import readNdjson
+
+class TestRegistryExport(testUtils.AbstractTest):
+
+    def testCompressedExport(self):
+        directory = tempfile.mkdtemp()
+        try:
+            exporter = Exporter(self.setupAppClient.api.newApiClient, directory, compress=True)
+            summary = exporter.run()
+            
+            types = [deviceType for (lineNumber, deviceType) in readNdjson(exporter.typesFile)]
+            devices = [device for (lineNumber, device) in readNdjson(exporter.devicesFile)]
+            assert_equals(summary["types"], len(types))
+            assert_equals(summary["devices"], len(devices))
+            assert_true("test" in [deviceType["id"] for deviceType in types])
+            for device in devices:
+                assert_equals(set(["typeId", "deviceId", "deviceInfo", "metadata"]), set(device.keys()))
+            
+            # Every type is complete, so running again only re-reads the checkpoint
+            with open(exporter.checkpointFile) as checkpointFile:
+                state = json.load(checkpointFile)
+            assert_true(all([progress["complete"] for progress in state["types"].values()]))
+            assert_equals(summary, exporter.run())
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,89 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import os
+import csv
+import time
+import uuid
+import tempfile
+from nose.tools import *
+
+import testUtils
+from ibmiotf.api.registry.devices import DeviceUid
+from ibmiotf.api.registry.harvest import DiagnosticsHarvester
+
+class TestRegistryHarvest(testUtils.AbstractTest):
+
+    def testHarvest(self):
+        deviceUid = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        self.registry.devices.create(deviceUid)
+        
+        try:
+            harvester = DiagnosticsHarvester(self.setupAppClient.api.newApiClient)
+            results = list(harvester.harvest([deviceUid]))
+            assert_equals(1, len(results))
+            assert_equals(deviceUid.deviceId, results[0]["deviceId"])
+            assert_equals([], results[0]["logs"])
+            assert_equals([], results[0]["errorCodes"])
+            assert_equals(None, results[0]["mgmt"])
+            assert_equals({}, results[0]["errors"])
+            
+            (handle, path) = tempfile.mkstemp(suffix=".csv")
+            os.close(handle)
+            try:
+                summary = harvester.harvestToFile(path, [deviceUid], format="csv")
+                assert_equals({"devices": 1, "errors": 0}, summary)
+                with open(path) as csvFile:
+                    rows = list(csv.reader(csvFile))
+                assert_equals(DiagnosticsHarvester.CSV_COLUMNS, rows[0])
+                assert_equals(deviceUid.deviceId, rows[1][1])
+            finally:
+                os.remove(path)
+        finally:
+            self.registry.devices.delete(deviceUid)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("No JSON object could be decoded")
+        return self.body
+
+
+class SlowDiagApiClient(object):
+    """
+    Sends the logs slowly and a body that is not JSON for the error codes
+    """
+    def get(self, url, parameters=None, headers=None, timeout=None):
+        if url.endswith("/diag/logs"):
+            time.sleep(2)
+            return FakeResponse(200, [])
+        elif url.endswith("/diag/errorCodes"):
+            return FakeResponse(200, None)
+        return FakeResponse(200, {})
+
+
+class TestHarvestFailures(object):
+
+    def testDeviceTimeoutAndInvalidResponse(self):
+        harvester = DiagnosticsHarvester(SlowDiagApiClient(), timeout=5, deviceTimeout=0.5)
+        start = time.time()
+        results = list(harvester.harvest([DeviceUid(typeId="test", deviceId="d1")]))
+        assert_true(time.time() - start < 1.5)
+
+        assert_equals(1, len(results))
+        assert_equals(None, results[0]["logs"])
+        assert_equals("Timed out", results[0]["errors"]["logs"])
+        assert_true(results[0]["errors"]["errorCodes"].startswith("Invalid response"))
+        assert_equals({}, results[0]["mgmt"])
+        assert_equals({}, results[0]["location"])
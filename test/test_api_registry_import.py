@@ -0,0 +1,145 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import os
+import json
+import uuid
+import shutil
+import tempfile
+import requests
+from nose.tools import *
+
+import testUtils
+from ibmiotf.api.registry.devices import DeviceUid
+from ibmiotf.api.registry.importer import Importer
+from ibmiotf.api.registry.ndjson import readNdjson
+
+class TestRegistryImport(testUtils.AbstractTest):
+
+    def testImport(self):
+        directory = tempfile.mkdtemp()
+        deviceUids = [DeviceUid(typeId="test", deviceId=str(uuid.uuid4())) for i in range(10)]
+        
+        with open(os.path.join(directory, "types.txt"), "w") as typesFile:
+            typesFile.write(json.dumps({"id": "test", "classId": "Device", "description": None, "deviceInfo": {}, "metadata": {}}) + "\n")
+        with open(os.path.join(directory, "devices.txt"), "w") as devicesFile:
+            for deviceUid in deviceUids:
+                devicesFile.write(json.dumps({"typeId": deviceUid.typeId, "deviceId": deviceUid.deviceId, "deviceInfo": {}, "metadata": {}}) + "\n")
+        
+        try:
+            # Force the devices to be split across several requests
+            importer = Importer(self.setupAppClient.api.newApiClient, directory, maxRequestBytes=512)
+            summary = importer.run()
+            assert_equals(1, summary["types"]["existing"])
+            assert_equals(10, summary["devices"]["registered"])
+            
+            results = [result for (lineNumber, result) in readNdjson(importer.resultsFile) if result["file"] == "devices"]
+            assert_equals(list(range(1, 11)), sorted([result["line"] for result in results]))
+            for result in results:
+                assert_true(result["authToken"] is not None)
+            
+            # Everything is recorded as processed, so running again does nothing
+            summary = importer.run()
+            assert_equals(10, summary["devices"]["skipped"])
+            assert_equals(0, summary["devices"]["registered"])
+        finally:
+            shutil.rmtree(directory)
+            self.registry.devices.delete(deviceUids)
+
+
+class TestImportResults(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+        self.importer = Importer(None, self.directory)
+
+    def teardown_method(self, method=None):
+        shutil.rmtree(self.directory)
+
+    def testTornLastResult(self):
+        with open(self.importer.resultsFile, "w") as resultsFile:
+            resultsFile.write(json.dumps({"file": "devices", "line": 3, "success": True}) + "\n")
+            resultsFile.write(json.dumps({"file": "devices", "line": 4, "success": True})[:20])
+
+        assert_equals(set([3]), self.importer._processedAfter(2))
+        # The incomplete result is removed, so the next result starts on a line of its own
+        assert_equals([3], [result["line"] for (lineNumber, result) in readNdjson(self.importer.resultsFile)])
+
+    def testMissingLineEnding(self):
+        with open(self.importer.resultsFile, "w") as resultsFile:
+            resultsFile.write(json.dumps({"file": "devices", "line": 3, "success": True}))
+
+        assert_equals(set([3]), self.importer._processedAfter(0))
+        with open(self.importer.resultsFile, "r") as resultsFile:
+            assert_true(resultsFile.read().endswith("}\n"))
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+        self.text = ""
+        self.reason = ""
+
+    def json(self):
+        return self.body
+
+
+class FlakyImportApiClient(object):
+    """
+    Can't be reached to create device types, and registers the devices of the first bulk add 
+    before failing it with a 503
+    """
+    def __init__(self):
+        self.registered = {}
+        self.bulkAdds = 0
+
+    def post(self, url, data):
+        if url == "api/v0002/device/types":
+            raise requests.exceptions.ConnectionError("unreachable")
+        self.bulkAdds += 1
+        for device in data:
+            self.registered[device["deviceId"]] = device["authToken"]
+        if self.bulkAdds == 1:
+            return FakeResponse(503, {})
+        return FakeResponse(201, [{"typeId": d["typeId"], "deviceId": d["deviceId"], "authToken": d["authToken"], "success": True} for d in data])
+
+    def get(self, url):
+        return FakeResponse(200 if url.split("/")[-1] in self.registered else 404, {})
+
+
+class TestImportFailures(object):
+
+    def setup_method(self, method=None):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, "types.txt"), "w") as typesFile:
+            typesFile.write(json.dumps({"id": "test", "classId": "Device"}) + "\n")
+        with open(os.path.join(self.directory, "devices.txt"), "w") as devicesFile:
+            for i in range(3):
+                devicesFile.write(json.dumps({"typeId": "test", "deviceId": "d%s" % i}) + "\n")
+
+    def teardown_method(self, method=None):
+        shutil.rmtree(self.directory)
+
+    def testFailuresAreRecorded(self):
+        apiClient = FlakyImportApiClient()
+        importer = Importer(apiClient, self.directory, retries=1)
+        summary = importer.run()
+
+        # The type that could not be created is recorded rather than stopping the import
+        assert_equals(1, summary["types"]["failed"])
+        # The devices applied by the failed request are not sent again, and keep the tokens that were sent
+        assert_equals(1, apiClient.bulkAdds)
+        assert_equals(3, summary["devices"]["registered"])
+        results = [result for (lineNumber, result) in readNdjson(importer.resultsFile)]
+        assert_equals("types", results[0]["file"])
+        assert_false(results[0]["success"])
+        for result in results[1:]:
+            assert_equals(None, result["success"])
+            assert_equals(apiClient.registered[result["deviceId"]], result["authToken"])
@@ -0,0 +1,107 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import time
+import uuid
+from nose.tools import *
+
+import testUtils
+from ibmiotf.api.registry import Registry
+from ibmiotf.api.registry.devices import DeviceUid, DeviceInfo
+from ibmiotf.api.registry.mirror import RegistryMirror, sortableVersion
+
+class TestRegistryMirror(testUtils.AbstractTest):
+
+    def testSortableVersion(self):
+        assert_true(sortableVersion("1.9") < sortableVersion("1.10"))
+        assert_true(sortableVersion("1.10.0") < sortableVersion("2.0"))
+        assert_equals(None, sortableVersion(None))
+
+    def testSyncAndQuery(self):
+        registry = Registry(self.setupAppClient.api.newApiClient)
+        mirror = registry.mirror(metadataKeys=["mirrorTest"])
+        
+        deviceUid = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        registry.devices.create({
+            "typeId": deviceUid.typeId, "deviceId": deviceUid.deviceId, 
+            "deviceInfo": DeviceInfo(fwVersion="0.0.1", serialNumber=deviceUid.deviceId),
+            "metadata": {"mirrorTest": deviceUid.deviceId}
+        })
+        
+        try:
+            assert_true(mirror.sync(full=True) > 0)
+            assert_true(mirror.countDevices("test") > 0)
+            
+            results = mirror.findDevices(serialNumber=deviceUid.deviceId)
+            assert_equals(1, len(results))
+            assert_equals(deviceUid.deviceId, results[0]["deviceId"])
+            
+            results = mirror.findDevices(typeId="test", fwVersionBelow="0.0.2", metadata={"mirrorTest": deviceUid.deviceId})
+            assert_equals(1, len(results))
+            
+            # An incremental sync picks up the change
+            registry.devices.update(deviceUid, deviceInfo={"fwVersion": "0.0.3"})
+            mirror.sync()
+            assert_equals(0, len(mirror.findDevices(serialNumber=deviceUid.deviceId, fwVersionBelow="0.0.2")))
+        finally:
+            registry.devices.delete(deviceUid)
+        
+        # Only a full sync removes deleted devices
+        mirror.sync(full=True)
+        assert_equals(0, len(mirror.findDevices(serialNumber=deviceUid.deviceId)))
+
+
+class TestRegistryMirrorIteration(object):
+
+    def testIterDevicesInBatches(self):
+        mirror = RegistryMirror(None)
+        devices = [{"typeId": "type%s" % (i % 3), "deviceId": "d%02d" % i} for i in range(10)]
+        mirror._writeDevices(devices, 1)
+
+        keys = [(device["typeId"], device["deviceId"]) for device in mirror.iterDevices(batchSize=3)]
+        assert_equals(sorted((device["typeId"], device["deviceId"]) for device in devices), keys)
+        mirror.close()
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class ChangedDevicesApiClient(object):
+    def __init__(self, devices):
+        self.devices = devices
+
+    def get(self, url, parameters=None):
+        return FakeResponse(200, {"results": self.devices})
+
+
+class TestRegistryMirrorSync(object):
+
+    def testIncrementalSyncIncludesTheMark(self):
+        mark = "2020-01-01T00:00:00.000Z"
+        devices = [
+            {"typeId": "sensor", "deviceId": "changed", "updatedDateTime": "2020-01-01T00:00:01.000Z"},
+            {"typeId": "sensor", "deviceId": "atMark", "updatedDateTime": mark},
+            {"typeId": "sensor", "deviceId": "unchanged", "updatedDateTime": "2019-12-31T23:59:59.000Z"}
+        ]
+        mirror = RegistryMirror(ChangedDevicesApiClient(devices), syncMargin=60)
+
+        # A device changed at the mark itself may not have been seen by the previous sync
+        assert_equals(2, mirror._incrementalDeviceSync(mark))
+        assert_equals(["atMark", "changed"], sorted(device["deviceId"] for device in mirror.iterDevices()))
+
+        # The next sync starts from before this one started, not from the latest change seen
+        newMark = mirror._getState("devices.updatedDateTime")
+        assert_true(time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - 62)) <= newMark <= time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - 58)))
+        mirror.close()
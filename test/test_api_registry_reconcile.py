@@ -0,0 +1,46 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import os
+import json
+import uuid
+import tempfile
+from nose.tools import *
+
+import testUtils
+from ibmiotf.api.registry.devices import DeviceUid
+from ibmiotf.api.registry.reconcile import Reconciler
+
+class TestRegistryReconcile(testUtils.AbstractTest):
+
+    def testPlanAndExecute(self):
+        existing = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        missing = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        self.registry.devices.create(existing)
+        
+        (handle, devicesFile) = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(handle, "w") as outFile:
+            outFile.write(json.dumps({"typeId": "test", "deviceId": existing.deviceId, "deviceInfo": {}, "metadata": {"reconciled": True}}) + "\n")
+            outFile.write(json.dumps({"typeId": "test", "deviceId": missing.deviceId, "deviceInfo": {}, "metadata": {}}) + "\n")
+        
+        try:
+            reconciler = Reconciler(self.registry)
+            plan = reconciler.plan(devicesFile)
+            assert_equals([missing.deviceId], [device.deviceId for device in plan.devicesToAdd])
+            assert_equals([existing.deviceId], [deviceUid.deviceId for (deviceUid, patch) in plan.devicesToUpdate])
+            assert_equals(0, len(plan.devicesToRemove))
+            
+            actions = sorted([action for (action, result) in reconciler.execute(plan)])
+            assert_equals(["add", "update"], actions)
+            
+            # The registry now matches the desired state
+            assert_equals(0, len(reconciler.plan(devicesFile)))
+        finally:
+            os.remove(devicesFile)
+            self.registry.devices.delete([existing, missing])
@@ -1,10 +1,12 @@
 import uuid
+import shutil
+import tempfile
 from nose.tools import *
 from nose import SkipTest
 
 from datetime import date, timedelta, datetime
 import testUtils
-from ibmiotf.api.usage import DayDataTransfer, DataTransferSummary
+from ibmiotf.api.usage import DayDataTransfer, DataTransferSummary, DataTransferColumns, Usage
 
 class TestRegistryUsage(testUtils.AbstractTest):
     
@@ -58,3 +60,29 @@ class TestRegistryUsage(testUtils.AbstractTest):
         for day in usage.days:
             assert_true(isinstance(day, DayDataTransfer))
             assert_true(isinstance(day.date, date))
+
+    # =========================================================================
+    # Columnar data transfer with cached days
+    # =========================================================================
+    def testDataTransferColumns(self):
+        usage = Usage(self.setupAppClient.api.newApiClient)
+        cacheDir = tempfile.mkdtemp()
+        try:
+            cache = usage.enableCache(cacheDir)
+            
+            # A range longer than MAX_RANGE_DAYS is split into several sub-requests
+            columns = usage.dataTransferColumns(date.today() - timedelta(days=40), date.today())
+            assert_true(isinstance(columns, DataTransferColumns))
+            assert_equals(41, len(columns))
+            assert_equals(len(columns.dates), len(columns.totals))
+            assert_equals(date.today() - timedelta(days=40), columns.start)
+            
+            # Complete days are now served from the cache
+            day = date.today() - timedelta(days=10)
+            assert_equals(columns.get(day), cache.get(day))
+            assert_equals(None, cache.get(date.today()))
+            
+            cached = usage.dataTransferColumns(date.today() - timedelta(days=40), date.today() - timedelta(days=10))
+            assert_equals(columns.totals[:31], cached.totals)
+        finally:
+            shutil.rmtree(cacheDir)
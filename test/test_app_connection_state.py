@@ -0,0 +1,77 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import json
+import uuid
+from nose.tools import *
+
+import paho.mqtt.client as paho
+import testUtils
+from ibmiotf.application import Status, ConnectionStateTracker
+from ibmiotf.api.registry.devices import DeviceUid
+
+class TestConnectionState(testUtils.AbstractTest):
+    
+    def statusMessage(self, typeId, deviceId, payload, retain=False):
+        message = paho.MQTTMessage(topic=("iot-2/type/%s/id/%s/mon" % (typeId, deviceId)).encode("utf-8"))
+        message.payload = json.dumps(payload).encode("utf-8")
+        message.retain = retain
+        return message
+    
+    def testStatusIsParsedLazily(self):
+        status = Status(self.statusMessage("test", "dev1", {"Action": "Connect", "Time": "2018-01-02T16:51:10.558Z", "ClientAddr": "195.212.29.65"}))
+        assert_equals("test:dev1", status.device)
+        assert_equals(None, status._payload)
+        assert_equals("Connect", status.action)
+        assert_equals(2018, status.time.year)
+        assert_equals(None, status.closeCode)
+    
+    def testTrackConnectionState(self):
+        tracker = ConnectionStateTracker()
+        
+        connect = {"Action": "Connect", "Time": "2018-01-02T16:51:10.558Z", "ClientAddr": "195.212.29.65"}
+        assert_true(tracker.update(Status(self.statusMessage("test", "dev1", connect))))
+        assert_true(tracker.update(Status(self.statusMessage("test", "dev2", connect))))
+        assert_equals(2, tracker.onlineCount)
+        
+        # A client ID reuse disconnect is ignored unless retained
+        reused = {"Action": "Disconnect", "Time": "2018-01-02T16:52:00.000Z", "CloseCode": 288}
+        assert_false(tracker.update(Status(self.statusMessage("test", "dev1", reused))))
+        assert_true(tracker.isConnected("test", "dev1"))
+        
+        # An older status message is ignored
+        older = {"Action": "Disconnect", "Time": "2018-01-02T16:50:00.000Z", "CloseCode": 0}
+        assert_false(tracker.update(Status(self.statusMessage("test", "dev1", older))))
+        
+        disconnect = {"Action": "Disconnect", "Time": "2018-01-02T16:53:00.000Z", "CloseCode": 91, "ClientAddr": "195.212.29.65"}
+        assert_true(tracker.update(Status(self.statusMessage("test", "dev2", disconnect))))
+        assert_equals(1, tracker.onlineCount)
+        assert_equals(1, tracker.offlineCount)
+        assert_equals(91, tracker.get("test", "dev2").closeCode)
+        assert_equals([("test", "dev1")], tracker.online())
+        assert_equals(None, tracker.get("test", "dev3"))
+    
+    def testMaxDevices(self):
+        tracker = ConnectionStateTracker(maxDevices=1)
+        connect = {"Action": "Connect", "Time": "2018-01-02T16:51:10.558Z"}
+        tracker.update(Status(self.statusMessage("test", "dev1", connect)))
+        tracker.update(Status(self.statusMessage("test", "dev2", connect)))
+        assert_equals(1, len(tracker))
+        assert_equals(1, tracker.overflow)
+    
+    def testSeedFromConnectionLogs(self):
+        tracker = ConnectionStateTracker(self.setupAppClient.api.newApiClient)
+        deviceUid = DeviceUid(typeId="test", deviceId=str(uuid.uuid4()))
+        self.registry.devices.create(deviceUid)
+        try:
+            # A device that has never connected has no connection logs to seed from
+            assert_equals(0, tracker.seed([deviceUid]))
+            assert_false(tracker.isConnected("test", deviceUid.deviceId))
+        finally:
+            self.registry.devices.delete(deviceUid)
@@ -0,0 +1,261 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import json
+import time
+import logging
+import threading
+from nose.tools import *
+
+import paho.mqtt.client as paho
+from ibmiotf.dm import DeviceMgmtRequestEngine, DeviceMgmtCoalescer
+from ibmiotf.scheduler import BoundedExecutor, TimerWheel
+from ibmiotf.gateway import ChildDeviceManager, DeviceInfo
+
+class RecordingClient(object):
+    def __init__(self):
+        self.published = []
+    
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((topic, json.loads(payload)))
+
+
+class TestDeviceMgmtRequestEngine(object):
+    
+    def response(self, reqId, rc):
+        message = paho.MQTTMessage(topic=b"iotdm-1/response")
+        message.payload = json.dumps({"reqId": reqId, "rc": rc}).encode("utf-8")
+        return message
+    
+    def testResponse(self):
+        client = RecordingClient()
+        ready = threading.Event()
+        engine = DeviceMgmtRequestEngine(client, logging.getLogger("test"))
+        engine.register("iotdevice-1/mgmt/manage", "Manage", onSuccess=lambda request: ready.set())
+        
+        request = engine.send("iotdevice-1/mgmt/manage", {"lifetime": 0})
+        assert_equals(1, engine.pendingCount)
+        (topic, message) = client.published[0]
+        assert_equals("iotdevice-1/mgmt/manage", topic)
+        assert_equals({"lifetime": 0}, message["d"])
+        
+        assert_true(engine.handleResponse(self.response(message["reqId"], 200)))
+        assert_true(request.wait(1))
+        assert_equals(200, request.result())
+        assert_true(ready.is_set())
+        assert_equals(0, engine.pendingCount)
+        
+        # A second response to the same request is unexpected
+        assert_false(engine.handleResponse(self.response(message["reqId"], 200)))
+    
+    def testExpiry(self):
+        engine = DeviceMgmtRequestEngine(RecordingClient(), logging.getLogger("test"), timeout=1)
+        request = engine.send("iotdevice-1/add/diag/log", {"message": "hello"})
+        assert_equals(None, request.result(timeout=5))
+        assert_true(request.expired)
+        assert_equals(0, engine.pendingCount)
+        assert_equals(1, engine.expiredCount)
+
+
+class TestDeviceMgmtCoalescer(object):
+
+    def setup_method(self, method=None):
+        self.client = RecordingClient()
+        engine = DeviceMgmtRequestEngine(self.client, logging.getLogger("test"))
+        self.coalescer = DeviceMgmtCoalescer(engine, "location", "errorCode", "notify", logTopic="log",
+                                             minDistance=10, minInterval=1, logBatchSize=3, logInterval=1, fieldWindow=0.5)
+
+    def topics(self):
+        return [topic for (topic, message) in self.client.published]
+
+    def testLocationDeadband(self):
+        assert_false(self.coalescer.setLocation({"latitude": 51.5, "longitude": -0.1}).coalesced)
+        # Updates within the interval are held, and only the latest is published when it elapses
+        assert_true(self.coalescer.setLocation({"latitude": 51.5001, "longitude": -0.1}).coalesced)
+        assert_true(self.coalescer.setLocation({"latitude": 51.5010, "longitude": -0.1}).coalesced)
+        assert_equals(1, len(self.client.published))
+        time.sleep(2)
+        assert_equals(2, len(self.client.published))
+        assert_equals(51.5010, self.client.published[1][1]["d"]["latitude"])
+
+        # A move of less than minDistance is not published
+        assert_true(self.coalescer.setLocation({"latitude": 51.50101, "longitude": -0.1}).coalesced)
+        assert_equals(2, len(self.client.published))
+
+    def testErrorCodes(self):
+        self.coalescer.setErrorCode(1)
+        assert_true(self.coalescer.setErrorCode(1).coalesced)
+        self.coalescer.setErrorCode(2)
+        self.coalescer.clearErrorCodes()
+        self.coalescer.setErrorCode(2)
+        assert_equals([1, 2, 2], [message["d"]["errorCode"] for (topic, message) in self.client.published])
+
+    def testLogs(self):
+        entry = {"message": "low battery", "timestamp": "", "data": "", "severity": 0}
+        self.coalescer.addLog(entry)
+        assert_true(self.coalescer.addLog(entry).coalesced)
+        assert_equals(0, len(self.client.published))
+        request = self.coalescer.addLog(dict(entry, message="disk full"))
+        assert_equals(["low battery (repeated 2 times)", "disk full"], [message["d"]["message"] for (topic, message) in self.client.published])
+        # The entry that filled the batch returns the request that published it
+        assert_false(request.coalesced)
+        assert_equals("disk full", request.message["d"]["message"])
+
+        # Errors are published straight away
+        request = self.coalescer.addLog(dict(entry, message="failed", severity=2))
+        assert_equals(3, len(self.client.published))
+        assert_false(request.coalesced)
+
+    def testFieldChanges(self):
+        self.coalescer.notifyFieldChange("deviceInfo.fwVersion", "1.0")
+        self.coalescer.notifyFieldChange("deviceInfo.fwVersion", "1.1")
+        assert_equals(0, len(self.client.published))
+        assert_equals(1, len(self.coalescer.flush()))
+        assert_equals({"field": "deviceInfo.fwVersion", "value": "1.1"}, self.client.published[0][1]["d"])
+
+        # An unchanged value is not published again
+        self.coalescer.notifyFieldChange("deviceInfo.fwVersion", "1.1")
+        time.sleep(1.5)
+        assert_equals(1, len(self.client.published))
+        assert_equals({"published": 1, "coalesced": 2, "pending": 0}, self.coalescer.metrics())
+
+
+class FakeGateway(object):
+    def __init__(self):
+        self.client = RecordingClient()
+        self.deviceMgmtRequests = DeviceMgmtRequestEngine(self.client, logging.getLogger("test"))
+        self.connectEvent = threading.Event()
+        self.connectEvent.set()
+
+
+class TestChildDeviceManager(object):
+
+    def testBatchedManage(self):
+        gateway = FakeGateway()
+        children = ChildDeviceManager(gateway, lifetime=3600, batchSize=2, interval=0.5)
+        info = DeviceInfo()
+        info.model = "T-100"
+        children.add("sensor", "s0", deviceInfo=info)
+        for i in range(1, 5):
+            children.add("sensor", "s%s" % i)
+        assert_equals(5, len(children))
+
+        # No more than batchSize requests are sent each interval
+        time.sleep(0.7)
+        assert_true(2 <= len(gateway.client.published) <= 4)
+        time.sleep(3)
+        assert_equals(5, len(gateway.client.published))
+        assert_equals(5, gateway.deviceMgmtRequests.pendingCount)
+
+        (topic, message) = gateway.client.published[0]
+        assert_equals("iotdevice-1/type/sensor/id/s0/mgmt/manage", topic)
+        assert_equals({"model": "T-100"}, message["d"]["deviceInfo"])
+
+        response = paho.MQTTMessage(topic=b"iotdm-1/type/sensor/id/s0/response")
+        response.payload = json.dumps({"reqId": message["reqId"], "rc": 200}).encode("utf-8")
+        gateway.deviceMgmtRequests.handleResponse(response)
+        assert_true(children.isManaged("sensor", "s0"))
+        assert_false(children.isManaged("sensor", "s1"))
+        assert_equals(1, children.managedCount)
+
+        # Renewals are spread rather than all due in the same second
+        renewals = set(int(child.due) for child in children)
+        assert_true(len(renewals) > 1)
+        assert_true(all(time.time() + 2700 <= due <= time.time() + 3480 for due in renewals))
+
+    def testIdsAndReAdd(self):
+        gateway = FakeGateway()
+        children = ChildDeviceManager(gateway, lifetime=0, batchSize=10, interval=0.1)
+        child = children.add("sensor", 7)
+        assert_equals("7", child.deviceId)
+        assert_true(children.get("sensor", 7) is child)
+        assert_true(("sensor", 7) in children)
+        time.sleep(0.5)
+        assert_equals(1, len(gateway.client.published))
+
+        # Without a lifetime there is no renewal, so re-adding the child sends its new information
+        info = DeviceInfo()
+        info.fwVersion = "2.0"
+        children.add("sensor", "7", deviceInfo=info)
+        time.sleep(0.5)
+        assert_equals(2, len(gateway.client.published))
+        (topic, message) = gateway.client.published[1]
+        assert_equals("iotdevice-1/type/sensor/id/7/mgmt/manage", topic)
+        assert_equals({"fwVersion": "2.0"}, message["d"]["deviceInfo"])
+
+        response = paho.MQTTMessage(topic=b"iotdm-1/type/sensor/id/7/response")
+        response.payload = json.dumps({"reqId": message["reqId"], "rc": 200}).encode("utf-8")
+        gateway.deviceMgmtRequests.handleResponse(response)
+        assert_true(children.isManaged("sensor", 7))
+
+        assert_true(children.remove("sensor", 7) is not None)
+        assert_equals(0, len(children))
+        assert_equals(0, children.managedCount)
+        assert_equals("iotdevice-1/type/sensor/id/7/mgmt/unmanage", gateway.client.published[-1][0])
+
+
+class TestTimerWheel(object):
+    
+    def testScheduleAndCancel(self):
+        wheel = TimerWheel(tickInterval=0.05, wheelSize=8)
+        fired = []
+        done = threading.Event()
+        
+        wheel.schedule(0.1, fired.append, "first")
+        # Due after more than one turn of the wheel
+        wheel.schedule(0.6, lambda: (fired.append("second"), done.set()))
+        cancelled = wheel.schedule(0.2, fired.append, "cancelled")
+        cancelled.cancel()
+        
+        assert_true(done.wait(5))
+        assert_equals(["first", "second"], fired)
+        assert_equals(0, wheel.pending)
+        wheel.stop()
+
+
+class TestBoundedExecutor(object):
+    
+    def testQueueFullRunsInCaller(self):
+        executor = BoundedExecutor(maxWorkers=1, maxQueueSize=1)
+        release = threading.Event()
+        ran = []
+        
+        # Occupy the only worker, then fill the queue
+        executor.submit(release.wait)
+        time.sleep(0.2)
+        executor.submit(ran.append, "queued")
+        executor.submit(ran.append, threading.current_thread().name)
+        
+        assert_equals([threading.current_thread().name], ran)
+        metrics = executor.metrics()
+        assert_equals(1, metrics["workers"])
+        assert_equals(1, metrics["queueDepth"])
+        assert_equals(1, metrics["callerRuns"])
+        
+        release.set()
+        time.sleep(0.2)
+        assert_equals(0, executor.queueDepth)
+        assert_equals(3, executor.completed)
+
+    def testBlockKeepsOrder(self):
+        executor = BoundedExecutor(maxWorkers=1, maxQueueSize=1, block=True)
+        release = threading.Event()
+        ran = []
+
+        executor.submit(release.wait)
+        time.sleep(0.2)
+        executor.submit(ran.append, 1)
+        # The queue is full, so this waits for the worker rather than running first in the caller
+        threading.Timer(0.2, release.set).start()
+        executor.submit(ran.append, 2)
+        time.sleep(0.2)
+
+        assert_equals([1, 2], ran)
+        assert_equals(0, executor.callerRuns)
+        assert_equals(3, executor.completed)
@@ -0,0 +1,182 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from nose.tools import *
+
+import paho.mqtt.client as paho
+from ibmiotf.device import DeviceFirmware, ManagedClient
+from ibmiotf.firmware import FirmwareDownloader, FirmwareDownloadException
+
+# Support Python 2.7 and 3.x names of the HTTP server module
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+IMAGE = os.urandom(300000)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """
+    Serves IMAGE with support for Range requests, the first response is cut off part way through
+    """
+    requests = []
+    ifRanges = []
+
+    def do_GET(self):
+        rangeHeader = self.headers.get("Range", None)
+        ImageHandler.requests.append(rangeHeader)
+        ImageHandler.ifRanges.append(self.headers.get("If-Range", None))
+        start = int(rangeHeader[len("bytes="):-1]) if rangeHeader else 0
+
+        if rangeHeader:
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %s-%s/%s" % (start, len(IMAGE) - 1, len(IMAGE)))
+        else:
+            self.send_response(200)
+        self.send_header("ETag", '"image-1.1"')
+        self.send_header("Content-Length", str(len(IMAGE) - start))
+        self.end_headers()
+
+        if len(ImageHandler.requests) == 1:
+            self.wfile.write(IMAGE[start:100000])
+            self.wfile.flush()
+            self.close_connection = True
+        else:
+            self.wfile.write(IMAGE[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RecordingClient(object):
+    def __init__(self):
+        self.states = []
+
+    def setState(self, state):
+        self.states.append(("state", state))
+
+    def setUpdateStatus(self, status):
+        self.states.append(("updateStatus", status))
+
+
+class TestFirmwareDownloader(object):
+
+    def setup_method(self, method=None):
+        ImageHandler.requests = []
+        ImageHandler.ifRanges = []
+        self.server = HTTPServer(("127.0.0.1", 0), ImageHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "http://127.0.0.1:%s/images/firmware-1.1.bin" % (self.server.server_address[1])
+        self.directory = tempfile.mkdtemp()
+
+    def teardown_method(self, method=None):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def testResumeAndVerify(self):
+        firmware = DeviceFirmware("1.1", "test", self.url, hashlib.sha256(IMAGE).hexdigest())
+        client = RecordingClient()
+        downloader = FirmwareDownloader(self.directory, chunkSize=8192, retries=2)
+
+        path = downloader.download(firmware, client)
+        assert_equals(os.path.join(self.directory, "firmware-1.1.bin"), path)
+        assert_equals(path, firmware.path)
+        with open(path, "rb") as f:
+            assert_equals(IMAGE, f.read())
+
+        # The interrupted transfer was resumed from the last whole chunk that arrived
+        assert_equals(2, len(ImageHandler.requests))
+        assert_equals(None, ImageHandler.requests[0])
+        assert_true(0 < int(ImageHandler.requests[1][len("bytes="):-1]) <= 100000)
+        assert_equals([None, '"image-1.1"'], ImageHandler.ifRanges)
+        assert_equals([("state", 1), ("state", 2)], client.states)
+
+    def testVerificationFailed(self):
+        firmware = DeviceFirmware("1.1", "test", self.url, hashlib.md5(b"something else").hexdigest())
+        client = RecordingClient()
+        downloader = FirmwareDownloader(self.directory, retries=2)
+
+        assert_raises(FirmwareDownloadException, downloader.download, firmware, client)
+        assert_equals([("state", 1), ("updateStatus", 4)], client.states)
+        assert_equals([], os.listdir(self.directory))
+
+    def testPartialFileOfAnotherImage(self):
+        firmware = DeviceFirmware("1.1", "test", self.url, hashlib.sha256(IMAGE).hexdigest())
+        downloader = FirmwareDownloader(self.directory, chunkSize=8192, retries=2)
+
+        # A partial file left by a different image with the same name is not resumed
+        other = DeviceFirmware("1.0", "test", self.url, hashlib.sha256(b"old image").hexdigest())
+        assert_not_equals(downloader.partPath(other), downloader.partPath(firmware))
+        with open(downloader.partPath(other), "wb") as f:
+            f.write(b"old image")
+
+        path = downloader.download(firmware)
+        with open(path, "rb") as f:
+            assert_equals(IMAGE, f.read())
+        assert_equals(None, ImageHandler.requests[0])
+        assert_equals(["firmware-1.1.bin"], os.listdir(self.directory))
+
+    def testCancelBeforeStartAndMissingDirectory(self):
+        firmware = DeviceFirmware("1.1", "test", self.url, hashlib.sha256(IMAGE).hexdigest())
+        directory = os.path.join(self.directory, "images")
+        downloader = FirmwareDownloader(directory, retries=2)
+
+        # A cancel made before the download starts is kept until the next reset
+        downloader.cancel()
+        assert_raises(FirmwareDownloadException, downloader.download, firmware)
+        assert_equals([], ImageHandler.requests)
+
+        downloader.reset()
+        assert_equals(os.path.join(directory, "firmware-1.1.bin"), downloader.download(firmware))
+
+
+class TestManagedFirmwareDownload(object):
+
+    def setup_method(self, method=None):
+        options = {"org": "myorg", "type": "t", "id": "d1", "auth-method": "token", "auth-token": "x"}
+        self.client = ManagedClient(options)
+        self.published = []
+        self.client.client.publish = lambda topic, payload=None, qos=0, retain=False: self.published.append((topic, json.loads(payload)))
+        self.directory = tempfile.mkdtemp()
+
+    def teardown_method(self, method=None):
+        shutil.rmtree(self.directory)
+
+    def requestDownload(self, reqId):
+        message = paho.MQTTMessage(topic=ManagedClient.DM_FIRMWARE_DOWNLOAD_TOPIC.encode("utf-8"))
+        message.payload = json.dumps({"reqId": reqId}).encode("utf-8")
+        self.client.client._handle_on_message(message)
+
+    def testUnexpectedErrorReturnsToIdle(self):
+        firmware = DeviceFirmware("1.1", "test", "http://127.0.0.1:1/firmware-1.1.bin", "abc", state=ManagedClient.UPDATESTATE_IDLE)
+        self.client._ManagedClient__firmwareUpdate = firmware
+        self.client.enableFirmwareDownload(self.directory, algorithm="no-such-algorithm")
+
+        self.requestDownload("r1")
+        deadline = time.time() + 5
+        while firmware.state != ManagedClient.UPDATESTATE_IDLE and time.time() < deadline:
+            time.sleep(0.05)
+        assert_equals(ManagedClient.UPDATESTATE_IDLE, firmware.state)
+        assert_equals(ManagedClient.UPDATESTATE_CONNECTION_LOST, firmware.updateStatus)
+
+        # The failed download does not block the next one
+        self.requestDownload("r2")
+        responses = [message for (topic, message) in self.published if topic == "iotdevice-1/response"]
+        assert_equals([("r1", 202), ("r2", 202)], [(response["reqId"], response["rc"]) for response in responses])
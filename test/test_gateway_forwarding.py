@@ -0,0 +1,90 @@
+# *****************************************************************************
+# Copyright (c) 2018 IBM Corporation and other Contributors.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+# *****************************************************************************
+
+import json
+import threading
+from nose.tools import *
+
+import paho.mqtt.client as paho
+import ibmiotf.gateway
+from ibmiotf.scheduler import BoundedExecutor
+
+
+class TestDeviceChannel(object):
+
+    def setup_method(self, method=None):
+        options = {"org": "myorg", "type": "gw", "id": "g1", "auth-method": "token", "auth-token": "x"}
+        self.gateway = ibmiotf.gateway.Client(options)
+        self.published = []
+        self.gateway.client.publish = self.publish
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((topic, payload, qos))
+        return (0, len(self.published))
+
+    def testSend(self):
+        channel = self.gateway.deviceChannel("sensor", "s1", "reading", qos=1)
+        assert_true(channel is self.gateway.deviceChannel("sensor", "s1", "reading", qos=1))
+
+        # Nothing is published while the gateway is not connected
+        assert_false(channel.send({"t": 21.5}))
+        assert_equals([], self.published)
+
+        self.gateway.connectEvent.set()
+        calls = []
+        assert_true(channel.send({"t": 21.5}, on_publish=lambda: calls.append(1)))
+        (topic, payload, qos) = self.published[0]
+        assert_equals("iot-2/type/sensor/id/s1/evt/reading/fmt/json", topic)
+        assert_equals({"t": 21.5}, json.loads(payload))
+        assert_equals(1, qos)
+
+        self.gateway._onPublish(None, None, 1)
+        assert_equals([1], calls)
+        assert_equals({}, self.gateway._onPublishCallbacks)
+
+    def testMissingEncoder(self):
+        assert_raises(ibmiotf.MissingMessageEncoderException, self.gateway.deviceChannel, "sensor", "s1", "reading", "xml")
+
+
+class TestCommandRouting(object):
+
+    def setup_method(self, method=None):
+        options = {"org": "myorg", "type": "gw", "id": "g1", "auth-method": "token", "auth-token": "x"}
+        self.gateway = ibmiotf.gateway.Client(options)
+        self.received = []
+        self.gateway.deviceCommandCallback = lambda command: self.received.append(("callback", command.id, command.command))
+
+    def command(self, deviceType, deviceId, command):
+        message = paho.MQTTMessage(topic=("iot-2/type/%s/id/%s/cmd/%s/fmt/json" % (deviceType, deviceId, command)).encode("utf-8"))
+        message.payload = b'{"on": true}'
+        self.gateway.client._handle_on_message(message)
+
+    def testRouting(self):
+        self.gateway.routeDeviceCommands("sensor", "s1", lambda command: self.received.append(("s1", command.command, command.data)))
+        self.gateway.routeDeviceCommands("sensor", "s1", lambda command: self.received.append(("s1-reboot", command.command, None)), command="reboot")
+
+        self.command("sensor", "s1", "light")
+        self.command("sensor", "s1", "reboot")
+        self.command("sensor", "s2", "light")
+        assert_equals([("s1", "light", {"on": True}), ("s1-reboot", "reboot", None), ("callback", "s2", "light")], self.received)
+
+        self.received = []
+        self.gateway.unrouteDeviceCommands("sensor", "s1", command="reboot")
+        self.command("sensor", "s1", "reboot")
+        self.gateway.unrouteDeviceCommands("sensor", "s1")
+        self.command("sensor", "s1", "reboot")
+        assert_equals([("s1", "reboot", {"on": True}), ("callback", "s1", "reboot")], self.received)
+
+    def testExecutor(self):
+        executor = BoundedExecutor(maxWorkers=1, block=True)
+        done = threading.Event()
+        self.gateway.routeDeviceCommands("sensor", "s1", lambda command: done.set(), executor=executor)
+        self.command("sensor", "s1", "light")
+        assert_true(done.wait(5))
+        assert_equals(1, executor.submitted)